@@ -2,76 +2,236 @@ import uuid
 import os
 import tempfile
 from fastapi import APIRouter, UploadFile, HTTPException
-from typing import List
-from services.document_processor import DocumentProcessor
+from typing import Any, Dict, List, Optional, Tuple
+from services.registry import get_document_processor
+from services.ingestion_jobs import IngestionQueue, JobStore, QueueFullError
 from pydantic import BaseModel
 import aiofiles
+import hashlib
+import json
 import csv
+import itertools
 import re
 import sqlite3
 
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+MAX_UPLOAD_FILE_BYTES = int(os.getenv("MAX_UPLOAD_FILE_BYTES", str(100 * 1024 * 1024)))
+MAX_UPLOAD_REQUEST_BYTES = int(os.getenv("MAX_UPLOAD_REQUEST_BYTES", str(1024 * 1024 * 1024)))
+# multipart boundaries and part headers on top of the file bytes themselves
+MULTIPART_OVERHEAD_BYTES = 1024 * 1024
+# CSV loads: rows used for column type inference, rows per INSERT batch, and how long a
+# load waits for another load holding the database write lock
+CSV_TYPE_SAMPLE_ROWS = int(os.getenv("CSV_TYPE_SAMPLE_ROWS", "100"))
+CSV_INSERT_BATCH_ROWS = int(os.getenv("CSV_INSERT_BATCH_ROWS", "5000"))
+CSV_LOAD_LOCK_TIMEOUT_SECONDS = float(os.getenv("CSV_LOAD_LOCK_TIMEOUT_SECONDS", "600"))
+# uploaded CSVs only ever create or replace tables in this namespace, never existing data
+CSV_TABLE_PREFIX = "upload_"
+
 router = APIRouter()
-processor = DocumentProcessor()
+job_store = JobStore()
+
 
 class UploadResponse(BaseModel):
     job_id: str
     files_processed: int
+    status: str = "queued"
 
-@router.post("/documents", response_model=UploadResponse)
-async def upload_documents(files: List[UploadFile]):
+
+def _run_ingestion_job(job_id: str, files: List[Dict[str, Any]]):
     """
-    Accept multiple files, save them temporarily, and process synchronously (MVP).
-    Returns a job ID that can be polled for status.
+    Worker-side half of an upload: embed the files, load CSVs into SQLite and
+    refresh the query engine's schema. Runs on the ingestion pool, never on the event loop.
     """
-    if not files:
-        raise HTTPException(status_code=400, detail="No files uploaded")
+    # Files already finished before a restart are not re-processed
+    pending = [f for f in files if f["state"] in ("queued", "running")]
+    for f in pending:
+        job_store.set_file_state(job_id, f["position"], "running")
 
-    job_id = str(uuid.uuid4())
-    paths: List[str] = []
+    def on_file(i: int, state: str, vectors: int, error: Optional[str]):
+        job_store.set_file_state(job_id, pending[i]["position"], state, vectors=vectors, error=error)
 
-    # Save uploaded files to a temp directory
-    for f in files:
-        temp_dir = tempfile.gettempdir()
-        out_path = os.path.join(temp_dir, f"{job_id}_{f.filename}")
-
-        async with aiofiles.open(out_path, "wb") as wf:
-            content = await f.read()
-            await wf.write(content)
-
-        paths.append(out_path)
-
-    # Process documents synchronously for now
-    processor.process_documents(paths, job_id=job_id)
+    paths = [f["path"] for f in pending]
+    get_document_processor().process_documents(
+        paths,
+        job_id=job_id,
+        on_file=on_file,
+        sources=[f["filename"] for f in pending],
+        content_hashes=[f["content_hash"] for f in pending],
+    )
 
     # Additionally, load any CSVs into the SQLite demo database for SQL querying
-    for p in paths:
-        if p.lower().endswith(".csv"):
+    loaded_tables = []
+    for f in pending:
+        if f["path"].lower().endswith(".csv"):
             try:
-                _load_csv_into_sqlite(p)
+                # tables are named after the uploaded file (prefixed) so a re-upload replaces its table
+                table = _load_csv_into_sqlite(f["path"], os.path.splitext(f["filename"])[0])
+                if table:
+                    loaded_tables.append(table)
             except Exception as e:
                 # Keep vector processing status independent of DB ingest
-                pass
+                print(f"[Ingestion] CSV load of {f['filename']} failed: {e}")
 
     # Refresh query engine schema snapshot if available (best-effort)
     try:
         # Lazy import to avoid circular router imports
-        from api.query import qe, DEFAULT_DB  # type: ignore
-        qe.schema = qe.schema_discovery.analyze_database(DEFAULT_DB)
+        from api.query import qe  # type: ignore
+        # rewritten tables must not keep serving cached rows
+        qe.invalidate_tables(loaded_tables)
+        # re-analyzes only the tables this job rewrote or whose DDL changed
+        qe.refresh_schema(loaded_tables)
     except Exception:
         pass
 
-    return UploadResponse(job_id=job_id, files_processed=len(paths))
+
+ingest_queue = IngestionQueue(_run_ingestion_job, job_store)
+
+
+@router.post("/documents", response_model=UploadResponse)
+async def upload_documents(files: List[UploadFile]):
+    """
+    Accept multiple files, save them temporarily and enqueue them for background processing.
+    Returns immediately with a job ID that can be polled for status.
+    """
+    if not files:
+        raise HTTPException(status_code=400, detail="No files uploaded")
+
+    job_id = str(uuid.uuid4())
+    saved: List[Dict[str, Any]] = []
+    remaining = MAX_UPLOAD_REQUEST_BYTES
+
+    # Stream uploaded files to a temp directory
+    try:
+        for f in files:
+            filename = os.path.basename(f.filename or "upload")
+            temp_dir = tempfile.gettempdir()
+            out_path = os.path.join(temp_dir, f"{job_id}_{filename}")
+            size, content_hash = await _stream_upload_to_disk(f, out_path, remaining)
+            remaining -= size
+            saved.append({"filename": filename, "path": out_path, "size": size, "content_hash": content_hash})
+    except Exception:
+        for s in saved:
+            _remove_quietly(s["path"])
+        raise
+
+    job_store.create_job(job_id, saved)
+    try:
+        ingest_queue.submit(job_id)
+    except QueueFullError as e:
+        job_store.set_job_state(job_id, "failed", error=str(e))
+        raise HTTPException(status_code=503, detail=str(e))
+
+    return UploadResponse(job_id=job_id, files_processed=len(saved))
 
 @router.get("/status/{job_id}")
 async def status(job_id: str):
     """
-    Get the processing status of a given job_id.
+    Get the processing status of a given job_id, including per-file progress.
     """
-    stat = processor.get_status(job_id)
-    return {"job_id": job_id, "status": stat}
+    job = job_store.get_job(job_id)
+    if job is None:
+        stat = {"total": 0, "processed": 0, "vectors": 0, "errors": 0, "done": False}
+        return {"job_id": job_id, "status": stat}
+    return {"job_id": job_id, "status": job}
 
 
 # -------------------- Helpers --------------------
+class UploadSizeLimitMiddleware:
+    """
+    Rejects an oversized upload request with 413 before its body is spooled to disk.
+    Starlette parses the whole multipart body before the route handler runs, so the
+    request limit has to be enforced here: up front from Content-Length, and while
+    reading for chunked bodies without one.
+    """
+
+    def __init__(self, app, path: str, max_bytes: int = MAX_UPLOAD_REQUEST_BYTES + MULTIPART_OVERHEAD_BYTES):
+        self.app = app
+        self.path = path
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] != self.path:
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers") or [])
+        length = headers.get(b"content-length")
+        if length is not None and length.isdigit() and int(length) > self.max_bytes:
+            await self._reject(send)
+            return
+
+        received = 0
+        rejected = False
+        started = False
+
+        async def limited_receive():
+            nonlocal received, rejected
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # the app sees a disconnect and stops parsing; the 413 is sent below
+                    rejected = True
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message):
+            nonlocal started
+            if rejected and not started:
+                return
+            started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not rejected:
+                raise
+        if rejected and not started:
+            await self._reject(send)
+
+    async def _reject(self, send):
+        body = json.dumps({"detail": f"Upload exceeds {MAX_UPLOAD_REQUEST_BYTES} bytes per request"}).encode("utf-8")
+        await send({"type": "http.response.start", "status": 413,
+                    "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]})
+        await send({"type": "http.response.body", "body": body})
+
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+async def _stream_upload_to_disk(f: UploadFile, out_path: str, request_budget: int) -> Tuple[int, str]:
+    """
+    Copy an upload to disk in fixed-size chunks, hashing as it goes, so memory per
+    upload stays constant. Enforces the per-file and remaining per-request limits.
+    Returns ``(size_in_bytes, sha256_hex)``.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(out_path, "wb") as wf:
+            while True:
+                chunk = await f.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > MAX_UPLOAD_FILE_BYTES:
+                    raise HTTPException(status_code=413, detail=f"{f.filename} exceeds {MAX_UPLOAD_FILE_BYTES} bytes")
+                if size > request_budget:
+                    raise HTTPException(status_code=413, detail=f"Upload exceeds {MAX_UPLOAD_REQUEST_BYTES} bytes per request")
+                digest.update(chunk)
+                await wf.write(chunk)
+    except Exception:
+        _remove_quietly(out_path)
+        raise
+    finally:
+        await f.close()
+    return size, digest.hexdigest()
+
+
 def _sanitize_identifier(name: str) -> str:
     base = re.sub(r"[^a-zA-Z0-9_]", "_", name.strip().lower()).strip("_")
     return base or "col"
@@ -104,46 +264,77 @@ def _infer_types(sample_rows: List[List[str]]) -> List[str]:
     return types
 
 
-def _load_csv_into_sqlite(csv_path: str):
+def _load_csv_into_sqlite(csv_path: str, table_name: Optional[str] = None) -> Optional[str]:
+    """
+    Stream a CSV into SQLite. Column types come from the first rows; the data goes into a
+    staging table in batches, and the staging table replaces the live one by rename in
+    the same transaction, so readers see either the old table or the complete new one.
+    A row with more fields than the header rejects the load (ValueError naming its line).
+    The table is named ``upload_<name>``, so an upload can't replace a table it didn't create.
+    """
     db_path = os.path.abspath("./project/backend/demo_db.sqlite")
     # If relative path above does not exist, fallback to local working dir file
     if not os.path.exists(db_path):
         db_path = os.path.abspath("./demo_db.sqlite")
 
-    table_name = _sanitize_identifier(os.path.splitext(os.path.basename(csv_path))[0])
+    table_name = CSV_TABLE_PREFIX + _sanitize_identifier(table_name or os.path.splitext(os.path.basename(csv_path))[0])
+    staging = f"{table_name}__staging"
     with open(csv_path, "r", encoding="utf-8", errors="ignore", newline="") as f:
         reader = csv.reader(f)
-        rows = list(reader)
-    if not rows:
-        return
-    headers = [_sanitize_identifier(h or f"col_{i}") for i, h in enumerate(rows[0])]
-    # ensure unique column names
-    seen = {}
-    unique_headers = []
-    for h in headers:
-        if h not in seen:
-            seen[h] = 0
-            unique_headers.append(h)
-        else:
-            seen[h] += 1
-            unique_headers.append(f"{h}_{seen[h]}")
-    data_rows = rows[1:]
-    sample = data_rows[:100]
-    types = _infer_types(sample or [[""] * len(unique_headers)])
+        header = next(reader, None)
+        if header is None:
+            return None
+        headers = [_sanitize_identifier(h or f"col_{i}") for i, h in enumerate(header)]
+        # ensure unique column names
+        seen = {}
+        unique_headers = []
+        for h in headers:
+            if h not in seen:
+                seen[h] = 0
+                unique_headers.append(h)
+            else:
+                seen[h] += 1
+                unique_headers.append(f"{h}_{seen[h]}")
+        width = len(unique_headers)
 
-    cols_def = ", ".join([f"{col} {typ}" for col, typ in zip(unique_headers, types)])
-    placeholders = ", ".join(["?" for _ in unique_headers])
+        def fit(row: List[str]) -> List[Optional[str]]:
+            # short rows are padded with NULLs; extra fields would be data silently lost
+            if len(row) > width:
+                raise ValueError(f"CSV line {reader.line_num} has {len(row)} fields, the header has {width}")
+            return row + [None] * (width - len(row))
 
-    conn = sqlite3.connect(db_path)
-    try:
-        cur = conn.cursor()
-        cur.execute(f"DROP TABLE IF EXISTS {table_name}")
-        cur.execute(f"CREATE TABLE {table_name} ({cols_def})")
-        if data_rows:
-            cur.executemany(
-                f"INSERT INTO {table_name} ({', '.join(unique_headers)}) VALUES ({placeholders})",
-                [row + [None] * (len(unique_headers) - len(row)) for row in data_rows]
-            )
-        conn.commit()
-    finally:
-        conn.close()
+        sample = [fit(row) for row in itertools.islice(reader, CSV_TYPE_SAMPLE_ROWS)]
+        types = _infer_types([[v or "" for v in row] for row in sample] or [[""] * width])
+
+        cols_def = ", ".join([f"{col} {typ}" for col, typ in zip(unique_headers, types)])
+        placeholders = ", ".join(["?" for _ in unique_headers])
+        insert = f"INSERT INTO {staging} ({', '.join(unique_headers)}) VALUES ({placeholders})"
+
+        # transactions are managed explicitly below
+        conn = sqlite3.connect(db_path, timeout=CSV_LOAD_LOCK_TIMEOUT_SECONDS, isolation_level=None)
+        try:
+            # WAL lets queries keep reading the old table while the load runs
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            # views over the table are left alone by the rename instead of failing it
+            conn.execute("PRAGMA legacy_alter_table=ON")
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(f"DROP TABLE IF EXISTS {staging}")
+                conn.execute(f"CREATE TABLE {staging} ({cols_def})")
+                if sample:
+                    conn.executemany(insert, sample)
+                while True:
+                    batch = [fit(row) for row in itertools.islice(reader, CSV_INSERT_BATCH_ROWS)]
+                    if not batch:
+                        break
+                    conn.executemany(insert, batch)
+                conn.execute(f"DROP TABLE IF EXISTS {table_name}")
+                conn.execute(f"ALTER TABLE {staging} RENAME TO {table_name}")
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
+    return table_name
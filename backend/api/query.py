@@ -1,5 +1,8 @@
+import json
 from fastapi import APIRouter
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from typing import Optional
 from services.query_engine import QueryEngine
 
 router = APIRouter()
@@ -9,12 +12,33 @@ qe = QueryEngine(DEFAULT_DB)
 
 class QueryRequest(BaseModel):
     query: str
+    # optional ANN recall/latency knobs for the document branch
+    nprobe: Optional[int] = None
+    ef_search: Optional[int] = None
+    # keyset pagination: pass next_page_token from the previous page to continue
+    page_size: Optional[int] = None
+    page_token: Optional[str] = None
 
 @router.post("/query")
 async def process_query(req: QueryRequest):
-    result = qe.process_query(req.query)
+    # runs on the query worker pool so slow SQL doesn't stall the event loop
+    result = await qe.aprocess_query(
+        req.query, nprobe=req.nprobe, ef_search=req.ef_search, page_size=req.page_size, page_token=req.page_token
+    )
     return result
 
+@router.post("/query/stream")
+async def stream_query(req: QueryRequest):
+    """NDJSON: one JSON record per line (meta, rows batches, docs, end); rows are not capped at 200."""
+    records = qe.astream_query(req.query, nprobe=req.nprobe, ef_search=req.ef_search)
+    # each batch is read on the query worker pool, keeping the event loop free
+    lines = (json.dumps(record, default=str) + "\n" async for record in records)
+    return StreamingResponse(lines, media_type="application/x-ndjson")
+
 @router.get("/query/history")
 async def history():
     return qe.get_history()
+
+@router.get("/query/metrics")
+async def metrics():
+    return {"documents": qe.doc_processor.stats(), "cache": qe.cache_stats(), "execution": qe.execution_stats()}
@@ -1,5 +1,6 @@
 from fastapi import APIRouter
 from services.schema_discovery import SchemaDiscovery
+from services.schema_snapshot import discover
 from pydantic import BaseModel
 
 router = APIRouter()
@@ -32,7 +33,12 @@ async def connect_database(payload: ConnectRequest):
     """
     try:
         print(f"🔍 Connecting to database: {payload.connection_string}")
-        schema = sd.analyze_database(payload.connection_string)
+        # saved snapshot, revalidated against the live fingerprint
+        schema = discover(sd, payload.connection_string)
+        if schema.get("error"):
+            # unreachable database: a saved snapshot comes back marked stale
+            print(f"❌ Schema discovery failed: {schema['error']}")
+            return {"ok": False, "stale": bool(schema.get("stale")), "error": schema["error"], "schema": schema}
         print(f"✅ Schema discovery successful: {len(schema.get('tables', {}))} tables found")
         return {"ok": True, "schema": schema}
     except Exception as e:
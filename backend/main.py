@@ -1,6 +1,8 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from api import ingestion, query, schema
+from services.registry import warm_up_in_background
+from services.text_extraction import shutdown_extraction_pool
 import sqlite3
 import os
 from contextlib import asynccontextmanager
@@ -78,14 +80,26 @@ async def lifespan(app: FastAPI):
     # Startup
     print("Starting up...")
     init_database()
+    # Model and index load in the background so /health answers immediately
+    warm_up_in_background()
+    resumed = ingestion.ingest_queue.resume_pending()
+    if resumed:
+        print(f"Resumed {resumed} unfinished ingestion job(s)")
     yield
     # Shutdown
     print("Shutting down...")
+    ingestion.ingest_queue.shutdown()
+    query.qe.shutdown()
+    shutdown_extraction_pool()
     if db_connection:
         db_connection.close()
 
 app = FastAPI(title="NLP Query Engine", lifespan=lifespan)
 
+# reject oversized uploads before Starlette spools the multipart body to disk; added
+# before CORS so CORS wraps it and the browser can read the 413
+app.add_middleware(ingestion.UploadSizeLimitMiddleware, path="/api/ingest/documents")
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -0,0 +1,238 @@
+import heapq
+import os
+import sqlite3
+import tempfile
+import threading
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from services.lexical_index import bm25_scores, term_frequencies, tokenize
+
+CHUNK_DB_PATH = os.getenv("CHUNK_DB_PATH", os.path.join(tempfile.gettempdir(), "vec_chunks.sqlite"))
+# BM25 reads at most this many postings per query term (highest tf first), so a term that
+# appears in most chunks can't turn a lookup into a scan of the whole index
+LEXICAL_MAX_POSTINGS_PER_TERM = int(os.getenv("LEXICAL_MAX_POSTINGS_PER_TERM", "5000"))
+# ids per IN (...) list, below SQLite's default limit of 999 bound parameters
+_IN_BATCH = 900
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    vector_id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL,
+    chunk_id TEXT NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_chunks_source ON chunks (source);
+CREATE TABLE IF NOT EXISTS documents (
+    source TEXT PRIMARY KEY,
+    content_hash TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_documents_hash ON documents (content_hash);
+CREATE TABLE IF NOT EXISTS index_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    vector_id INTEGER NOT NULL,
+    tf INTEGER NOT NULL,
+    doc_len INTEGER NOT NULL,
+    PRIMARY KEY (term, vector_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_postings_vector ON postings (vector_id);
+CREATE INDEX IF NOT EXISTS idx_postings_term_tf ON postings (term, tf);
+CREATE TABLE IF NOT EXISTS term_stats (
+    term TEXT PRIMARY KEY,
+    df INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+# Bump when tokenization (or the posting layout) changes so existing chunks are
+# re-indexed on startup
+LEXICAL_VERSION = 2
+
+
+class ChunkStore:
+    """
+    Chunk text and document metadata in SQLite, keyed by FAISS vector id. Only the
+    rows for top-k hits are read at query time instead of holding every chunk in memory.
+    """
+
+    def __init__(self, path: str = CHUNK_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+        conn.commit()
+        if self.get_state("lexical_version") < LEXICAL_VERSION:
+            self._rebuild_postings()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, vector_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+        ids = [int(i) for i in vector_ids if i >= 0]
+        conn = self._conn()
+        found: Dict[int, Dict[str, Any]] = {}
+        for start in range(0, len(ids), _IN_BATCH):
+            batch = ids[start:start + _IN_BATCH]
+            placeholders = ", ".join("?" for _ in batch)
+            rows = conn.execute(
+                f"SELECT vector_id, source, chunk_id, text FROM chunks WHERE vector_id IN ({placeholders})", batch
+            ).fetchall()
+            found.update({r[0]: {"source": r[1], "chunk_id": r[2], "text": r[3]} for r in rows})
+        return found
+
+    def replace_document(self, source: str, content_hash: Optional[str],
+                         rows: List[Tuple[int, str, str]]) -> List[int]:
+        """
+        Atomically swap the chunks stored for ``source`` with ``rows`` of
+        ``(vector_id, chunk_id, text)``. Returns the vector ids that were replaced.
+        """
+        return self.replace_documents([(source, content_hash, rows)])
+
+    def replace_documents(self, docs: List[Tuple[str, Optional[str], List[Tuple[int, str, str]]]]) -> List[int]:
+        """``replace_document`` for several ``(source, content_hash, rows)`` in one transaction."""
+        conn = self._conn()
+        replaced: List[int] = []
+        with conn:
+            for source, content_hash, rows in docs:
+                old = [r[0] for r in conn.execute("SELECT vector_id FROM chunks WHERE source = ?", (source,))]
+                self._remove_postings(conn, old)
+                conn.execute("DELETE FROM chunks WHERE source = ?", (source,))
+                conn.executemany(
+                    "INSERT INTO chunks (vector_id, source, chunk_id, text) VALUES (?, ?, ?, ?)",
+                    [(vid, source, chunk_id, text) for vid, chunk_id, text in rows],
+                )
+                self._add_postings(conn, [(vid, text) for vid, _, text in rows])
+                conn.execute(
+                    "INSERT OR REPLACE INTO documents (source, content_hash) VALUES (?, ?)", (source, content_hash)
+                )
+                replaced.extend(old)
+        return replaced
+
+    # ---------- lexical (BM25) index ----------
+    def _add_postings(self, conn: sqlite3.Connection, rows: List[Tuple[int, str]]):
+        postings = []
+        total_len = 0
+        for vid, text in rows:
+            tfs, length = term_frequencies(text)
+            total_len += length
+            postings.extend((term, vid, tf, length) for term, tf in tfs.items())
+        conn.executemany("INSERT OR REPLACE INTO postings (term, vector_id, tf, doc_len) VALUES (?, ?, ?, ?)", postings)
+        self._bump_doc_freqs(conn, Counter(term for term, _, _, _ in postings))
+        self._bump_lexical_stats(conn, len(rows), total_len)
+
+    def _remove_postings(self, conn: sqlite3.Connection, vector_ids: List[int]):
+        docs = total_len = 0
+        removed: Counter = Counter()
+        for start in range(0, len(vector_ids), _IN_BATCH):
+            batch = vector_ids[start:start + _IN_BATCH]
+            placeholders = ", ".join("?" for _ in batch)
+            lengths = conn.execute(
+                f"SELECT vector_id, MAX(doc_len) FROM postings WHERE vector_id IN ({placeholders}) GROUP BY vector_id",
+                batch,
+            ).fetchall()
+            docs += len(lengths)
+            total_len += sum(length for _, length in lengths)
+            removed.update(dict(conn.execute(
+                f"SELECT term, COUNT(*) FROM postings WHERE vector_id IN ({placeholders}) GROUP BY term", batch
+            ).fetchall()))
+            conn.execute(f"DELETE FROM postings WHERE vector_id IN ({placeholders})", batch)
+        if docs:
+            self._bump_doc_freqs(conn, {term: -n for term, n in removed.items()})
+            self._bump_lexical_stats(conn, -docs, -total_len)
+
+    def _bump_doc_freqs(self, conn: sqlite3.Connection, deltas: Dict[str, int]):
+        conn.executemany(
+            "INSERT INTO term_stats (term, df) VALUES (?, ?) ON CONFLICT(term) DO UPDATE SET df = df + excluded.df",
+            deltas.items(),
+        )
+        conn.executemany("DELETE FROM term_stats WHERE term = ? AND df <= 0",
+                         [(term,) for term, delta in deltas.items() if delta < 0])
+
+    def _bump_lexical_stats(self, conn: sqlite3.Connection, docs: int, total_len: int):
+        for key, delta in (("lexical_docs", docs), ("lexical_total_len", total_len)):
+            conn.execute(
+                "INSERT INTO index_state (key, value) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + excluded.value",
+                (key, delta),
+            )
+
+    def _rebuild_postings(self):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM postings")
+            conn.execute("DELETE FROM term_stats")
+            conn.execute("DELETE FROM index_state WHERE key IN ('lexical_docs', 'lexical_total_len')")
+            cur = conn.execute("SELECT vector_id, text FROM chunks")
+            while True:
+                batch = cur.fetchmany(1000)
+                if not batch:
+                    break
+                self._add_postings(conn, batch)
+            conn.execute(
+                "INSERT OR REPLACE INTO index_state (key, value) VALUES ('lexical_version', ?)", (LEXICAL_VERSION,)
+            )
+
+    def lexical_search(self, query: str, k: int) -> List[Tuple[int, float]]:
+        """BM25 top-k over the posting lists of the query terms: ``[(vector_id, score), ...]``."""
+        terms = sorted(set(tokenize(query)))
+        if not terms:
+            return []
+        conn = self._conn()
+        n_docs = self.get_state("lexical_docs")
+        if n_docs <= 0:
+            return []
+        avg_len = self.get_state("lexical_total_len") / n_docs
+        placeholders = ", ".join("?" for _ in terms)
+        doc_freqs = dict(conn.execute(f"SELECT term, df FROM term_stats WHERE term IN ({placeholders})", terms))
+        rows = []
+        for term in doc_freqs:
+            rows.extend(conn.execute(
+                "SELECT term, vector_id, tf, doc_len FROM postings WHERE term = ? ORDER BY tf DESC LIMIT ?",
+                (term, LEXICAL_MAX_POSTINGS_PER_TERM),
+            ))
+        scores = bm25_scores(rows, n_docs, avg_len, doc_freqs=doc_freqs)
+        return heapq.nlargest(k, scores.items(), key=lambda kv: kv[1])
+
+    def has_content_hash(self, content_hash: str) -> bool:
+        row = self._conn().execute(
+            "SELECT 1 FROM documents WHERE content_hash = ? LIMIT 1", (content_hash,)
+        ).fetchone()
+        return row is not None
+
+    def content_hashes(self) -> Set[str]:
+        return {r[0] for r in self._conn().execute("SELECT content_hash FROM documents WHERE content_hash IS NOT NULL")}
+
+    def count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def all_vector_ids(self) -> List[int]:
+        return [r[0] for r in self._conn().execute("SELECT vector_id FROM chunks ORDER BY vector_id")]
+
+    def clear(self):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM chunks")
+            conn.execute("DELETE FROM documents")
+            conn.execute("DELETE FROM postings")
+            conn.execute("DELETE FROM term_stats")
+            conn.execute("DELETE FROM index_state WHERE key != 'lexical_version'")
+
+    def get_state(self, key: str, default: int = 0) -> int:
+        row = self._conn().execute("SELECT value FROM index_state WHERE key = ?", (key,)).fetchone()
+        return int(row[0]) if row else default
+
+    def set_state(self, **values: int):
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO index_state (key, value) VALUES (?, ?)",
+                [(k, str(v)) for k, v in values.items()],
+            )
@@ -0,0 +1,230 @@
+import hashlib
+import math
+import os
+import random
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from numbers import Number
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import StaticPool
+
+from services.db_pool import DB_POOL_SIZE
+from services.schema_catalog import SCHEMA_SAMPLE_WORKERS
+
+# optional statistics pass during schema discovery (row counts, null fractions, distinct
+# estimates, min/max, histograms), kept in the schema snapshot
+SCHEMA_PROFILE = os.getenv("SCHEMA_PROFILE", "0").lower() in ("1", "true", "yes")
+PROFILE_SAMPLE_ROWS = int(os.getenv("PROFILE_SAMPLE_ROWS", "10000"))
+# wall-clock budget per table; a table that runs out is profiled from the rows read so far
+PROFILE_TIME_BUDGET_SECONDS = float(os.getenv("PROFILE_TIME_BUDGET_SECONDS", "2"))
+PROFILE_HISTOGRAM_BUCKETS = int(os.getenv("PROFILE_HISTOGRAM_BUCKETS", "10"))
+# most common values kept per column
+_MCV_SIZE = 5
+# rows read per random rowid range when sampling large SQLite tables
+_SQLITE_RANGE_ROWS = 100
+_FETCH_ROWS = 500
+
+
+class HyperLogLog:
+    """Distinct-count sketch; 2**p registers, ~1.04/sqrt(2**p) relative error (1.6% at p=12)."""
+
+    def __init__(self, p: int = 12):
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(self.m)
+
+    def add(self, value: Any):
+        h = int.from_bytes(hashlib.blake2b(repr(value).encode("utf-8"), digest_size=8).digest(), "big")
+        idx = h >> (64 - self.p)
+        rest = (h << self.p) & 0xFFFFFFFFFFFFFFFF
+        rank = 64 - self.p + 1 if rest == 0 else 65 - rest.bit_length()
+        if rank > self.registers[idx]:
+            self.registers[idx] = rank
+
+    def count(self) -> int:
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m * self.m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.m and zeros:
+            # small range: linear counting is more accurate
+            estimate = self.m * math.log(self.m / zeros)
+        return int(round(estimate))
+
+
+def _sample_sqlite(conn, quoted: str, select: str, row_count: int, deadline: float):
+    if row_count <= PROFILE_SAMPLE_ROWS:
+        return _read(conn.execute(text(f"SELECT {select} FROM {quoted}")), PROFILE_SAMPLE_ROWS, deadline)
+    try:
+        lo, hi = conn.execute(text(f"SELECT MIN(rowid), MAX(rowid) FROM {quoted}")).one()
+    except Exception:
+        lo = hi = None  # WITHOUT ROWID table
+    if lo is None:
+        return _read(conn.execute(text(f"SELECT {select} FROM {quoted} LIMIT {PROFILE_SAMPLE_ROWS}")),
+                     PROFILE_SAMPLE_ROWS, deadline)
+    # short runs starting at random rowids: spread over the whole table, each an index seek
+    rows: List[tuple] = []
+    stmt = text(f"SELECT rowid, {select} FROM {quoted} WHERE rowid >= :start ORDER BY rowid LIMIT {_SQLITE_RANGE_ROWS}")
+    truncated = False
+    next_start = lo
+    starts = sorted(random.randint(lo, hi) for _ in range(max(1, PROFILE_SAMPLE_ROWS // _SQLITE_RANGE_ROWS)))
+    for start in starts:
+        if time.monotonic() > deadline:
+            truncated = True
+            break
+        # overlapping runs would count rows twice
+        batch = conn.execute(stmt, {"start": max(start, next_start)}).fetchall()
+        if batch:
+            next_start = batch[-1][0] + 1
+            rows.extend(tuple(r)[1:] for r in batch)
+    return rows, truncated
+
+
+def _sample_postgres(conn, quoted: str, select: str, row_count: int, deadline: float):
+    if row_count <= PROFILE_SAMPLE_ROWS:
+        result = conn.execute(text(f"SELECT {select} FROM {quoted}"))
+    else:
+        # SYSTEM sampling reads whole random pages; ask for a little more than needed
+        percent = min(100.0, 150.0 * PROFILE_SAMPLE_ROWS / row_count)
+        result = conn.execute(text(f"SELECT {select} FROM {quoted} TABLESAMPLE SYSTEM ({percent:.6f}) "
+                                   f"LIMIT {PROFILE_SAMPLE_ROWS}"))
+    return _read(result, PROFILE_SAMPLE_ROWS, deadline)
+
+
+def _read(result, limit: int, deadline: float):
+    rows: List[tuple] = []
+    while len(rows) < limit:
+        batch = result.fetchmany(_FETCH_ROWS)
+        if not batch:
+            return rows, False
+        rows.extend(tuple(r) for r in batch)
+        if time.monotonic() > deadline:
+            result.close()
+            return rows[:limit], True
+    result.close()
+    return rows[:limit], False
+
+
+def _row_count(conn, table: str, quoted: str) -> int:
+    """
+    Row count without scanning the table: the planner estimate on Postgres, the rowid span
+    on SQLite (exact unless rows were deleted). Only tables known to be small are counted
+    exactly. Where there is no cheap estimate (WITHOUT ROWID tables never ANALYZEd, Postgres
+    tables never analyzed) counting stops past PROFILE_SAMPLE_ROWS, a lower bound.
+    """
+    if conn.dialect.name == "postgresql":
+        # planner estimate; exact COUNT(*) would scan the table
+        estimate = conn.execute(text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:t)"),
+                                {"t": quoted}).scalar()
+        if estimate is not None and estimate >= 0:
+            return int(estimate)
+    elif conn.dialect.name == "sqlite":
+        estimate = _sqlite_row_estimate(conn, table, quoted)
+        if estimate is not None and estimate > PROFILE_SAMPLE_ROWS:
+            return estimate
+    return int(conn.execute(text(f"SELECT COUNT(*) FROM (SELECT 1 FROM {quoted} LIMIT {PROFILE_SAMPLE_ROWS + 1})"
+                                 )).scalar())
+
+
+def _sqlite_row_estimate(conn, table: str, quoted: str) -> Optional[int]:
+    try:
+        lo, hi = conn.execute(text(f"SELECT MIN(rowid), MAX(rowid) FROM {quoted}")).one()
+        return 0 if lo is None else hi - lo + 1
+    except Exception:
+        pass  # WITHOUT ROWID table
+    try:
+        # ANALYZE leaves "<rows> <rows per key> ..." per index
+        stats = conn.execute(text("SELECT stat FROM sqlite_stat1 WHERE tbl = :t"), {"t": table}).scalars().all()
+    except Exception:
+        return None  # never analyzed
+    counts = [int(stat.split()[0]) for stat in stats if stat and stat.split()[0].isdigit()]
+    return max(counts) if counts else None
+
+
+def _column_stats(values: List[Any], row_count: int) -> Dict[str, Any]:
+    n = len(values)
+    present = [v for v in values if v is not None]
+    stats: Dict[str, Any] = {"null_frac": round(1 - len(present) / n, 4) if n else 0.0}
+    if not present:
+        stats["distinct"] = 0
+        return stats
+
+    hll = HyperLogLog()
+    for v in present:
+        hll.add(v)
+    sample_distinct = min(hll.count(), len(present))
+    distinct = sample_distinct
+    if n < row_count and sample_distinct >= 0.9 * len(present):
+        # (nearly) every sampled value is unique: assume the column is unique-ish overall
+        distinct = int(row_count * (1 - stats["null_frac"]))
+
+    numeric = [v for v in present if isinstance(v, Number) and not isinstance(v, bool)]
+    comparable = numeric if len(numeric) == len(present) else [str(v) for v in present]
+    comparable.sort()
+    stats["min"], stats["max"] = comparable[0], comparable[-1]
+    stats["distinct"] = distinct
+    if numeric and len(numeric) == len(present):
+        # equi-depth: bucket i holds values in [bounds[i], bounds[i + 1]]
+        buckets = min(PROFILE_HISTOGRAM_BUCKETS, len(comparable))
+        stats["histogram"] = [comparable[min(len(comparable) - 1, (len(comparable) * i) // buckets)]
+                              for i in range(buckets)] + [comparable[-1]]
+    # only values clearly more common than average are worth keeping
+    common = 1.25 * len(present) / sample_distinct
+    mcv = [(value, count) for value, count in Counter(present).most_common(_MCV_SIZE) if count > 1 and count > common]
+    if mcv:
+        stats["mcv"] = [[value, round(count / n, 4)] for value, count in mcv]
+    return stats
+
+
+def profile_table(engine: Engine, table: str, columns: List[str],
+                  budget: float = PROFILE_TIME_BUDGET_SECONDS) -> Dict[str, Any]:
+    """
+    Row count plus per-column null fraction, distinct estimate, min/max, histogram and
+    most common values, from a sample of at most PROFILE_SAMPLE_ROWS rows read within
+    ``budget`` seconds. SQLite samples random rowid ranges, Postgres uses TABLESAMPLE.
+    """
+    started = time.monotonic()
+    deadline = started + budget
+    quote = engine.dialect.identifier_preparer.quote
+    quoted = quote(table)
+    select = ", ".join(quote(c) for c in columns)
+    with engine.connect() as conn:
+        row_count = _row_count(conn, table, quoted)
+        if conn.dialect.name == "sqlite":
+            rows, truncated = _sample_sqlite(conn, quoted, select, row_count, deadline)
+        elif conn.dialect.name == "postgresql":
+            rows, truncated = _sample_postgres(conn, quoted, select, row_count, deadline)
+        else:
+            rows, truncated = _read(conn.execute(text(f"SELECT {select} FROM {quoted}")), PROFILE_SAMPLE_ROWS, deadline)
+    return {
+        "row_count": row_count,
+        "sampled_rows": len(rows),
+        "truncated": truncated,
+        "columns": {c: _column_stats([r[i] for r in rows], row_count) for i, c in enumerate(columns)},
+        "ms": round(1000.0 * (time.monotonic() - started), 1),
+    }
+
+
+def profile_tables(engine: Engine, reflected: Dict[str, Dict[str, Any]],
+                   workers: Optional[int] = None) -> Dict[str, Optional[Dict[str, Any]]]:
+    """``profile_table`` for every reflected table on a bounded pool; failures give None."""
+
+    def run(table: str) -> Optional[Dict[str, Any]]:
+        try:
+            return profile_table(engine, table, [c["name"] for c in reflected[table]["columns"]])
+        except Exception as e:
+            print(f"Error profiling {table}: {e}")
+            return None
+
+    names = list(reflected)
+    if not names:
+        return {}
+    workers = max(1, min(workers or SCHEMA_SAMPLE_WORKERS, DB_POOL_SIZE, len(names)))
+    if isinstance(engine.pool, StaticPool):
+        workers = 1
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="schema-profile") as pool:
+        return dict(zip(names, pool.map(run, names)))
+
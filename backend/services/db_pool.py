@@ -0,0 +1,51 @@
+import os
+from typing import Any, Dict
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import QueuePool, StaticPool
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+# seconds a request waits for a free connection before failing
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+
+def create_pooled_engine(connection_string: str, **kwargs) -> Engine:
+    """
+    Engine with an explicitly sized connection pool. SQLite files get a QueuePool too
+    (SQLAlchemy 1.4 defaults them to one connection per checkout); in-memory SQLite
+    keeps a single shared connection since every new one would be a fresh database.
+    """
+    url = make_url(connection_string)
+    if url.get_backend_name() == "sqlite":
+        connect_args = {"check_same_thread": False}
+        if url.database in (None, "", ":memory:"):
+            return create_engine(connection_string, future=True, poolclass=StaticPool,
+                                 connect_args=connect_args, **kwargs)
+        return create_engine(
+            connection_string, future=True, poolclass=QueuePool, connect_args=connect_args,
+            pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT, **kwargs
+        )
+    return create_engine(
+        connection_string, future=True, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT, pool_recycle=DB_POOL_RECYCLE, pool_pre_ping=True, **kwargs
+    )
+
+
+def pool_stats(engine: Engine) -> Dict[str, Any]:
+    pool = engine.pool
+    if not isinstance(pool, QueuePool):
+        return {"pool": type(pool).__name__}
+    checked_out = pool.checkedout()
+    capacity = pool.size() + max(DB_MAX_OVERFLOW, 0)
+    return {
+        "pool": type(pool).__name__,
+        "size": pool.size(),
+        "max_overflow": DB_MAX_OVERFLOW,
+        "checked_out": checked_out,
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+        "saturation": round(checked_out / capacity, 3) if capacity else 0.0,
+    }
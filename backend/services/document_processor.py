@@ -1,89 +1,115 @@
 import os
-from sentence_transformers import SentenceTransformer
-import faiss
 import numpy as np
-import pdfplumber
-from docx import Document
-from typing import List
+from typing import Callable, Dict, List, Optional, Tuple
 import json
+import hashlib
 import tempfile
-import csv
 import requests
+import threading
+from services.embedding_batcher import EmbeddingMicroBatcher
+from services.chunk_store import ChunkStore
+from services.embedding_cache import EmbeddingCache
+from services.lexical_index import reciprocal_rank_fusion
+from services.vector_store import SegmentedVectorStore
+from services.text_extraction import (
+    extract_text_from_csv,
+    extract_text_from_docx,
+    extract_text_from_pdf,
+    extract_texts_parallel,
+    read_file_text,
+)
 
 _TMP_DIR = tempfile.gettempdir()
 INDEX_DIR = os.path.join(_TMP_DIR, "vec_index")
+# Legacy JSON metadata, migrated into the chunk store on first load
 METADATA_PATH = os.path.join(_TMP_DIR, "vec_metadata.json")
+# Embedded documents are buffered and written to the index together, once per batch or
+# whenever this many vectors are pending
+INDEX_FLUSH_VECTORS = int(os.getenv("INDEX_FLUSH_VECTORS", "5000"))
 
 
-def extract_text_from_pdf(path: str) -> str:
-    text = []
-    with pdfplumber.open(path) as pdf:
-        for p in pdf.pages:
-            t = p.extract_text()
-            if t:
-                text.append(t)
-    return "\n".join(text)
-
-
-def extract_text_from_docx(path: str) -> str:
-    doc = Document(path)
-    paras = [p.text for p in doc.paragraphs if p.text.strip()]
-    return "\n".join(paras)
-
-
-def extract_text_from_csv(path: str) -> str:
-    lines = []
-    try:
-        with open(path, "r", encoding="utf-8", errors="ignore", newline="") as f:
-            reader = csv.reader(f)
-            for row in reader:
-                if not row:
-                    continue
-                lines.append(", ".join([c.strip() for c in row if str(c).strip()]))
-        return "\n".join(lines)
-    except Exception:
-        # fallback to raw read
-        with open(path, "r", encoding="utf-8", errors="ignore") as f:
-            return f.read()
-
-
-def read_file_text(path: str) -> str:
-    ext = path.lower().split(".")[-1]
-    if ext == "pdf":
-        return extract_text_from_pdf(path)
-    elif ext in ("docx", "doc"):
-        return extract_text_from_docx(path)
-    elif ext in ("csv",):
-        return extract_text_from_csv(path)
-    else:
-        with open(path, "r", encoding="utf-8", errors="ignore") as f:
-            return f.read()
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
 
 
 class DocumentProcessor:
-    def __init__(self, model_name="sentence-transformers/all-MiniLM-L6-v2"):
+    def __init__(self, model_name="sentence-transformers/all-MiniLM-L6-v2", extract_workers: Optional[int] = None):
+        self.extract_workers = extract_workers
         # Embedding backend selection: Gorq HTTP API if key provided, else local model
         self.groq_api_key = os.getenv("GORQ_API_KEY") or os.getenv("GROQ_API_KEY")
         self.groq_embed_url = os.getenv("GORQ_EMBED_URL", os.getenv("GROQ_EMBED_URL", "https://api.groq.com/openai/v1/embeddings"))
         self.groq_model = os.getenv("GORQ_EMBED_MODEL", os.getenv("GROQ_EMBED_MODEL", "text-embedding-3-small"))
 
-        self.model = None
-        if not self.groq_api_key:
-            # ✅ local fallback (no auth)
-            self.model = SentenceTransformer(model_name, use_auth_token=False)
-            print(f"[Embedding] Using local SentenceTransformer: {model_name}")
-        else:
+        self.embedding_model_key = f"groq:{self.groq_model}" if self.groq_api_key else model_name
+        self.embedding_cache = EmbeddingCache() if os.getenv("EMBED_CACHE", "1") != "0" else None
+        # Concurrent search() calls share one encode call per batching window; query
+        # embeddings are cached under their own budget, so repeats skip the model
+        self.query_batcher = EmbeddingMicroBatcher(lambda texts: self._embed_texts(texts, kind="query"))
+
+        # The local model is loaded on first use (or by warm_up) so startup is not gated on it
+        self.model_name = model_name
+        self._model = None
+        self._model_lock = threading.Lock()
+        if self.groq_api_key:
             print(f"[Embedding] Using Gorq API at {self.groq_embed_url} with model {self.groq_model}")
 
-        self.index = None
-        self.metadata = []
+        # Chunk text and per-document hashes live on disk, keyed by vector id
+        self.chunk_store = ChunkStore()
+        # Base index + append-only delta segments; see SegmentedVectorStore
+        self.vectors = SegmentedVectorStore(INDEX_DIR, self.chunk_store.all_vector_ids)
+        self.next_id = self.chunk_store.get_state("next_id")
+        # Serializes id allocation and document replacement across ingestion workers
+        self._lock = threading.RLock()
 
-        if os.path.exists(INDEX_DIR + "/index.faiss"):
-            self._load_index()
+        if os.path.exists(METADATA_PATH):
+            self._migrate_json_metadata()
 
         self.status = {}
 
-    def _embed_texts(self, texts: List[str]) -> np.ndarray:
+    @property
+    def model(self):
+        if self._model is None and not self.groq_api_key:
+            with self._model_lock:
+                if self._model is None:
+                    # Imported lazily: pulling in torch dominates process start-up
+                    from sentence_transformers import SentenceTransformer
+                    # ✅ local fallback (no auth)
+                    self._model = SentenceTransformer(self.model_name, use_auth_token=False)
+                    print(f"[Embedding] Using local SentenceTransformer: {self.model_name}")
+        return self._model
+
+    @property
+    def model_loaded(self) -> bool:
+        return bool(self.groq_api_key) or self._model is not None
+
+    def warm_up(self):
+        """Load the embedding model ahead of the first request."""
+        return self.model
+
+    def _embed_texts(self, texts: List[str], kind: str = "doc") -> np.ndarray:
+        """
+        Embed texts, serving repeats from the on-disk cache and computing only the misses.
+        ``kind`` ("doc" or "query") picks the cache budget the misses are stored under.
+        """
+        if self.embedding_cache is None or not texts:
+            return self._compute_embeddings(texts)
+        cached = self.embedding_cache.get_many(self.embedding_model_key, texts)
+        missing = list(dict.fromkeys(t for t, v in zip(texts, cached) if v is None))
+        if missing:
+            computed = self._compute_embeddings(missing)
+            by_text = dict(zip(missing, computed))
+            # zero vectors mean the backend returned nothing usable; don't persist them
+            keep = [t for t in missing if np.any(by_text[t])]
+            self.embedding_cache.put_many(self.embedding_model_key, keep, np.array([by_text[t] for t in keep]),
+                                          kind=kind)
+            cached = [v if v is not None else by_text[t] for t, v in zip(texts, cached)]
+        return np.vstack(cached).astype("float32")
+
+    def _compute_embeddings(self, texts: List[str]) -> np.ndarray:
         if self.groq_api_key:
             # Gorq/Groq-compatible embeddings API (OpenAI-style)
             headers = {
@@ -122,108 +148,214 @@ class DocumentProcessor:
             chunks.append(current)
         return chunks
 
-    def _init_index(self, dim: int):
-        self.index = faiss.IndexFlatIP(dim)
-        if not os.path.exists(INDEX_DIR):
-            os.makedirs(INDEX_DIR, exist_ok=True)
-
-    def _save_index(self):
-        if self.index is None:
-            return
-        faiss.write_index(self.index, INDEX_DIR + "/index.faiss")
-        with open(METADATA_PATH, "w", encoding="utf-8") as f:
-            json.dump(self.metadata, f)
-
-    def _load_index(self):
-        if not os.path.exists(INDEX_DIR + "/index.faiss"):
-            return
-        self.index = faiss.read_index(INDEX_DIR + "/index.faiss")
-        if os.path.exists(METADATA_PATH):
-            with open(METADATA_PATH, "r", encoding="utf-8") as f:
-                self.metadata = json.load(f)
-
-    def process_documents(self, file_paths: List[str], job_id: str = None):
+    def _migrate_json_metadata(self):
+        """
+        Move metadata from the old vec_metadata.json into the chunk store. The index file
+        it belonged to is adopted as the vector store's base (positional ids for the
+        original list layout, explicit ids for the id-keyed layout).
+        """
+        with open(METADATA_PATH, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        self.chunk_store.clear()
+        if isinstance(data, list):
+            chunks = dict(enumerate(data[:self.vectors.ntotal]))
+            hashes = {}
+            self.next_id = len(chunks)
+        else:
+            chunks = {int(k): v for k, v in data.get("chunks", {}).items()}
+            hashes = {src: d.get("content_hash") for src, d in data.get("documents", {}).items()}
+            self.next_id = int(data.get("next_id", len(chunks)))
+        by_source: Dict[str, List[Tuple[int, str, str]]] = {}
+        for vid, meta in sorted(chunks.items()):
+            by_source.setdefault(meta["source"], []).append((vid, meta["chunk_id"], meta["text"]))
+        for source, rows in by_source.items():
+            self.chunk_store.replace_document(source, hashes.get(source), rows)
+        self.chunk_store.set_state(next_id=self.next_id)
+        os.replace(METADATA_PATH, METADATA_PATH + ".migrated")
+
+    def process_documents(self, file_paths: List[str], job_id: str = None,
+                          on_file: Optional[Callable[[int, str, int, Optional[str]], None]] = None,
+                          sources: Optional[List[str]] = None,
+                          content_hashes: Optional[List[Optional[str]]] = None):
+        """
+        Extract, chunk and embed files into the index. ``on_file(position, state, vectors, error)``
+        is called as each file finishes so callers can persist per-file progress.
+
+        Documents are keyed by content hash: files whose content is already indexed are
+        skipped before extraction, and a changed file replaces the chunks previously
+        indexed under the same ``source`` name.
+        """
         if job_id is None:
             job_id = "job_local"
         self.status[job_id] = {"total": len(file_paths), "processed": 0, "vectors": 0, "errors": 0, "done": False}
+        sources = sources or [os.path.basename(p) for p in file_paths]
+        content_hashes = content_hashes or [None] * len(file_paths)
 
-        global_vectors = []
-        for path in file_paths:
+        def finish(position: int, state: str, vectors: int = 0, error: Optional[str] = None):
+            self.status[job_id]["processed"] += 1
+            if state == "failed":
+                self.status[job_id]["errors"] += 1
+            self.status[job_id]["vectors"] += vectors
+            if on_file is not None:
+                on_file(position, state, vectors, error)
+
+        # Dedupe against the index and within the batch before doing any extraction
+        indexed_hashes = self.chunk_store.content_hashes()
+        todo: List[int] = []
+        hashes: List[Optional[str]] = []
+        for position, path in enumerate(file_paths):
             try:
-                text = read_file_text(path)
+                h = content_hashes[position] or file_sha256(path)
+            except Exception as e:
+                hashes.append(None)
+                finish(position, "failed", error=str(e))
+                continue
+            hashes.append(h)
+            if h in indexed_hashes:
+                finish(position, "skipped")
+                continue
+            indexed_hashes.add(h)
+            todo.append(position)
+
+        # CPU-bound extraction runs up front on the process pool, embedding stays here
+        extracted = extract_texts_parallel([file_paths[i] for i in todo], max_workers=self.extract_workers)
+
+        pending: List[Tuple[int, str, Optional[str], List[str], np.ndarray]] = []
+
+        def flush():
+            if not pending:
+                return
+            try:
+                self._replace_documents([(source, h, chunks, embs) for _, source, h, chunks, embs in pending])
+            except Exception as e:
+                for position, *_ in pending:
+                    finish(position, "failed", error=str(e))
+            else:
+                for position, _, _, _, embs in pending:
+                    finish(position, "done", vectors=int(len(embs)))
+            pending.clear()
+
+        for (text, extract_error), position in zip(extracted, todo):
+            path = file_paths[position]
+            source = sources[position]
+            try:
+                if extract_error is not None:
+                    raise RuntimeError(extract_error)
                 if not text.strip():
-                    self.status[job_id]["errors"] += 1
-                    self.status[job_id]["processed"] += 1
+                    finish(position, "failed", error="no extractable text")
                     continue
                 doc_type = path.split(".")[-1]
                 chunks = self.dynamic_chunking(text, doc_type)
 
                 if not chunks:
-                    self.status[job_id]["processed"] += 1
+                    finish(position, "skipped")
                     continue
 
-                embs = self._embed_texts(chunks)
-
-                for i, emb in enumerate(embs):
-                    self.metadata.append({
-                        "source": os.path.basename(path),
-                        "chunk_id": f"{os.path.basename(path)}_chunk_{i}",
-                        "text": chunks[i]
-                    })
-                    global_vectors.append(emb)
-                self.status[job_id]["vectors"] += int(len(embs))
-            except Exception:
-                self.status[job_id]["errors"] += 1
-            finally:
-                self.status[job_id]["processed"] += 1
-
-        if global_vectors:
-            arr = np.vstack(global_vectors).astype("float32")
-            dim = arr.shape[1]
-            if self.index is None:
-                self._init_index(dim)
-            # guard against dimension mismatch by recreating index
-            if self.index.d != dim:
-                self._init_index(dim)
-                self.metadata = []
-            self.index.add(arr)
-            self._save_index()
+                embs = self._embed_texts(chunks).astype("float32")
+            except Exception as e:
+                finish(position, "failed", error=str(e))
+                continue
+            pending.append((position, source, hashes[position], chunks, embs))
+            if sum(len(p[4]) for p in pending) >= INDEX_FLUSH_VECTORS:
+                flush()
+        flush()
 
         self.status[job_id]["done"] = True
 
+    def _replace_documents(self, docs: List[Tuple[str, Optional[str], List[str], np.ndarray]]):
+        """
+        Swap the chunks of several ``(source, content_hash, chunks, embeddings)`` documents
+        and persist them together: all new vectors go into one delta segment, the chunk rows
+        into one transaction. Replaced vectors become deleted entries that the next segment
+        merge drops.
+        """
+        dim = docs[0][3].shape[1]
+        # the vector store's write lock also spans other processes sharing the index
+        with self._lock, self.vectors.write_lock():
+            # another process may have allocated ids since we last looked
+            self.next_id = max(self.next_id, self.chunk_store.get_state("next_id"))
+            # guard against dimension mismatch by recreating index
+            if self.vectors.dim is not None and self.vectors.dim != dim:
+                self.chunk_store.clear()
+                self.vectors.reset(dim)
+            total = sum(len(chunks) for _, _, chunks, _ in docs)
+            ids = np.arange(self.next_id, self.next_id + total, dtype="int64")
+            self.next_id += total
+            self.chunk_store.set_state(next_id=self.next_id)
+            self.vectors.add(ids, np.vstack([embs for _, _, _, embs in docs]))
+            rows, start = [], 0
+            for source, content_hash, chunks, _ in docs:
+                doc_ids = ids[start:start + len(chunks)].tolist()
+                start += len(chunks)
+                rows.append((source, content_hash,
+                             [(vid, f"{source}_chunk_{i}", chunks[i]) for i, vid in enumerate(doc_ids)]))
+            old = self.chunk_store.replace_documents(rows)
+            self.vectors.mark_deleted(len(old))
+        if self.vectors.should_merge():
+            self.vectors.merge_in_background()
+
+    def stats(self):
+        return {
+            "embedding_cache": self.embedding_cache.stats() if self.embedding_cache else None,
+            "query_batching": self.query_batcher.stats(),
+            "model_loaded": self.model_loaded,
+            "index": dict(self.vectors.stats(), chunks=self.chunk_store.count()),
+        }
+
     def get_status(self, job_id: str):
         return self.status.get(job_id, {"total": 0, "processed": 0, "vectors": 0, "errors": 0, "done": False})
 
-    def _keyword_overlap_score(self, query: str, text: str) -> float:
-        q_words = {w.lower().strip(",.()\"'`") for w in query.split() if w.strip()}
-        t_words = {w.lower().strip(",.()\"'`") for w in text.split() if w.strip()}
-        if not q_words or not t_words:
-            return 0.0
-        overlap = q_words.intersection(t_words)
-        return len(overlap) / (len(q_words) ** 0.5)
-
-    def search(self, query: str, top_k: int = 5):
-        if self.index is None:
-            # attempt to load existing index if available
-            self._load_index()
-            if self.index is None:
-                return []
-
-        q_emb = self._embed_texts([query])
-
-        D, I = self.index.search(q_emb.astype("float32"), max(1, top_k * 2))
+    def embed_query(self, query: str) -> np.ndarray:
+        """One query embedding, coalesced with concurrent callers by the micro-batcher."""
+        return self.query_batcher.embed(query)
+
+    @property
+    def index_version(self) -> int:
+        """Changes whenever any process writes the index (ingest, merge, reset)."""
+        self.vectors.refresh()
+        return self.vectors.manifest.get("version", 0)
+
+    def search(self, query: str, top_k: int = 5, nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+               query_embedding: Optional[np.ndarray] = None):
+        """
+        Hybrid retrieval: dense vector hits and BM25 hits from the inverted index are
+        ranked by reciprocal rank fusion. Each hit's ``score`` is its cosine similarity to
+        the query, ``rrf_score`` the fused score it was ranked by. ``nprobe`` (IVF) and
+        ``ef_search`` (HNSW) trade recall for latency per query; they are ignored by other
+        index types.
+        ``query_embedding`` skips re-embedding when the caller already has it.
+        """
+        # picks up generations written by other processes (one stat when nothing changed)
+        self.vectors.refresh()
+        if self.vectors.ntotal == 0:
+            return []
+
+        candidates = max(1, top_k * 2)
+        q_emb = (query_embedding if query_embedding is not None else self.embed_query(query)).reshape(1, -1)
+        D, I = self.vectors.search(q_emb.astype("float32"), candidates, nprobe=nprobe, ef_search=ef_search)
+        dense = [(int(idx), float(score)) for idx, score in zip(I[0], D[0]) if idx >= 0]
+        lexical = self.chunk_store.lexical_search(query, candidates)
+
+        metadata = self.chunk_store.get_many({vid for vid, _ in dense} | {vid for vid, _ in lexical})
+        # deleted-but-not-yet-merged vectors have no metadata and drop out of the ranking
+        dense = [(vid, s) for vid, s in dense if vid in metadata]
+        fused = reciprocal_rank_fusion([[vid for vid, _ in dense], [vid for vid, _ in lexical]])
+        top = sorted(fused.items(), key=lambda kv: kv[1], reverse=True)[:top_k]
+        dense_scores, lexical_scores = dict(dense), dict(lexical)
+        # ``score`` stays the cosine similarity; hits found only by BM25 get theirs here
+        lexical_only = [vid for vid, _ in top if vid not in dense_scores]
+        for vid, vec in self.vectors.reconstruct(lexical_only).items():
+            dense_scores[vid] = float(np.dot(q_emb[0], vec))
 
         hits = []
-        for idx, score in zip(I[0], D[0]):
-            if idx < 0 or idx >= len(self.metadata):
-                continue
-            meta = self.metadata[idx]
-            rerank = self._keyword_overlap_score(query, meta["text"])  # simple lexical boost
+        for vid, rrf_score in top:
+            meta = metadata[vid]
             hits.append({
-                "score": float(score) + 0.2 * float(rerank),
+                "score": dense_scores.get(vid, 0.0),
+                "rrf_score": float(rrf_score),
+                "bm25_score": lexical_scores.get(vid),
                 "text": meta["text"],
                 "source": meta["source"],
                 "chunk_id": meta["chunk_id"]
             })
-        hits.sort(key=lambda x: x["score"], reverse=True)
-        return hits[:top_k]
+        return hits
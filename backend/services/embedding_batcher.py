@@ -0,0 +1,127 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+EMBED_BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "5"))
+EMBED_BATCH_MAX = int(os.getenv("EMBED_BATCH_MAX", "32"))
+
+_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+
+class EmbeddingMicroBatcher:
+    """
+    Coalesces single-text embedding requests from concurrent callers into one
+    ``embed_fn`` call. A batch closes ``window_ms`` after its first request arrives
+    or once it holds ``max_batch`` texts, whichever comes first. A caller that arrives
+    while no other request is in flight is encoded right away, without waiting out the
+    window for company that isn't there.
+    """
+
+    def __init__(self, embed_fn: Callable[[List[str]], np.ndarray],
+                 window_ms: float = EMBED_BATCH_WINDOW_MS, max_batch: int = EMBED_BATCH_MAX):
+        self.embed_fn = embed_fn
+        self.window = max(0.0, window_ms) / 1000.0
+        self.max_batch = max(1, max_batch)
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._active_lock = threading.Lock()
+        self._active = 0
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._max_seen = 0
+        # the last slot counts batches larger than the biggest bucket
+        self._size_hist = [0] * (len(_SIZE_BUCKETS) + 1)
+        self._waits = deque(maxlen=1000)
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0 and self.max_batch > 1
+
+    def embed(self, text: str) -> np.ndarray:
+        """Embed one text, blocking until its batch has been encoded."""
+        if not self.enabled:
+            return self.embed_fn([text])[0]
+        with self._active_lock:
+            alone = self._active == 0
+            self._active += 1
+        try:
+            if alone:
+                vector = self.embed_fn([text])[0]
+                self._record(1, [0.0])
+                return vector
+            self._ensure_worker()
+            fut: Future = Future()
+            self._queue.put((text, fut, time.perf_counter()))
+            return fut.result()
+        finally:
+            with self._active_lock:
+                self._active -= 1
+
+    def _ensure_worker(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="embed-batcher", daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            started = time.perf_counter()
+            try:
+                vectors = self.embed_fn([text for text, _, _ in batch])
+                for (_, fut, _), vec in zip(batch, vectors):
+                    fut.set_result(vec)
+            except Exception as e:
+                for _, fut, _ in batch:
+                    fut.set_exception(e)
+            self._record(len(batch), [started - enqueued for _, _, enqueued in batch])
+
+    def _record(self, size: int, waits: List[float]):
+        with self._stats_lock:
+            self._batches += 1
+            self._items += size
+            self._max_seen = max(self._max_seen, size)
+            slot = next((i for i, b in enumerate(_SIZE_BUCKETS) if size <= b), len(_SIZE_BUCKETS))
+            self._size_hist[slot] += 1
+            self._waits.extend(waits)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            waits = sorted(self._waits)
+            return {
+                "window_ms": self.window * 1000.0,
+                "max_batch": self.max_batch,
+                "batches": self._batches,
+                "items": self._items,
+                "avg_batch_size": round(self._items / self._batches, 2) if self._batches else 0.0,
+                "max_batch_size": self._max_seen,
+                "batch_size_histogram": dict(
+                    [(f"<={b}", n) for b, n in zip(_SIZE_BUCKETS, self._size_hist)]
+                    + [(f">{_SIZE_BUCKETS[-1]}", self._size_hist[-1])]
+                ),
+                "queue_depth": self._queue.qsize(),
+                "queue_wait_ms": {
+                    "avg": round(1000.0 * sum(waits) / len(waits), 3) if waits else 0.0,
+                    "p95": round(1000.0 * waits[int(0.95 * (len(waits) - 1))], 3) if waits else 0.0,
+                    "max": round(1000.0 * waits[-1], 3) if waits else 0.0,
+                },
+            }
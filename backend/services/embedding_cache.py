@@ -0,0 +1,178 @@
+import os
+import hashlib
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", os.path.join(tempfile.gettempdir(), "embedding_cache.sqlite"))
+EMBED_CACHE_MAX_BYTES = int(os.getenv("EMBED_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+# query embeddings have their own LRU budget, so one-off queries never evict document vectors
+EMBED_CACHE_QUERY_MAX_BYTES = int(os.getenv("EMBED_CACHE_QUERY_MAX_BYTES", str(32 * 1024 * 1024)))
+# hits only update last_used in memory; they are written back in one batch this often
+# (or at eviction time, or once this many keys are pending)
+EMBED_CACHE_TOUCH_FLUSH_SECONDS = float(os.getenv("EMBED_CACHE_TOUCH_FLUSH_SECONDS", "30"))
+_TOUCH_FLUSH_KEYS = 10000
+
+
+def _cache_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    On-disk embedding cache keyed by model name + text hash. Entries are either document
+    or query vectors (``kind``), each kind evicted LRU once its vectors exceed its budget
+    (``max_bytes`` / ``query_max_bytes``). Shared by every process using the same path.
+    Recency from hits is buffered and flushed in batches, so lookups never write.
+    """
+
+    def __init__(self, path: str = EMBED_CACHE_PATH, max_bytes: int = EMBED_CACHE_MAX_BYTES,
+                 query_max_bytes: int = EMBED_CACHE_QUERY_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.query_max_bytes = query_max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._touched: Dict[str, float] = {}
+        self._touch_flushed_at = time.monotonic()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, model TEXT NOT NULL, dim INTEGER NOT NULL, "
+            "vector BLOB NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL, "
+            "kind TEXT NOT NULL DEFAULT 'doc')"
+        )
+        if "kind" not in [row[1] for row in conn.execute("PRAGMA table_info(embeddings)")]:
+            # caches written before query vectors were kept hold only document vectors
+            conn.execute("ALTER TABLE embeddings ADD COLUMN kind TEXT NOT NULL DEFAULT 'doc'")
+        conn.execute("DROP INDEX IF EXISTS idx_embeddings_last_used")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_kind_last_used ON embeddings (kind, last_used)")
+        conn.commit()
+        self.kind_bytes = {"doc": 0, "query": 0}
+        self.kind_bytes.update(conn.execute("SELECT kind, SUM(size) FROM embeddings GROUP BY kind").fetchall())
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[np.ndarray]]:
+        keys = [_cache_key(model, t) for t in texts]
+        found: Dict[str, np.ndarray] = {}
+        conn = self._conn()
+        # stay well below SQLite's bound-parameter limit
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            placeholders = ", ".join("?" for _ in batch)
+            rows = conn.execute(
+                f"SELECT key, dim, vector FROM embeddings WHERE key IN ({placeholders})", batch
+            ).fetchall()
+            for key, dim, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32).reshape(dim)
+        now = time.time()
+        with self._lock:
+            self.hits += sum(1 for k in keys if k in found)
+            self.misses += sum(1 for k in keys if k not in found)
+            for key in found:
+                self._touched[key] = now
+            flush = self._touched and (
+                len(self._touched) >= _TOUCH_FLUSH_KEYS
+                or time.monotonic() - self._touch_flushed_at >= EMBED_CACHE_TOUCH_FLUSH_SECONDS
+            )
+        if flush:
+            self.flush_touches()
+        return [found.get(k) for k in keys]
+
+    def flush_touches(self):
+        """Write buffered ``last_used`` updates from hits in one transaction."""
+        with self._lock:
+            touched, self._touched = self._touched, {}
+            self._touch_flushed_at = time.monotonic()
+        if not touched:
+            return
+        conn = self._conn()
+        with conn:
+            conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?",
+                             [(ts, key) for key, ts in touched.items()])
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(self.kind_bytes.values())
+
+    def _budget(self, kind: str) -> int:
+        return self.query_max_bytes if kind == "query" else self.max_bytes
+
+    def put_many(self, model: str, texts: List[str], vectors: np.ndarray, kind: str = "doc"):
+        """Store vectors for ``texts``; ``kind`` is "doc" or "query" and picks the eviction budget."""
+        now = time.time()
+        rows = []
+        for text, vec in zip(texts, vectors):
+            blob = np.ascontiguousarray(vec, dtype=np.float32).tobytes()
+            rows.append((_cache_key(model, text), model, int(vec.shape[0]), blob, len(blob), now, kind))
+        if not rows:
+            return
+        conn = self._conn()
+        with conn:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, model, dim, vector, size, last_used, kind) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            inserted = conn.total_changes - before
+        with self._lock:
+            # approximate when some rows were already present; evict() re-syncs from disk
+            self.kind_bytes[kind] = self.kind_bytes.get(kind, 0) + inserted * rows[0][4]
+            over = self.kind_bytes[kind] > self._budget(kind)
+        if over:
+            self.evict(kind)
+
+    def evict(self, kind: str = "doc"):
+        """Drop least-recently-used ``kind`` entries until they are back under 90% of its budget."""
+        # recent hits must count before picking the least recently used
+        self.flush_touches()
+        conn = self._conn()
+        target = int(self._budget(kind) * 0.9)
+        with conn:
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings WHERE kind = ?", (kind,)).fetchone()[0]
+            removed = 0
+            while total > target:
+                rows = conn.execute("SELECT key, size FROM embeddings WHERE kind = ? ORDER BY last_used LIMIT 1000",
+                                    (kind,)).fetchall()
+                if not rows:
+                    break
+                drop = []
+                for key, size in rows:
+                    if total <= target:
+                        break
+                    drop.append((key,))
+                    total -= size
+                conn.executemany("DELETE FROM embeddings WHERE key = ?", drop)
+                removed += len(drop)
+        with self._lock:
+            self.kind_bytes[kind] = total
+            self.evictions += removed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "query_bytes": self.kind_bytes.get("query", 0),
+                "query_max_bytes": self.query_max_bytes,
+            }
@@ -0,0 +1,190 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+JOBS_DB_PATH = os.getenv("INGEST_JOBS_DB", os.path.join(tempfile.gettempdir(), "ingest_jobs.sqlite"))
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_MAX_PENDING = int(os.getenv("INGEST_MAX_PENDING", "32"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    total INTEGER NOT NULL DEFAULT 0,
+    processed INTEGER NOT NULL DEFAULT 0,
+    vectors INTEGER NOT NULL DEFAULT 0,
+    errors INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS job_files (
+    job_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    filename TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER,
+    content_hash TEXT,
+    state TEXT NOT NULL,
+    vectors INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    PRIMARY KEY (job_id, position)
+);
+"""
+
+
+class QueueFullError(Exception):
+    """Raised when the ingestion queue already holds the maximum number of pending jobs."""
+
+
+class JobStore:
+    """
+    Persisted job table. Status lives in SQLite rather than process memory so it
+    survives restarts and is visible to every API worker process.
+    """
+
+    def __init__(self, path: str = JOBS_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def create_job(self, job_id: str, files: List[Dict[str, Any]]):
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT INTO jobs (job_id, state, total, created_at, updated_at) VALUES (?, 'queued', ?, ?, ?)",
+                (job_id, len(files), now, now),
+            )
+            conn.executemany(
+                "INSERT INTO job_files (job_id, position, filename, path, size, content_hash, state) "
+                "VALUES (?, ?, ?, ?, ?, ?, 'queued')",
+                [(job_id, i, f["filename"], f["path"], f.get("size"), f.get("content_hash"))
+                 for i, f in enumerate(files)],
+            )
+
+    def set_job_state(self, job_id: str, state: str, error: Optional[str] = None):
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "UPDATE jobs SET state = ?, error = COALESCE(?, error), updated_at = ? WHERE job_id = ?",
+                (state, error, time.time(), job_id),
+            )
+
+    def set_file_state(self, job_id: str, position: int, state: str, vectors: int = 0, error: Optional[str] = None):
+        """Record a per-file transition; terminal states also roll up into the job counters."""
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "UPDATE job_files SET state = ?, vectors = ?, error = ? WHERE job_id = ? AND position = ?",
+                (state, vectors, error, job_id, position),
+            )
+            if state in ("done", "failed", "skipped"):
+                conn.execute(
+                    "UPDATE jobs SET processed = processed + 1, vectors = vectors + ?, "
+                    "errors = errors + ?, updated_at = ? WHERE job_id = ?",
+                    (vectors, 1 if state == "failed" else 0, time.time(), job_id),
+                )
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        conn = self._conn()
+        row = conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        files = conn.execute(
+            "SELECT position, filename, size, content_hash, state, vectors, error "
+            "FROM job_files WHERE job_id = ? ORDER BY position",
+            (job_id,),
+        ).fetchall()
+        job = dict(row)
+        job["done"] = job["state"] in ("done", "failed")
+        job["files"] = [dict(f) for f in files]
+        return job
+
+    def get_files(self, job_id: str) -> List[Dict[str, Any]]:
+        rows = self._conn().execute(
+            "SELECT position, filename, path, content_hash, state FROM job_files WHERE job_id = ? ORDER BY position",
+            (job_id,),
+        ).fetchall()
+        return [dict(r) for r in rows]
+
+    def unfinished_jobs(self) -> List[str]:
+        rows = self._conn().execute(
+            "SELECT job_id FROM jobs WHERE state IN ('queued', 'running') ORDER BY created_at"
+        ).fetchall()
+        return [r["job_id"] for r in rows]
+
+
+class IngestionQueue:
+    """
+    Bounded worker pool for ingestion jobs. Uploads are enqueued and return
+    immediately; extraction, chunking and embedding run on worker threads so the
+    event loop keeps serving queries.
+    """
+
+    def __init__(self, handler: Callable[[str, List[Dict[str, Any]]], None], store: JobStore,
+                 workers: int = INGEST_WORKERS, max_pending: int = INGEST_MAX_PENDING):
+        self.handler = handler
+        self.store = store
+        self.workers = max(1, workers)
+        self._slots = threading.BoundedSemaphore(max(1, max_pending))
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ingest")
+            return self._executor
+
+    def submit(self, job_id: str):
+        if not self._slots.acquire(blocking=False):
+            raise QueueFullError("Ingestion queue is full, retry later")
+        try:
+            self._get_executor().submit(self._run, job_id)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def resume_pending(self) -> int:
+        """Re-enqueue jobs that were queued or running when the process last stopped."""
+        resumed = 0
+        for job_id in self.store.unfinished_jobs():
+            try:
+                self.submit(job_id)
+                resumed += 1
+            except QueueFullError:
+                break
+        return resumed
+
+    def _run(self, job_id: str):
+        try:
+            self.store.set_job_state(job_id, "running")
+            self.handler(job_id, self.store.get_files(job_id))
+            self.store.set_job_state(job_id, "done")
+        except Exception as e:
+            print(f"[Ingest] Job {job_id} failed: {e}")
+            self.store.set_job_state(job_id, "failed", error=str(e))
+        finally:
+            self._slots.release()
+
+    def shutdown(self, wait: bool = False):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
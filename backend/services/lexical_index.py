@@ -0,0 +1,54 @@
+import math
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Reciprocal rank fusion constant (Cormack et al.); larger flattens rank differences
+RRF_K = 60
+
+_TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9+#]*")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it of on or that the this to was were will with".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+
+def term_frequencies(text: str) -> Tuple[Dict[str, int], int]:
+    """Return ``(term -> tf, document length)`` for one chunk."""
+    tokens = tokenize(text)
+    return dict(Counter(tokens)), len(tokens)
+
+
+def bm25_scores(postings: Iterable[Tuple[str, int, int, int]], n_docs: int, avg_len: float,
+                k1: float = BM25_K1, b: float = BM25_B,
+                doc_freqs: Optional[Dict[str, int]] = None) -> Dict[int, float]:
+    """
+    Score documents from posting rows ``(term, vector_id, tf, doc_len)``. Document
+    frequency comes from ``doc_freqs`` when given (so posting lists may be truncated),
+    otherwise it is the posting-list length and callers must pass complete lists per term.
+    """
+    by_term: Dict[str, List[Tuple[int, int, int]]] = {}
+    for term, vid, tf, dl in postings:
+        by_term.setdefault(term, []).append((vid, tf, dl))
+    scores: Dict[int, float] = {}
+    avg_len = avg_len or 1.0
+    for term, rows in by_term.items():
+        df = doc_freqs.get(term, len(rows)) if doc_freqs is not None else len(rows)
+        idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+        for vid, tf, dl in rows:
+            denom = tf + k1 * (1 - b + b * dl / avg_len)
+            scores[vid] = scores.get(vid, 0.0) + idf * tf * (k1 + 1) / denom
+    return scores
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], k: int = RRF_K) -> Dict[int, float]:
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, vid in enumerate(ranking):
+            fused[vid] = fused.get(vid, 0.0) + 1.0 / (k + rank + 1)
+    return fused
@@ -0,0 +1,113 @@
+import heapq
+import threading
+from collections import Counter
+from difflib import SequenceMatcher
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+class FuzzyNameIndex:
+    """
+    ``difflib.get_close_matches`` over a fixed list of names, with the same results.
+
+    ``get_close_matches`` runs a SequenceMatcher against every possibility. Here each name's
+    character counts sit in one matrix, so the ``quick_ratio`` bound (the character
+    multiset overlap, which ``ratio`` can never exceed) is computed for every name in one
+    vectorized step. Only names that clear ``cutoff`` on that bound reach SequenceMatcher,
+    best bound first, stopping once no remaining name can enter the top ``n``. Duplicate
+    names keep their multiplicity, since they take up slots in the top ``n``.
+    """
+
+    def __init__(self, names: Iterable[str]):
+        counts = Counter(iter(names))
+        self.names: List[str] = list(counts)
+        self._multiplicity = [counts[name] for name in self.names]
+        self._alphabet: Dict[str, int] = {}
+        for name in self.names:
+            for ch in name:
+                self._alphabet.setdefault(ch, len(self._alphabet))
+        self._char_counts = np.zeros((len(self.names), max(len(self._alphabet), 1)), dtype=np.int32)
+        for row, name in enumerate(self.names):
+            for ch, n in Counter(name).items():
+                self._char_counts[row, self._alphabet[ch]] = n
+        self._lengths = np.array([len(name) for name in self.names], dtype=np.float64)
+
+    def close_matches(self, word: str, n: int = 3, cutoff: float = 0.6) -> List[str]:
+        if not n > 0:
+            raise ValueError("n must be > 0: %r" % (n,))
+        if not 0.0 <= cutoff <= 1.0:
+            raise ValueError("cutoff must be in [0.0, 1.0]: %r" % (cutoff,))
+        if not self.names:
+            return []
+        cols, wanted = [], []
+        for ch, count in Counter(word).items():
+            col = self._alphabet.get(ch)
+            if col is not None:
+                cols.append(col)
+                wanted.append(count)
+        if cols:
+            overlap = np.minimum(self._char_counts[:, cols], np.array(wanted, dtype=np.int32)).sum(axis=1)
+        else:
+            overlap = np.zeros(len(self.names), dtype=np.int64)
+        total = self._lengths + len(word)
+        # SequenceMatcher's own 2.0 * matches / length, with 1.0 for two empty strings
+        with np.errstate(divide="ignore", invalid="ignore"):
+            bound = np.where(total > 0, 2.0 * overlap / total, 1.0)
+
+        # best bound first: once n matches are in hand, a name whose bound is below the
+        # n-th best score can't make the cut (an equal bound still can, on name order)
+        rows = np.flatnonzero(bound >= cutoff)
+        rows = rows[np.argsort(-bound[rows], kind="stable")]
+        top: List[Tuple[float, str]] = []
+        s = SequenceMatcher()
+        s.set_seq2(word)
+        for row in rows:
+            if len(top) >= n and bound[row] < top[0][0]:
+                break
+            name = self.names[row]
+            s.set_seq1(name)
+            score = s.ratio()
+            if score < cutoff:
+                continue
+            for _ in range(self._multiplicity[row]):
+                if len(top) < n:
+                    heapq.heappush(top, (score, name))
+                elif (score, name) > top[0]:
+                    heapq.heapreplace(top, (score, name))
+        return [x for score, x in sorted(top, reverse=True)]
+
+
+class SchemaNameIndex:
+    """Fuzzy indexes over one schema's table and column names, plus column → tables."""
+
+    def __init__(self, schema: Dict[str, Any]):
+        tables = schema.get("tables", {})
+        self.tables = FuzzyNameIndex(tables)
+        self.column_tables: Dict[str, List[str]] = {}
+        all_cols = []
+        for t, meta in tables.items():
+            for c in meta["columns"]:
+                all_cols.append(c["name"])
+                self.column_tables.setdefault(c["name"], []).append(t)
+        self.columns = FuzzyNameIndex(all_cols)
+
+
+_cached: Optional[Tuple[Any, Any, SchemaNameIndex]] = None
+_cached_lock = threading.Lock()
+
+
+def schema_name_index(schema: Dict[str, Any]) -> SchemaNameIndex:
+    """
+    Index for ``schema``, rebuilt only when it changes: a schema with a fingerprint is
+    matched by fingerprint (refreshed snapshots get a new one), others by identity.
+    """
+    global _cached
+    fp = schema.get("fingerprint")
+    cached = _cached
+    if cached is not None and (cached[0] is schema or (fp is not None and cached[1] == fp)):
+        return cached[2]
+    index = SchemaNameIndex(schema)
+    with _cached_lock:
+        _cached = (schema, fp, index)
+    return index
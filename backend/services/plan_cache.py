@@ -0,0 +1,65 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+PLAN_CACHE_MAX_ENTRIES = int(os.getenv("PLAN_CACHE_MAX_ENTRIES", "1024"))
+
+# (sql text, names of the parameters it binds)
+Plan = Tuple[Optional[str], Tuple[str, ...]]
+
+
+class PlanCache:
+    """
+    LRU map from a question template to the SQL the NL→SQL heuristics produced for it.
+    Literals are not part of the plan; callers re-bind them per question.
+    """
+
+    def __init__(self, max_entries: int = PLAN_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._plans: "OrderedDict[str, Plan]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        # bumped by clear(); plans computed against an older schema are not stored
+        self.generation = 0
+
+    def get(self, template: str) -> Optional[Plan]:
+        with self._lock:
+            plan = self._plans.get(template)
+            if plan is None:
+                self.misses += 1
+                return None
+            self._plans.move_to_end(template)
+            self.hits += 1
+            return plan
+
+    def put(self, template: str, plan: Plan, generation: Optional[int] = None):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._plans[template] = plan
+            self._plans.move_to_end(template)
+            while len(self._plans) > self.max_entries:
+                self._plans.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            if self._plans:
+                self.invalidations += 1
+            self._plans.clear()
+            self.generation += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._plans),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "invalidations": self.invalidations,
+            }
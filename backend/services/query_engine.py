@@ -1,24 +1,158 @@
 from services.schema_discovery import SchemaDiscovery
 from services.document_processor import DocumentProcessor
-from sqlalchemy import create_engine, text
-from functools import lru_cache
+from services.registry import get_document_processor
+from services.result_cache import ResultCache
+from services.semantic_cache import SemanticCache
+from services.plan_cache import PlanCache
+from services.schema_index import SchemaIndex
+from services.schema_snapshot import load_snapshot, save_snapshot
+from services.db_pool import DB_MAX_OVERFLOW, DB_POOL_SIZE, pool_stats
+from services.schema_catalog import get_engine
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError, TimeoutError as PoolTimeoutError
+from services.result_cache import tables_in
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from collections import deque
+from contextlib import contextmanager
+from functools import partial
+import asyncio
+import base64
+import hashlib
+import json
+import os
 import re
+import threading
 import time
-from typing import Dict, List, Tuple, Any
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple, Any
+
+# threads running queries off the event loop; defaults to the DB pool's capacity
+QUERY_WORKERS = int(os.getenv("QUERY_WORKERS", str(DB_POOL_SIZE + DB_MAX_OVERFLOW)))
+# per-branch deadlines of a hybrid query, which returns whichever branch finished in time;
+# the SQL one is enforced by the database, so a late statement is cancelled, not abandoned
+SQL_BRANCH_TIMEOUT_SECONDS = float(os.getenv("SQL_BRANCH_TIMEOUT_SECONDS", "10"))
+DOC_BRANCH_TIMEOUT_SECONDS = float(os.getenv("DOC_BRANCH_TIMEOUT_SECONDS", "5"))
+# row cap appended to generated SQL unless the question asks for a limit itself
+DEFAULT_ROW_LIMIT = 200
+PAGE_SIZE_DEFAULT = int(os.getenv("PAGE_SIZE_DEFAULT", "100"))
+PAGE_SIZE_MAX = int(os.getenv("PAGE_SIZE_MAX", "1000"))
+# rows fetched per round trip from the server-side cursor when streaming
+STREAM_BATCH_ROWS = int(os.getenv("STREAM_BATCH_ROWS", "500"))
+
+# ---------- NL→SQL vocabulary ----------
+_TABLE_TERMS = ("employee", "employees", "name", "department", "salary", "hire")
+_DOC_KEYWORDS = ["resume", "cv", "document", "find", "mention", "search"]
+_SQL_KEYWORDS = ["how many", "count", "avg", "sum", "top", "highest", "lowest", "list", "where", "select", "employees", "salary", "hired"]
+# "80k" is read as 80000
+_OVER_RE = re.compile(r"\b(over|greater than|above)\s+([0-9][0-9,]*)(k\b)?")
+_UNDER_RE = re.compile(r"\b(under|less than|below)\s+([0-9][0-9,]*)(k\b)?")
+_DEPT_RE = re.compile(r"\b(department|dept)\s+(of|=)?\s*([a-zA-Z]+)")
+_SKILL_RE = re.compile(r"\b(python|java|sql|c\+\+|c#|golang|react|node)\b")
+# every word the heuristics test a question for; a literal overlapping one is never abstracted
+_HEURISTIC_WORDS = set(_TABLE_TERMS) | set(_DOC_KEYWORDS) | set(_SQL_KEYWORDS) | {
+    "dept", "pay", "compensation", "hired", "date", "limit",
+    "over", "greater than", "above", "under", "less than", "below", "of",
+}
+# stands in for a department name in plan templates
+_DEPT_SLOT = "qqdeptslotqq"
+
+
+def _encode_page_token(fingerprint: str, **position: Any) -> str:
+    raw = json.dumps(dict(position, f=fingerprint), separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_page_token(token: str, fingerprint: str) -> Dict[str, Any]:
+    try:
+        state = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid page_token")
+    if not isinstance(state, dict) or state.get("f") != fingerprint:
+        raise ValueError("page_token does not belong to this query")
+    return state
+
+
+def _bind_literals(q: str) -> Dict[str, Any]:
+    """Parameter values the filters take from a lower-cased question."""
+    literals: Dict[str, Any] = {}
+    m_over = _OVER_RE.search(q)
+    if m_over:
+        literals["salary_min"] = int(m_over.group(2).replace(",", "")) * (1000 if m_over.group(3) else 1)
+    m_under = _UNDER_RE.search(q)
+    if m_under:
+        literals["salary_max"] = int(m_under.group(2).replace(",", "")) * (1000 if m_under.group(3) else 1)
+    m_dept = _DEPT_RE.search(q)
+    if m_dept:
+        literals["dept"] = m_dept.group(3).capitalize()
+    m_skill = _SKILL_RE.search(q)
+    if m_skill:
+        literals["skill"] = f"%{m_skill.group(1)}%"
+    return literals
+
 
 class QueryEngine:
-    def __init__(self, connection_string: str):
+    def __init__(self, connection_string: str, doc_processor: Optional[DocumentProcessor] = None):
         self.connection_string = connection_string
+        # SQL per question template; emptied whenever a new schema snapshot is assigned
+        self.plan_cache = PlanCache()
         self.schema_discovery = SchemaDiscovery()
-        # analyze at init (for demo). In real use re-run on connect
-        try:
-            self.schema = self.schema_discovery.analyze_database(connection_string)
-        except Exception:
-            # fallback empty schema
-            self.schema = {"tables": {}}
-        self.doc_processor = DocumentProcessor()
-        self.engine = create_engine(connection_string, future=True)
+        # one refresh at a time, so a slower one can't overwrite a newer snapshot
+        self._schema_lock = threading.Lock()
+        # start from the snapshot saved by an earlier run and revalidate it once the engine
+        # is up; only without one does startup wait on a full analyze
+        cached = load_snapshot(connection_string)
+        if cached is not None:
+            self.schema = cached
+        else:
+            try:
+                self.schema = self.schema_discovery.analyze_database(connection_string)
+                save_snapshot(connection_string, self.schema)
+            except Exception:
+                # fallback empty schema
+                self.schema = {"tables": {}}
+        # Defaults to the process-wide shared processor, resolved on first use
+        self._doc_processor = doc_processor
+        # the same pooled engine schema discovery uses for this database
+        self.engine = get_engine(connection_string)
+        # Bounded pool so blocking SQL and embedding work never runs on the event loop
+        self._executor = ThreadPoolExecutor(max_workers=QUERY_WORKERS, thread_name_prefix="query")
+        # document branch of a hybrid query, beside the SQL branch on the query's own worker;
+        # separate from _executor so a query never waits on a slot its own worker is holding
+        self._branch_executor = ThreadPoolExecutor(max_workers=QUERY_WORKERS, thread_name_prefix="query-branch")
+        self._exec_lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+        self._completed = 0
+        self._pool_timeouts = 0
+        self._queue_waits = deque(maxlen=1000)
+        # SQL results by normalized statement + params; tagged by table for invalidation
+        self.result_cache = ResultCache()
+        # Whole answers for near-duplicate questions; see SemanticCache
+        self.semantic_cache = SemanticCache()
+        # bumped when ingestion rewrites tables; cached answers from older versions are misses
+        self.data_version = 0
         self.history = []
+        if cached is not None:
+            threading.Thread(target=self._revalidate_schema, name="schema-revalidate", daemon=True).start()
+
+    @property
+    def schema(self) -> Dict[str, Any]:
+        return self._schema
+
+    @schema.setter
+    def schema(self, value: Dict[str, Any]):
+        self._schema = value
+        # column roles and a substring index over column names, rebuilt per snapshot
+        self.schema_index = SchemaIndex(value)
+        inert = [s for s in ("golang", "react", "node", "java", "python", "sql") if self._is_inert(s)]
+        # a skill that no column name mentions can stand in for any other such skill
+        self._skill_slot = inert[0] if inert else None
+        self.plan_cache.clear()
+
+    @property
+    def doc_processor(self) -> DocumentProcessor:
+        if self._doc_processor is None:
+            self._doc_processor = get_document_processor()
+        return self._doc_processor
 
     # ---------- Text → SQL helpers ----------
     def _choose_table(self, user_query: str) -> str:
@@ -28,23 +162,8 @@ class QueryEngine:
         if not self.schema or not self.schema.get("tables"):
             return None
         q = user_query.lower()
-        best_table = None
-        best_score = -1
-        for table, meta in self.schema["tables"].items():
-            cols = [c["name"].lower() for c in meta.get("columns", [])]
-            score = 0
-            # reward presence of key business terms
-            for term in ("employee", "employees", "name", "department", "salary", "hire"):
-                if term in q and any(term in c for c in cols):
-                    score += 2
-            # lexical overlap with column names
-            for w in re.findall(r"[a-zA-Z_]+", q):
-                if any(w in c for c in cols):
-                    score += 1
-            if score > best_score:
-                best_score = score
-                best_table = table
-        return best_table
+        # business terms score 2, any word found in a column name scores 1
+        return self.schema_index.best_table(q, _TABLE_TERMS, re.findall(r"[a-zA-Z_]+", q))
 
     def _select_columns(self, table: str, user_query: str) -> List[str]:
         """
@@ -52,26 +171,23 @@ class QueryEngine:
         """
         if not table:
             return []
-        cols = [c["name"] for c in self.schema["tables"][table]["columns"]]
+        cols = self.schema_index.columns[table]
+        roles = self.schema_index.roles[table]
         q = user_query.lower()
         picks: List[str] = []
         # common intents
-        name_like = [c for c in cols if re.search(r"name|full_?name|first|last", c, re.I)]
-        dept_like = [c for c in cols if re.search(r"dept|department", c, re.I)]
-        sal_like = [c for c in cols if re.search(r"salary|pay|comp", c, re.I)]
-        date_like = [c for c in cols if re.search(r"hire|date", c, re.I)]
-
+        name_like = roles["name"]
         if "name" in q and name_like:
             picks.extend(name_like[:1])
-        if any(k in q for k in ("department", "dept")) and dept_like:
-            picks.extend(dept_like[:1])
-        if any(k in q for k in ("salary", "pay", "compensation")) and sal_like:
-            picks.extend(sal_like[:1])
-        if any(k in q for k in ("hire", "hired", "date")) and date_like:
-            picks.extend(date_like[:1])
+        if any(k in q for k in ("department", "dept")) and roles["dept"]:
+            picks.extend(roles["dept"][:1])
+        if any(k in q for k in ("salary", "pay", "compensation")) and roles["salary"]:
+            picks.extend(roles["salary"][:1])
+        if any(k in q for k in ("hire", "hired", "date")) and roles["date"]:
+            picks.extend(roles["date"][:1])
 
         # Always include a stable id if present
-        id_like = [c for c in cols if c.lower() in ("id", f"{table}_id")]
+        id_like = roles["id"]
         if id_like:
             picks = id_like[:1] + [c for c in picks if c not in id_like]
 
@@ -95,54 +211,79 @@ class QueryEngine:
         params: Dict[str, Any] = {}
         if not table:
             return clauses, params
-        cols = [c["name"] for c in self.schema["tables"][table]["columns"]]
-        lower_cols = [c.lower() for c in cols]
-        q = user_query.lower()
-
+        literals = _bind_literals(user_query.lower())
         # numeric comparison: over/under N
-        m_over = re.search(r"\b(over|greater than|above)\s+([0-9][0-9,]*)", q)
-        m_under = re.search(r"\b(under|less than|below)\s+([0-9][0-9,]*)", q)
-        salary_col = None
-        for c in lower_cols:
-            if re.search(r"salary|pay|comp", c):
-                salary_col = cols[lower_cols.index(c)]
-                break
-        if salary_col and (m_over or m_under):
-            if m_over:
-                val = int(m_over.group(2).replace(",", ""))
+        salary_col = self.schema_index.first(table, "salary")
+        if salary_col:
+            if "salary_min" in literals:
                 clauses.append(f"{salary_col} > :salary_min")
-                params["salary_min"] = val
-            if m_under:
-                val = int(m_under.group(2).replace(",", ""))
+                params["salary_min"] = literals["salary_min"]
+            if "salary_max" in literals:
                 clauses.append(f"{salary_col} < :salary_max")
-                params["salary_max"] = val
+                params["salary_max"] = literals["salary_max"]
 
         # department equality if mentioned
-        dept_col = None
-        for c in lower_cols:
-            if re.search(r"dept|department", c):
-                dept_col = cols[lower_cols.index(c)]
-                break
-        m_dept = re.search(r"\b(department|dept)\s+(of|=)?\s*([a-zA-Z]+)", q)
-        if dept_col and m_dept:
-            dept = m_dept.group(3).capitalize()
+        dept_col = self.schema_index.first(table, "dept")
+        if dept_col and "dept" in literals:
             clauses.append(f"{dept_col} = :dept")
-            params["dept"] = dept
+            params["dept"] = literals["dept"]
 
         # simple LIKE search for skills/roles
-        skill_col = None
-        for c in lower_cols:
-            if c in ("skills", "skill", "notes", "bio", "description", "role"):
-                skill_col = cols[lower_cols.index(c)]
-                break
-        m_skill = re.search(r"\b(python|java|sql|c\+\+|c#|golang|react|node)\b", q)
-        if skill_col and m_skill:
+        skill_col = self.schema_index.first(table, "skill")
+        if skill_col and "skill" in literals:
             clauses.append(f"{skill_col} LIKE :skill")
-            params["skill"] = f"%{m_skill.group(1)}%"
-
+            params["skill"] = literals["skill"]
         return clauses, params
 
+    def _is_inert(self, word: str) -> bool:
+        """True if swapping ``word`` for another inert word cannot change any heuristic's outcome."""
+        if any(word in kw or kw in word for kw in _HEURISTIC_WORDS):
+            return False
+        return not self.schema_index.any_column_contains(word)
+
+    def _plan_template(self, q: str) -> str:
+        """
+        The lower-cased question with its literals abstracted: digits become 0 and a
+        department name or skill becomes a fixed slot word. A literal is only abstracted
+        when nothing else in the heuristics reacts to it (see ``_is_inert``), so every
+        question sharing a template yields the same SQL text.
+        """
+        template = re.sub(r"[0-9]+", "0", q)
+        m_dept = _DEPT_RE.search(template)
+        if m_dept and self._is_inert(m_dept.group(3)) and not _SKILL_RE.search(m_dept.group(3)):
+            template = template[:m_dept.start(3)] + _DEPT_SLOT + template[m_dept.end(3):]
+        m_skill = _SKILL_RE.search(template)
+        if m_skill and self._skill_slot and self._is_inert(m_skill.group(1)):
+            template = template[:m_skill.start(1)] + self._skill_slot + template[m_skill.end(1):]
+        return template
+
+    def _semantic_key(self, user_query: str) -> Tuple[Any, ...]:
+        """
+        What a semantic cache hit must share with the cached question: the query type and,
+        unless only documents are searched, the SQL and parameters it runs. Paraphrases
+        that build the same statement share a key; the embedding decides the rest.
+        """
+        qtype = self.classify_query(user_query)
+        if qtype == "doc":
+            return (qtype,)
+        sql, params = self._build_sql(user_query)
+        return qtype, sql, tuple(sorted(params.items()))
+
     def _build_sql(self, user_query: str) -> Tuple[str, Dict[str, Any]]:
+        """SQL + parameters for a question, reusing the plan of an earlier question with the same template."""
+        q = user_query.lower()
+        template = self._plan_template(q)
+        plan = self.plan_cache.get(template)
+        if plan is None:
+            generation = self.plan_cache.generation
+            sql, params = self._plan_sql(user_query)
+            self.plan_cache.put(template, (sql, tuple(params)), generation=generation)
+            return sql, params
+        sql, names = plan
+        literals = _bind_literals(q)
+        return sql, {name: literals[name] for name in names}
+
+    def _plan_sql(self, user_query: str) -> Tuple[str, Dict[str, Any]]:
         table = self._choose_table(user_query)
         if not table:
             return None, {}
@@ -153,14 +294,92 @@ class QueryEngine:
         if where:
             sql += " WHERE " + " AND ".join(where)
         if "limit" not in user_query.lower():
-            sql += " LIMIT 200"
+            sql += f" LIMIT {DEFAULT_ROW_LIMIT}"
         return sql, params
 
+    @staticmethod
+    def _without_default_limit(user_query: str, sql_text: str) -> str:
+        suffix = f" LIMIT {DEFAULT_ROW_LIMIT}"
+        if "limit" not in user_query.lower() and sql_text.endswith(suffix):
+            return sql_text[:-len(suffix)]
+        return sql_text
+
+    def _paged_sql(self, user_query: str, sql_text: str, params: Dict[str, Any], page_size: Optional[int],
+                   page_token: Optional[str],
+                   deadline: Optional[float] = None) -> Tuple[List[Dict[str, Any]], bool, Optional[str]]:
+        """
+        One page of the question's full result. Tables with an id column are paged by
+        keyset (``id > last id``), so deep pages cost the same as the first; others fall
+        back to OFFSET. Returns ``(rows, cache_hit, next_page_token)``.
+        """
+        size = max(1, min(page_size or PAGE_SIZE_DEFAULT, PAGE_SIZE_MAX))
+        base = self._without_default_limit(user_query, sql_text)
+        fingerprint = hashlib.sha256(repr((base, sorted(params.items()))).encode("utf-8")).hexdigest()[:16]
+        state = _decode_page_token(page_token, fingerprint) if page_token else {}
+        table = next(iter(tables_in(base)), None)
+        key = self.schema_index.first(table, "id") if table in self.schema_index.roles else None
+
+        page_params = dict(params, _page_limit=size + 1)
+        if key:
+            sql = f"SELECT * FROM ({base}) AS page_q"
+            if "k" in state:
+                sql += f" WHERE page_q.{key} > :_page_after"
+                page_params["_page_after"] = state["k"]
+            sql += f" ORDER BY page_q.{key} LIMIT :_page_limit"
+        else:
+            offset = int(state.get("o", 0))
+            sql = f"SELECT * FROM ({base}) AS page_q LIMIT :_page_limit OFFSET :_page_offset"
+            page_params["_page_offset"] = offset
+        rows, cache_hit = self._cached_sql(sql, page_params, deadline)
+        if len(rows) <= size:
+            return rows, cache_hit, None
+        rows = rows[:size]
+        if key:
+            return rows, cache_hit, _encode_page_token(fingerprint, k=rows[-1][key])
+        return rows, cache_hit, _encode_page_token(fingerprint, o=offset + size)
+
+    def stream_query(self, user_query: str, nprobe: Optional[int] = None,
+                     ef_search: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Yield the answer incrementally: a ``meta`` record, ``rows`` batches read from a
+        server-side cursor (no default row cap, constant memory), ``docs`` and a final
+        ``end`` record with metrics. Errors after the first record arrive as ``error``.
+        """
+        start = time.time()
+        qtype = self.classify_query(user_query)
+        yield {"type": "meta", "query": user_query, "query_type": qtype}
+        row_count = 0
+        first_row_ms = None
+        try:
+            if qtype in ("sql", "hybrid"):
+                sql_text, params = self._build_sql(user_query)
+                if sql_text:
+                    sql_text = self._without_default_limit(user_query, sql_text)
+                    with self.engine.connect() as conn:
+                        result = conn.execution_options(stream_results=True, max_row_buffer=STREAM_BATCH_ROWS).execute(
+                            text(sql_text), params
+                        )
+                        for batch in result.partitions(STREAM_BATCH_ROWS):
+                            if first_row_ms is None:
+                                first_row_ms = round(1000.0 * (time.time() - start), 3)
+                            row_count += len(batch)
+                            yield {"type": "rows", "rows": [dict(row) for row in batch]}
+            if qtype in ("doc", "hybrid"):
+                docs = self.doc_processor.search(user_query, top_k=6, nprobe=nprobe, ef_search=ef_search)
+                yield {"type": "docs", "docs": docs}
+        except Exception as e:
+            yield {"type": "error", "error": str(e)}
+            return
+        elapsed = time.time() - start
+        self.history.append({"q": user_query, "type": qtype, "time": elapsed})
+        yield {"type": "end", "metrics": {"time_seconds": round(elapsed, 3), "rows": row_count,
+                                          "first_row_ms": first_row_ms}}
+
     def classify_query(self, q: str):
         qlow = q.lower()
         # very simple rules:
-        doc_keywords = ["resume", "cv", "document", "find", "mention", "search"]
-        sql_keywords = ["how many", "count", "avg", "sum", "top", "highest", "lowest", "list", "where", "select", "employees", "salary", "hired"]
+        doc_keywords = _DOC_KEYWORDS
+        sql_keywords = _SQL_KEYWORDS
         if any(k in qlow for k in doc_keywords) and not any(k in qlow for k in sql_keywords):
             return "doc"
         if any(k in qlow for k in sql_keywords):
@@ -171,44 +390,311 @@ class QueryEngine:
         # fallback: hybrid
         return "hybrid"
 
-    @lru_cache(maxsize=512)
-    def _cached_sql_no_params(self, sql_text: str):
-        with self.engine.connect() as conn:
-            r = conn.execute(text(sql_text))
-            rows = [dict(row) for row in r.fetchall()]
-            return rows
+    @contextmanager
+    def _statement_deadline(self, conn, deadline: Optional[float]):
+        """
+        Make the database stop ``conn``'s statements at ``deadline`` (a ``perf_counter``
+        time): SQLite through a progress handler that aborts the running statement,
+        Postgres through a transaction-local ``statement_timeout``. Other databases run
+        unbounded.
+        """
+        if deadline is None:
+            yield
+            return
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            raise FutureTimeoutError()
+        if conn.dialect.name == "sqlite":
+            raw = conn.connection.dbapi_connection
+            # checked every 1000 VM instructions; a true return interrupts the statement
+            raw.set_progress_handler(lambda: time.perf_counter() > deadline, 1000)
+            try:
+                yield
+            finally:
+                raw.set_progress_handler(None, 0)
+            return
+        if conn.dialect.name == "postgresql":
+            conn.execute(text(f"SET LOCAL statement_timeout = {max(1, int(1000 * remaining))}"))
+        yield
+
+    def _execute_sql(self, sql_text: str, params: Dict[str, Any], deadline: Optional[float] = None):
+        try:
+            with self.engine.connect() as conn, self._statement_deadline(conn, deadline):
+                r = conn.execute(text(sql_text), params)
+                return [dict(row) for row in r.fetchall()]
+        except PoolTimeoutError:
+            with self._exec_lock:
+                self._pool_timeouts += 1
+            raise
+        except DBAPIError as e:
+            if deadline is not None and time.perf_counter() >= deadline:
+                raise FutureTimeoutError() from e
+            raise
+
+    def _cached_sql(self, sql_text: str, params: Dict[str, Any],
+                    deadline: Optional[float] = None) -> Tuple[List[Dict[str, Any]], bool]:
+        """Run ``sql_text`` through the result cache; returns ``(rows, cache_hit)``."""
+        generation = self.result_cache.generation
+        rows = self.result_cache.get(sql_text, params)
+        if rows is not None:
+            return rows, True
+        rows = self._execute_sql(sql_text, params, deadline)
+        self.result_cache.put(sql_text, params, rows, generation=generation)
+        return rows, False
+
+    def refresh_schema(self, changed_tables: List[str] = ()) -> List[str]:
+        """
+        Re-analyze only the tables whose fingerprint changed (plus ``changed_tables``) and
+        swap in the patched snapshot. A no-op when nothing changed, so plans stay cached.
+        Raises when the database can't be reached; the current schema is kept.
+        """
+        with self._schema_lock:
+            schema, changed = self.schema_discovery.refresh(self.connection_string, self.schema, changed_tables)
+            if schema is not self.schema:
+                # also the first revalidation of a loaded snapshot, which fills in samples and stats
+                self.schema = schema
+            if changed:
+                save_snapshot(self.connection_string, schema)
+            # DDL changed outside ingestion; cached results over those tables are stale too
+            external = changed - set(changed_tables)
+            if external:
+                self.invalidate_tables(sorted(external))
+        return sorted(changed)
+
+    def _revalidate_schema(self):
+        started = time.time()
+        try:
+            changed = self.refresh_schema()
+        except Exception as e:
+            print(f"[QueryEngine] Schema revalidation failed: {e}")
+            return
+        print(f"[QueryEngine] Schema snapshot revalidated in {time.time() - started:.2f}s ({len(changed)} tables changed)")
+
+    def invalidate_tables(self, tables: List[str]) -> int:
+        """Forget cached results that read ``tables``; called after ingestion rewrites them."""
+        self.data_version += 1
+        return self.result_cache.invalidate_tables(tables)
+
+    def cache_stats(self) -> Dict[str, Any]:
+        return {
+            "sql_results": self.result_cache.stats(),
+            "semantic": self.semantic_cache.stats(),
+            "plans": self.plan_cache.stats(),
+        }
+
+    async def aprocess_query(self, user_query: str, **options):
+        """``process_query`` on the query worker pool, for callers on the event loop."""
+        loop = asyncio.get_running_loop()
+        with self._exec_lock:
+            self._queued += 1
+        return await loop.run_in_executor(
+            self._executor, partial(self._run_queued, time.perf_counter(), user_query, **options)
+        )
+
+    async def astream_query(self, user_query: str, **options) -> AsyncIterator[Dict[str, Any]]:
+        """
+        ``stream_query`` for callers on the event loop: each record is produced on the
+        query worker pool, so reading a batch from the database never blocks the loop and
+        streams share the pool's bound with regular queries.
+        """
+        loop = asyncio.get_running_loop()
+        records = self.stream_query(user_query, **options)
+        pending = None
+
+        def close(_=None):
+            try:
+                self._executor.submit(records.close)
+            except RuntimeError:
+                records.close()  # the pool is already shut down
+        try:
+            while True:
+                pending = loop.run_in_executor(self._executor, next, records, None)
+                record = await pending
+                if record is None:
+                    return
+                yield record
+        finally:
+            # closing the generator releases its connection; it must not run while a worker
+            # is still inside next() (the client went away mid-batch)
+            if pending is not None and not pending.done():
+                pending.add_done_callback(close)
+            else:
+                close()
+
+    def _run_queued(self, enqueued: float, user_query: str, **options):
+        with self._exec_lock:
+            self._queued -= 1
+            self._active += 1
+            self._queue_waits.append(time.perf_counter() - enqueued)
+        try:
+            return self.process_query(user_query, **options)
+        finally:
+            with self._exec_lock:
+                self._active -= 1
+                self._completed += 1
 
-    def _execute_sql(self, sql_text: str, params: Dict[str, Any]):
-        with self.engine.connect() as conn:
-            r = conn.execute(text(sql_text), params)
-            return [dict(row) for row in r.fetchall()]
+    def execution_stats(self) -> Dict[str, Any]:
+        with self._exec_lock:
+            waits = sorted(self._queue_waits)
+            return {
+                "workers": QUERY_WORKERS,
+                "active": self._active,
+                "queued": self._queued,
+                "completed": self._completed,
+                "pool_timeouts": self._pool_timeouts,
+                "queue_wait_ms": {
+                    "avg": round(1000.0 * sum(waits) / len(waits), 3) if waits else 0.0,
+                    "p95": round(1000.0 * waits[int(0.95 * (len(waits) - 1))], 3) if waits else 0.0,
+                    "max": round(1000.0 * waits[-1], 3) if waits else 0.0,
+                },
+                "db_pool": pool_stats(self.engine),
+            }
 
-    def process_query(self, user_query: str):
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+        self._branch_executor.shutdown(wait=False)
+        self.engine.dispose()
+
+    def _cache_version(self) -> Tuple[int, int]:
+        return self.data_version, self.doc_processor.index_version
+
+    def process_query(self, user_query: str, nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+                      page_size: Optional[int] = None, page_token: Optional[str] = None):
+        """
+        Answer a question, first checking the semantic cache for the same or a
+        near-duplicate question asked since the data last changed. With ``page_size``
+        or ``page_token`` the SQL rows come back one page at a time together with a
+        ``next_page_token``.
+        """
         start = time.time()
+        paged = page_size is not None or page_token is not None
+        # explicit ANN knobs change the document hits, and pages differ per token; both bypass the cache
+        use_cache = self.semantic_cache.enabled and nprobe is None and ef_search is None and not paged
+        q_emb = None
+        if use_cache:
+            try:
+                version, key = self._cache_version(), self._semantic_key(user_query)
+                cached, similarity = self.semantic_cache.lookup_exact(user_query, version, key), 1.0
+                # don't make SQL-only traffic wait for the model while it is still warming up
+                if cached is None and self.doc_processor.model_loaded:
+                    q_emb = self.doc_processor.embed_query(user_query)
+                    hit = self.semantic_cache.lookup(user_query, q_emb, version, key)
+                    if hit is not None:
+                        cached, similarity = hit
+            except Exception as e:
+                print(f"[Cache] Semantic lookup failed: {e}")
+                cached, use_cache = None, False
+            if cached is not None:
+                out = dict(cached, query=user_query)
+                elapsed = time.time() - start
+                out["metrics"] = {
+                    "time_seconds": round(elapsed, 3),
+                    "cache_hit": True,
+                    "semantic_cache": {"similarity": round(similarity, 4), "matched_query": cached["query"]},
+                }
+                self.history.append({"q": user_query, "type": out["type"], "time": elapsed})
+                return out
+
+        out = self._answer(user_query, start, nprobe=nprobe, ef_search=ef_search, query_embedding=q_emb,
+                           page_size=page_size, page_token=page_token)
+        if use_cache and "error" not in out and not out.get("partial"):
+            self.semantic_cache.store(user_query, q_emb, version, out, key)
+        return out
+
+    def _sql_branch(self, user_query: str, page_size: Optional[int], page_token: Optional[str],
+                    deadline: Optional[float] = None):
+        """Returns ``(rows, cache_hit, next_page_token)``."""
+        sql_text, params = self._build_sql(user_query)
+        if not sql_text:
+            return [], False, None
+        if page_size is not None or page_token is not None:
+            return self._paged_sql(user_query, sql_text, params, page_size, page_token, deadline)
+        rows, cache_hit = self._cached_sql(sql_text, params, deadline)
+        return rows, cache_hit, None
+
+    @staticmethod
+    def _timed(fn, *args, **kwargs):
+        started = time.perf_counter()
+        value = fn(*args, **kwargs)
+        return value, round(1000.0 * (time.perf_counter() - started), 3)
+
+    def _answer(self, user_query: str, start: float, nprobe: Optional[int] = None,
+                ef_search: Optional[int] = None, query_embedding=None,
+                page_size: Optional[int] = None, page_token: Optional[str] = None):
+        """
+        Run the SQL and document branches. A hybrid question runs them concurrently, each
+        with its own deadline, and an answer whose branch timed out or failed comes back
+        with what finished, ``partial: True`` and the reason in ``metrics.branches``. A
+        question with a single branch runs it on the calling worker without a deadline.
+        """
         qtype = self.classify_query(user_query)
         out = {"query": user_query, "type": qtype, "results": None, "docs": None, "metrics": {}}
-        try:
-            if qtype in ("sql", "hybrid"):
-                sql_text, params = self._build_sql(user_query)
-                if sql_text:
-                    if params:
-                        rows = self._execute_sql(sql_text, params)
-                    else:
-                        rows = self._cached_sql_no_params(sql_text)
-                    out["results"] = rows
-                else:
-                    out["results"] = []
-            if qtype in ("doc", "hybrid"):
-                docs = self.doc_processor.search(user_query, top_k=6)
-                out["docs"] = docs
-            elapsed = time.time() - start
-            out["metrics"]["time_seconds"] = round(elapsed, 3)
-            out["metrics"]["cache_hit"] = False  # for MVP
-            # history
-            self.history.append({"q": user_query, "type": qtype, "time": elapsed})
-            return out
-        except Exception as e:
-            return {"error": str(e)}
+        run_sql, run_docs = qtype in ("sql", "hybrid"), qtype in ("doc", "hybrid")
+        hybrid = run_sql and run_docs
+        search = partial(self._timed, self.doc_processor.search, user_query, top_k=6, nprobe=nprobe,
+                         ef_search=ef_search, query_embedding=query_embedding)
+        submitted = time.perf_counter()
+        # the SQL branch stays on this worker (the database enforces its deadline), so a
+        # hybrid question takes one extra thread, for the document search
+        docs_future = self._branch_executor.submit(search) if hybrid else None
+
+        cache_hit = False
+        timings: Dict[str, Dict[str, Any]] = {}
+        errors: List[str] = []
+
+        def settle(name: str, timeout: float, run):
+            try:
+                value, ms = run()
+            except FutureTimeoutError:
+                timings[name] = {"status": "timeout", "ms": round(1000.0 * timeout, 3)}
+                errors.append(f"{name} branch timed out after {timeout}s")
+                return None
+            except Exception as e:
+                timings[name] = {"status": "error", "ms": round(1000.0 * (time.perf_counter() - submitted), 3)}
+                errors.append(str(e))
+                return None
+            timings[name] = {"status": "ok", "ms": ms}
+            return value
+
+        def wait_docs():
+            try:
+                value, ms = docs_future.result(
+                    timeout=max(0.0, submitted + DOC_BRANCH_TIMEOUT_SECONDS - time.perf_counter())
+                )
+            except FutureTimeoutError:
+                # a search can't be interrupted; it finishes in the background and is discarded
+                docs_future.cancel()
+                raise
+            if ms > 1000.0 * DOC_BRANCH_TIMEOUT_SECONDS:
+                raise FutureTimeoutError()
+            return value, ms
+
+        if run_sql:
+            deadline = submitted + SQL_BRANCH_TIMEOUT_SECONDS if hybrid else None
+            value = settle("sql", SQL_BRANCH_TIMEOUT_SECONDS,
+                           partial(self._timed, self._sql_branch, user_query, page_size, page_token, deadline))
+            if value is not None:
+                out["results"], cache_hit, next_token = value
+                if next_token is not None or page_size is not None or page_token is not None:
+                    out["next_page_token"] = next_token
+        if run_docs:
+            value = settle("docs", DOC_BRANCH_TIMEOUT_SECONDS, wait_docs if hybrid else search)
+            if value is not None:
+                out["docs"] = value
+
+        branches = [name for name, run in (("sql", run_sql), ("docs", run_docs)) if run]
+        if len(errors) == len(branches):
+            return {"error": errors[0]}
+        if errors:
+            out["partial"] = True
+            out["errors"] = errors
+        elapsed = time.time() - start
+        out["metrics"]["time_seconds"] = round(elapsed, 3)
+        out["metrics"]["cache_hit"] = cache_hit
+        out["metrics"]["branches"] = timings
+        # history
+        self.history.append({"q": user_query, "type": qtype, "time": elapsed})
+        return out
 
     def optimize_sql_query(self, sql: str) -> str:
         # minimal optimizations: add LIMIT if missing
@@ -0,0 +1,31 @@
+import threading
+from typing import Optional
+
+from services.document_processor import DocumentProcessor
+
+# One DocumentProcessor per process: both the ingestion and query routers share
+# the same embedding model, FAISS index and chunk metadata.
+_processor: Optional[DocumentProcessor] = None
+_lock = threading.Lock()
+
+
+def get_document_processor() -> DocumentProcessor:
+    global _processor
+    if _processor is None:
+        with _lock:
+            if _processor is None:
+                _processor = DocumentProcessor()
+    return _processor
+
+
+def warm_up_in_background() -> threading.Thread:
+    """Build the shared processor and load its model off the request path."""
+    def _warm():
+        try:
+            get_document_processor().warm_up()
+        except Exception as e:
+            print(f"[Embedding] Background warm-up failed: {e}")
+
+    t = threading.Thread(target=_warm, name="embedding-warmup", daemon=True)
+    t.start()
+    return t
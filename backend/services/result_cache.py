@@ -0,0 +1,154 @@
+import os
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+# 0 disables the cache
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "300"))
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# string literals and quoted identifiers are kept verbatim when normalizing
+_QUOTED_RE = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")")
+_TABLE_RE = re.compile(r"\b(?:from|join)\s+((?:[\"`\[]?\w+[\"`\]]?\.)?[\"`\[]?\w+[\"`\]]?)", re.I)
+
+
+def normalize_sql(sql: str) -> str:
+    """Collapse whitespace and case outside quoted text so trivially different SQL shares a key."""
+    parts = _QUOTED_RE.split(sql.strip().rstrip(";"))
+    return "".join(p if i % 2 else " ".join(p.split()).lower() for i, p in enumerate(parts))
+
+
+def tables_in(sql: str) -> Set[str]:
+    """Tables named after FROM/JOIN, lower-cased and without schema prefix or quotes."""
+    return {m.group(1).split(".")[-1].strip("\"`[]").lower() for m in _TABLE_RE.finditer(sql)}
+
+
+def _cache_key(sql: str, params: Optional[Dict[str, Any]]) -> Tuple[str, Tuple[Tuple[str, str], ...]]:
+    # repr keeps 1 and "1" apart and makes list values hashable
+    return normalize_sql(sql), tuple(sorted((k, repr(v)) for k, v in (params or {}).items()))
+
+
+def _estimate_size(rows: List[Dict[str, Any]]) -> int:
+    size = sys.getsizeof(rows)
+    for row in rows:
+        size += sys.getsizeof(row) + sum(sys.getsizeof(v) for v in row.values())
+    return size
+
+
+class ResultCache:
+    """
+    In-memory SQL result cache keyed by normalized SQL text + bound parameters. Entries
+    expire after ``ttl`` seconds, the least recently used ones are evicted beyond
+    ``max_bytes``, and every entry is tagged with the tables its statement reads so a
+    table rewrite (e.g. a CSV re-ingest) drops exactly the affected results.
+    """
+
+    def __init__(self, ttl: float = CACHE_TTL_SECONDS, max_bytes: int = RESULT_CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Any, Tuple[List[Dict[str, Any]], Set[str], float, int]]" = OrderedDict()
+        self._by_table: Dict[str, Set[Any]] = {}
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        # bumped by every invalidation; a result computed across one is not stored
+        self.generation = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_bytes > 0
+
+    def get(self, sql: str, params: Optional[Dict[str, Any]] = None) -> Optional[List[Dict[str, Any]]]:
+        if not self.enabled:
+            return None
+        key = _cache_key(sql, params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            rows, _, expires, _ = entry
+            if expires <= time.monotonic():
+                self._drop(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return list(rows)
+
+    def put(self, sql: str, params: Optional[Dict[str, Any]], rows: List[Dict[str, Any]],
+            generation: Optional[int] = None):
+        """Store ``rows``; pass the ``generation`` read before executing to avoid caching stale data."""
+        if not self.enabled:
+            return
+        size = _estimate_size(rows)
+        if size > self.max_bytes:
+            return
+        key = _cache_key(sql, params)
+        tables = tables_in(sql)
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (list(rows), tables, time.monotonic() + self.ttl, size)
+            for table in tables:
+                self._by_table.setdefault(table, set()).add(key)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes and self._entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate_tables(self, tables: Iterable[str]) -> int:
+        """Drop every cached result that read any of ``tables``; returns how many were dropped."""
+        dropped = 0
+        with self._lock:
+            for table in {t.lower() for t in tables}:
+                for key in list(self._by_table.get(table, ())):
+                    self._drop(key)
+                    dropped += 1
+            self.invalidations += dropped
+            self.generation += 1
+        return dropped
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_table.clear()
+            self.total_bytes = 0
+            self.generation += 1
+
+    def _drop(self, key):
+        _, tables, _, size = self._entries.pop(key)
+        self.total_bytes -= size
+        for table in tables:
+            keys = self._by_table.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_table[table]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "ttl_seconds": self.ttl,
+                "entries": len(self._entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
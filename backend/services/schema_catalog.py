@@ -0,0 +1,274 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Collection, Dict, List, Optional
+
+from sqlalchemy import bindparam, inspect, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.pool import StaticPool
+
+from services.db_pool import DB_POOL_SIZE, create_pooled_engine
+
+# concurrent "SELECT * ... LIMIT n" sample queries during discovery (capped by the pool size)
+SCHEMA_SAMPLE_WORKERS = int(os.getenv("SCHEMA_SAMPLE_WORKERS", "8"))
+SCHEMA_SAMPLE_ROWS = int(os.getenv("SCHEMA_SAMPLE_ROWS", "5"))
+# pooled engines kept for recently analyzed databases; the least recently used is disposed
+SCHEMA_ENGINE_CACHE_SIZE = int(os.getenv("SCHEMA_ENGINE_CACHE_SIZE", "8"))
+
+_engines: "OrderedDict[str, Engine]" = OrderedDict()
+_engines_lock = threading.Lock()
+
+_SQLITE_COLUMNS = """
+    SELECT m.name AS table_name, p.name, p.type, p."notnull" AS not_null, p.dflt_value, p.pk
+    FROM sqlite_master m JOIN pragma_table_info(m.name) p
+    WHERE m.type = 'table' AND m.name NOT LIKE 'sqlite~_%' ESCAPE '~' {only}
+    ORDER BY m.name, p.cid
+"""
+_SQLITE_FOREIGN_KEYS = """
+    SELECT m.name AS table_name, f.id, f."table" AS referred_table, f."from" AS col, f."to" AS referred_col
+    FROM sqlite_master m JOIN pragma_foreign_key_list(m.name) f
+    WHERE m.type = 'table' AND m.name NOT LIKE 'sqlite~_%' ESCAPE '~' {only}
+    ORDER BY m.name, f.id, f.seq
+"""
+_SQLITE_DDL = """
+    SELECT name, sql FROM sqlite_master
+    WHERE type = 'table' AND name NOT LIKE 'sqlite~_%' ESCAPE '~'
+"""
+# format_type spells types the way DDL does, with precision, arrays and domains intact
+_PG_COLUMNS = """
+    SELECT c.relname AS table_name, a.attname AS name, format_type(a.atttypid, a.atttypmod) AS data_type,
+           tn.nspname = 'pg_catalog' AS builtin_type, NOT a.attnotnull AS nullable,
+           pg_get_expr(d.adbin, d.adrelid) AS column_default
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+    JOIN pg_type ty ON ty.oid = a.atttypid
+    JOIN pg_namespace tn ON tn.oid = ty.typnamespace
+    LEFT JOIN pg_attrdef d ON d.adrelid = c.oid AND d.adnum = a.attnum
+    WHERE n.nspname = current_schema() AND c.relkind IN ('r', 'p') {only}
+    ORDER BY c.relname, a.attnum
+"""
+# pg_constraint keeps the column pairing of composite keys, which information_schema loses
+_PG_FOREIGN_KEYS = """
+    SELECT cl.relname AS table_name, con.conname AS name, rns.nspname AS referred_schema,
+           rcl.relname AS referred_table, att.attname AS col, ratt.attname AS referred_col
+    FROM pg_constraint con
+    JOIN pg_class cl ON cl.oid = con.conrelid
+    JOIN pg_namespace ns ON ns.oid = cl.relnamespace
+    JOIN pg_class rcl ON rcl.oid = con.confrelid
+    JOIN pg_namespace rns ON rns.oid = rcl.relnamespace
+    CROSS JOIN LATERAL unnest(con.conkey, con.confkey) WITH ORDINALITY AS k(attnum, refnum, ord)
+    JOIN pg_attribute att ON att.attrelid = con.conrelid AND att.attnum = k.attnum
+    JOIN pg_attribute ratt ON ratt.attrelid = con.confrelid AND ratt.attnum = k.refnum
+    WHERE con.contype = 'f' AND ns.nspname = current_schema() {only}
+    ORDER BY cl.relname, con.conname, k.ord
+"""
+# Postgres keeps no DDL text or catalog change time (without track_commit_timestamp), so a
+# table's fingerprint is a hash of its column definitions and foreign key constraints
+_PG_DDL = """
+    SELECT c.relname AS name,
+           md5(string_agg(a.attname || ' ' || format_type(a.atttypid, a.atttypmod) || ' '
+                          || a.attnotnull::text || ' ' || coalesce(pg_get_expr(d.adbin, d.adrelid), ''),
+                          ',' ORDER BY a.attnum)
+               || coalesce((SELECT string_agg(pg_get_constraintdef(con.oid), ',' ORDER BY con.conname)
+                            FROM pg_constraint con WHERE con.conrelid = c.oid AND con.contype = 'f'), '')
+           ) AS ddl_hash
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+    LEFT JOIN pg_attrdef d ON d.adrelid = c.oid AND d.adnum = a.attnum
+    WHERE n.nspname = current_schema() AND c.relkind IN ('r', 'p')
+    GROUP BY c.oid, c.relname
+"""
+
+
+def get_engine(connection_string: str) -> Engine:
+    """
+    One pooled engine per connection string, shared by every discovery call and the
+    query engine. At most SCHEMA_ENGINE_CACHE_SIZE are kept; an evicted engine is
+    disposed, which closes its idle connections (holders can keep using it, it opens a
+    fresh pool on demand).
+    """
+    with _engines_lock:
+        engine = _engines.get(connection_string)
+        if engine is not None:
+            _engines.move_to_end(connection_string)
+            return engine
+        engine = _engines[connection_string] = create_pooled_engine(connection_string)
+        evicted = []
+        while len(_engines) > max(1, SCHEMA_ENGINE_CACHE_SIZE):
+            evicted.append(_engines.popitem(last=False)[1])
+    for old in evicted:
+        old.dispose()
+    return engine
+
+
+def reflect_tables(conn: Connection, only: Optional[Collection[str]] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    ``{table: {"columns": [...], "foreign_keys": [...]}}`` for every table (or just the
+    tables in ``only``), in table-name order. SQLite and Postgres read their catalogs in
+    two queries over ``conn``; other dialects fall back to the per-table inspector on the
+    same connection.
+    """
+    if only is not None and not only:
+        return {}
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        return _reflect_sqlite(conn, only)
+    if dialect == "postgresql":
+        return _reflect_postgres(conn, only)
+    return _reflect_inspector(conn, only)
+
+
+def _catalog_query(sql: str, table_column: str, only: Optional[Collection[str]]):
+    if only is None:
+        return text(sql.format(only=""))
+    stmt = text(sql.format(only=f"AND {table_column} IN :only"))
+    return stmt.bindparams(bindparam("only", value=list(only), expanding=True))
+
+
+def fingerprint(conn: Connection) -> Optional[Dict[str, Any]]:
+    """
+    ``{"version": ..., "tables": {table: ddl hash}}`` identifying the current schema, or
+    None for dialects without a cheap way to tell (callers then re-analyze everything).
+    """
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        tables = {
+            name: hashlib.sha1((sql or "").encode("utf-8")).hexdigest()
+            for name, sql in conn.execute(text(_SQLITE_DDL))
+        }
+        return {"version": schema_version(conn), "tables": dict(sorted(tables.items()))}
+    if dialect == "postgresql":
+        tables = dict(sorted((name, ddl_hash) for name, ddl_hash in conn.execute(text(_PG_DDL))))
+        digest = hashlib.sha1(repr(sorted(tables.items())).encode("utf-8")).hexdigest()
+        return {"version": f"pg:{digest}", "tables": tables}
+    return None
+
+
+def schema_version(conn: Connection) -> Optional[str]:
+    """
+    Cheap whole-schema version where the dialect has one (SQLite bumps ``schema_version``
+    on every DDL statement). None means only a full ``fingerprint`` can tell.
+    """
+    if conn.dialect.name == "sqlite":
+        return f"sqlite:{conn.execute(text('PRAGMA schema_version')).scalar()}"
+    return None
+
+
+def _fk(name, referred_schema, referred_table) -> Dict[str, Any]:
+    # same shape as Inspector.get_foreign_keys
+    return {"name": name, "constrained_columns": [], "referred_schema": referred_schema,
+            "referred_table": referred_table, "referred_columns": [], "options": {}}
+
+
+def _sqlite_type_name(conn: Connection, declared: Optional[str]) -> str:
+    # same type names the inspector reports ("INT" -> "INTEGER"); the affinity resolver is
+    # private to SQLAlchemy's dialect, so fall back to the declared type if it goes away
+    try:
+        return str(conn.dialect._resolve_type_affinity((declared or "").upper()))
+    except Exception:
+        return declared or ""
+
+
+def _reflect_sqlite(conn: Connection, only: Optional[Collection[str]]) -> Dict[str, Dict[str, Any]]:
+    tables: Dict[str, Dict[str, Any]] = {}
+    primary_keys: Dict[str, List[tuple]] = {}
+    for r in conn.execute(_catalog_query(_SQLITE_COLUMNS, "m.name", only)).mappings():
+        meta = tables.setdefault(r["table_name"], {"columns": [], "foreign_keys": []})
+        meta["columns"].append({
+            "name": r["name"],
+            "type": _sqlite_type_name(conn, r["type"]),
+            "nullable": not r["not_null"],
+            "default": r["dflt_value"],
+        })
+        if r["pk"]:
+            primary_keys.setdefault(r["table_name"], []).append((r["pk"], r["name"]))
+
+    by_id: Dict[tuple, Dict[str, Any]] = {}
+    for r in conn.execute(_catalog_query(_SQLITE_FOREIGN_KEYS, "m.name", only)).mappings():
+        key = (r["table_name"], r["id"])
+        fk = by_id.get(key)
+        if fk is None:
+            fk = by_id[key] = _fk(None, None, r["referred_table"])
+            tables[r["table_name"]]["foreign_keys"].append(fk)
+        fk["constrained_columns"].append(r["col"])
+        if r["referred_col"] is not None:
+            fk["referred_columns"].append(r["referred_col"])
+    for fk in by_id.values():
+        # "REFERENCES t" without columns points at t's primary key
+        if not fk["referred_columns"] and fk["referred_table"] not in primary_keys and only is not None:
+            for r in conn.execute(text("SELECT name, pk FROM pragma_table_info(:t) WHERE pk > 0"),
+                                  {"t": fk["referred_table"]}):
+                primary_keys.setdefault(fk["referred_table"], []).append((r.pk, r.name))
+        if not fk["referred_columns"]:
+            fk["referred_columns"] = [c for _, c in sorted(primary_keys.get(fk["referred_table"], []))]
+    return tables
+
+
+def _reflect_postgres(conn: Connection, only: Optional[Collection[str]]) -> Dict[str, Dict[str, Any]]:
+    tables: Dict[str, Dict[str, Any]] = {}
+    for r in conn.execute(_catalog_query(_PG_COLUMNS, "c.relname", only)).mappings():
+        meta = tables.setdefault(r["table_name"], {"columns": [], "foreign_keys": []})
+        meta["columns"].append({
+            "name": r["name"],
+            # user-defined type names are case-sensitive; only built-ins are upper-cased
+            "type": r["data_type"].upper() if r["builtin_type"] else r["data_type"],
+            "nullable": r["nullable"],
+            "default": r["column_default"],
+        })
+
+    schema = conn.execute(text("SELECT current_schema()")).scalar()
+    by_name: Dict[tuple, Dict[str, Any]] = {}
+    for r in conn.execute(_catalog_query(_PG_FOREIGN_KEYS, "cl.relname", only)).mappings():
+        if r["table_name"] not in tables:
+            continue
+        key = (r["table_name"], r["name"])
+        fk = by_name.get(key)
+        if fk is None:
+            referred_schema = None if r["referred_schema"] == schema else r["referred_schema"]
+            fk = by_name[key] = _fk(r["name"], referred_schema, r["referred_table"])
+            tables[r["table_name"]]["foreign_keys"].append(fk)
+        fk["constrained_columns"].append(r["col"])
+        fk["referred_columns"].append(r["referred_col"])
+    return dict(sorted(tables.items()))
+
+
+def _reflect_inspector(conn: Connection, only: Optional[Collection[str]]) -> Dict[str, Dict[str, Any]]:
+    inspector = inspect(conn)
+    tables = {}
+    for table_name in inspector.get_table_names():
+        if only is not None and table_name not in only:
+            continue
+        cols = [
+            {"name": c["name"], "type": str(c["type"]), "nullable": c.get("nullable", True), "default": c.get("default")}
+            for c in inspector.get_columns(table_name)
+        ]
+        tables[table_name] = {"columns": cols, "foreign_keys": inspector.get_foreign_keys(table_name)}
+    return tables
+
+
+def sample_rows(engine: Engine, table_names: List[str], limit: int = SCHEMA_SAMPLE_ROWS,
+                workers: Optional[int] = None) -> Dict[str, List[Dict[str, Any]]]:
+    """First ``limit`` rows of each table, fetched concurrently on a bounded pool."""
+    quote = engine.dialect.identifier_preparer.quote
+
+    def fetch(table_name: str) -> List[Dict[str, Any]]:
+        try:
+            with engine.connect() as conn:
+                r = conn.execute(text(f"SELECT * FROM {quote(table_name)} LIMIT {int(limit)}"))
+                return [dict(row._mapping) for row in r.fetchall()]
+        except Exception as e:
+            print(f"Error getting sample data from {table_name}: {e}")
+            return []
+
+    if not table_names:
+        return {}
+    workers = max(1, min(workers or SCHEMA_SAMPLE_WORKERS, DB_POOL_SIZE, len(table_names)))
+    if isinstance(engine.pool, StaticPool):
+        # a single shared connection (in-memory SQLite) can't serve threads side by side
+        workers = 1
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="schema-sample") as pool:
+        return dict(zip(table_names, pool.map(fetch, table_names)))
@@ -1,8 +1,10 @@
 import sqlalchemy
-from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.engine import Engine
-from typing import Dict, Any, List
-import difflib
+from typing import Dict, Any, Iterable, List, Set, Tuple
+
+from services.column_profiler import SCHEMA_PROFILE, profile_tables
+from services.name_index import schema_name_index
+from services.schema_catalog import fingerprint, get_engine, reflect_tables, sample_rows, schema_version
 
 class SchemaDiscovery:
     def __init__(self):
@@ -12,65 +14,104 @@ class SchemaDiscovery:
     def analyze_database(self, connection_string: str) -> Dict[str, Any]:
         """
         Connects and produces JSON with tables, columns, FKs, sample rows.
+        Catalog metadata is read in bulk over one connection; sample rows are fetched
+        concurrently.
         """
         try:
-            self.engine = create_engine(connection_string, future=True)
-            inspector = inspect(self.engine)
-            tables = {}
-            
-            table_names = inspector.get_table_names()
-            if not table_names:
+            self.engine = get_engine(connection_string)
+            with self.engine.connect() as conn:
+                fp = fingerprint(conn)
+                reflected = reflect_tables(conn)
+            if not reflected:
                 return {"tables": {}, "error": "No tables found in database"}
-            
-            for table_name in table_names:
-                cols = []
-                for col in inspector.get_columns(table_name):
-                    cols.append({"name": col["name"], "type": str(col["type"])})
-                fks = inspector.get_foreign_keys(table_name)
-                
-                # sample rows
-                sample = []
-                with self.engine.connect() as conn:
-                    try:
-                        r = conn.execute(text(f"SELECT * FROM {table_name} LIMIT 5"))
-                        sample = [dict(row._mapping) for row in r.fetchall()]
-                    except Exception as e:
-                        print(f"Error getting sample data from {table_name}: {e}")
-                        sample = []
-                
-                tables[table_name] = {"columns": cols, "foreign_keys": fks, "sample": sample}
-            
-            self.schema_snapshot = {"tables": tables}
+
+            tables = self._table_entries(reflected)
+
+            self.schema_snapshot = {"tables": tables, "fingerprint": fp}
             return self.schema_snapshot
-            
+
         except Exception as e:
             print(f"Error in analyze_database: {e}")
             return {"tables": {}, "error": str(e)}
 
+    def refresh(self, connection_string: str, previous: Dict[str, Any],
+                changed_tables: Iterable[str] = ()) -> Tuple[Dict[str, Any], Set[str]]:
+        """
+        Brings ``previous`` (an ``analyze_database`` result) up to date and returns
+        ``(schema, changed table names)``. Only tables whose fingerprint moved, plus
+        ``changed_tables`` (rewritten data, same DDL), are re-analyzed; when nothing changed
+        ``previous`` itself comes back with an empty set. Tables without sample rows (as
+        loaded from a saved snapshot) only get their samples re-read, keeping their saved
+        stats, and don't count as changed. Without
+        a usable fingerprint this is a full ``analyze_database``. Errors reaching the
+        database propagate, so a caller never mistakes ``previous`` for a revalidated schema.
+        """
+        old_fp = (previous or {}).get("fingerprint")
+        forced = set(changed_tables)
+        unsampled = {t for t, meta in (previous or {}).get("tables", {}).items() if "sample" not in meta}
+        self.engine = get_engine(connection_string)
+        with self.engine.connect() as conn:
+            # SQLite answers "did any DDL run" with one pragma, before hashing every table
+            version = schema_version(conn)
+            if old_fp and not forced and not unsampled and version is not None and version == old_fp["version"]:
+                return previous, set()
+            new_fp = fingerprint(conn)
+            if not old_fp or not new_fp or previous.get("error"):
+                schema = self.analyze_database(connection_string)
+                return schema, set(schema.get("tables", {})) | set(previous.get("tables", {}))
+
+            old_hashes, new_hashes = old_fp["tables"], new_fp["tables"]
+            changed = {t for t, h in new_hashes.items() if old_hashes.get(t) != h}
+            changed |= forced & set(new_hashes)
+            dropped = set(old_hashes) - set(new_hashes)
+            resample = sorted((unsampled & set(new_hashes)) - changed)
+            if not changed and not dropped and not resample:
+                return (previous if new_fp == old_fp else {**previous, "fingerprint": new_fp}), set()
+            reflected = reflect_tables(conn, only=changed)
+
+        tables = {t: meta for t, meta in previous["tables"].items() if t not in dropped}
+        if resample:
+            samples = sample_rows(self.engine, resample)
+            tables.update({t: {**tables[t], "sample": samples[t]} for t in resample})
+        tables.update(self._table_entries(reflected))
+        # keep table-name order, as a full analyze would
+        self.schema_snapshot = {"tables": dict(sorted(tables.items())), "fingerprint": new_fp}
+        return self.schema_snapshot, changed | dropped
+
+    def _table_entries(self, reflected: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """Schema entries for reflected tables: columns, FKs, sample rows and (optionally) stats."""
+        samples = sample_rows(self.engine, list(reflected))
+        stats = profile_tables(self.engine, reflected) if SCHEMA_PROFILE else {}
+        tables = {}
+        for table_name, meta in reflected.items():
+            cols = [{"name": c["name"], "type": c["type"]} for c in meta["columns"]]
+            tables[table_name] = {"columns": cols, "foreign_keys": meta["foreign_keys"], "sample": samples[table_name]}
+            if stats.get(table_name):
+                tables[table_name]["stats"] = stats[table_name]
+        return tables
+
     def map_natural_language_to_schema(self, query: str, schema: Dict[str, Any]) -> Dict[str, Any]:
         """
         Naive mapping: find candidate tables/columns by fuzzy match.
         """
         words = [w.strip(",.()\"'").lower() for w in query.split()]
+        # close matches come from indexes built once per schema; same results as difflib
         candidates = {"tables": [], "columns": []}
-        all_tables = list(schema.get("tables", {}).keys())
-        all_cols = []
-        for t, meta in schema.get("tables", {}).items():
-            for c in meta["columns"]:
-                all_cols.append((t, c["name"]))
+        index = schema_name_index(schema)
+        seen = set()
         # table matches
         for w in words:
-            tmatches = difflib.get_close_matches(w, all_tables, n=3, cutoff=0.6)
+            tmatches = index.tables.close_matches(w, n=3, cutoff=0.6)
             for tm in tmatches:
                 if tm not in candidates["tables"]:
                     candidates["tables"].append(tm)
         # column matches
-        colnames = [c[1] for c in all_cols]
         for w in words:
-            cmatches = difflib.get_close_matches(w, colnames, n=5, cutoff=0.6)
+            cmatches = index.columns.close_matches(w, n=5, cutoff=0.6)
             for cm in cmatches:
-                # find table(s) for this column
-                for t, col in all_cols:
-                    if col == cm and {"table": t, "column": col} not in candidates["columns"]:
-                        candidates["columns"].append({"table": t, "column": col})
+                # tables that have this column, in schema order
+                for t in index.column_tables[cm]:
+                    if (t, cm) not in seen:
+                        seen.add((t, cm))
+                        candidates["columns"].append({"table": t, "column": cm})
         return candidates
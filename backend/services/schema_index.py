@@ -0,0 +1,109 @@
+import re
+import threading
+from bisect import bisect_left
+from collections import Counter
+from typing import Any, Dict, FrozenSet, List, Optional
+
+# column roles the NL→SQL heuristics look for; patterns are matched case-insensitively
+ROLE_PATTERNS = {
+    "name": re.compile(r"name|full_?name|first|last", re.I),
+    "dept": re.compile(r"dept|department", re.I),
+    "salary": re.compile(r"salary|pay|comp", re.I),
+    "date": re.compile(r"hire|date", re.I),
+}
+SKILL_COLUMNS = ("skills", "skill", "notes", "bio", "description", "role")
+# distinct query words remembered per index
+_WORD_MEMO_MAX = 4096
+
+
+class SchemaIndex:
+    """
+    Lookup structures built once per schema snapshot for table and column selection.
+
+    * A suffix array over the distinct lower-cased column names answers "which tables
+      have a column containing this substring" in O(log n) instead of scanning every
+      column of every table per query word.
+    * Per table, the columns playing each role (name, dept, salary, date, skill, id),
+      in schema order.
+    """
+
+    def __init__(self, schema: Optional[Dict[str, Any]]):
+        tables = (schema or {}).get("tables", {})
+        self.tables: List[str] = list(tables)
+        self.columns: Dict[str, List[str]] = {
+            t: [c["name"] for c in meta.get("columns", [])] for t, meta in tables.items()
+        }
+        self.roles: Dict[str, Dict[str, List[str]]] = {t: self._roles(t, cols) for t, cols in self.columns.items()}
+
+        # column name -> positions of the tables that have it
+        owners: Dict[str, set] = {}
+        for pos, table in enumerate(self.tables):
+            for col in self.columns[table]:
+                owners.setdefault(col.lower(), set()).add(pos)
+        self._names = list(owners)
+        self._owners = [frozenset(owners[n]) for n in self._names]
+        suffixes = []
+        for name_id, name in enumerate(self._names):
+            for start in range(len(name)):
+                suffixes.append((name[start:], name_id))
+        suffixes.sort()
+        self._suffixes = [s for s, _ in suffixes]
+        self._suffix_names = [n for _, n in suffixes]
+        self._memo: Dict[str, FrozenSet[int]] = {}
+        self._memo_lock = threading.Lock()
+
+    @staticmethod
+    def _roles(table: str, cols: List[str]) -> Dict[str, List[str]]:
+        roles = {role: [c for c in cols if pattern.search(c)] for role, pattern in ROLE_PATTERNS.items()}
+        roles["skill"] = [c for c in cols if c.lower() in SKILL_COLUMNS]
+        roles["id"] = [c for c in cols if c.lower() in ("id", f"{table}_id")]
+        return roles
+
+    def tables_with(self, term: str) -> FrozenSet[int]:
+        """Positions of tables with a column whose lower-cased name contains ``term``."""
+        found = self._memo.get(term)
+        if found is not None:
+            return found
+        positions = set()
+        if term:
+            i = bisect_left(self._suffixes, term)
+            while i < len(self._suffixes) and self._suffixes[i].startswith(term):
+                positions |= self._owners[self._suffix_names[i]]
+                i += 1
+        else:
+            # "" is a substring of every name
+            positions = {p for owners in self._owners for p in owners}
+        found = frozenset(positions)
+        with self._memo_lock:
+            if len(self._memo) >= _WORD_MEMO_MAX:
+                self._memo.clear()
+            self._memo[term] = found
+        return found
+
+    def any_column_contains(self, term: str) -> bool:
+        return bool(self.tables_with(term))
+
+    def best_table(self, q: str, terms, words: List[str]) -> Optional[str]:
+        """
+        Table with the highest keyword score for lower-cased question ``q``: 2 points per
+        business ``term`` present in both the question and a column name, 1 point per
+        question word found in a column name. Ties go to the earliest table.
+        """
+        if not self.tables:
+            return None
+        scores: Counter = Counter()
+        for term in terms:
+            if term in q:
+                for pos in self.tables_with(term):
+                    scores[pos] += 2
+        for word, n in Counter(words).items():
+            for pos in self.tables_with(word):
+                scores[pos] += n
+        if not scores:
+            return self.tables[0]
+        best = max(scores.items(), key=lambda kv: (kv[1], -kv[0]))[0]
+        return self.tables[best]
+
+    def first(self, table: str, role: str) -> Optional[str]:
+        cols = self.roles.get(table, {}).get(role)
+        return cols[0] if cols else None
@@ -0,0 +1,106 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, Optional
+
+# discovered schemas are kept here between runs; "" turns the snapshot cache off
+SCHEMA_CACHE_DIR = os.getenv("SCHEMA_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "nlq_schema_cache"))
+_SNAPSHOT_FORMAT = 3
+# row values rather than structure or aggregates: re-read from the database instead of persisted
+_DATA_KEYS = ("sample",)
+_COLUMN_DATA_KEYS = ("mcv",)
+
+
+def snapshot_path(connection_string: str) -> str:
+    # hashed so credentials in the URL never end up in a file name
+    digest = hashlib.sha256(connection_string.encode("utf-8")).hexdigest()
+    return os.path.join(SCHEMA_CACHE_DIR, f"{digest}.json")
+
+
+def _cache_dir_usable() -> bool:
+    """
+    Create SCHEMA_CACHE_DIR private to this user if missing. A directory owned by another
+    user or writable by group/others is refused: its snapshots could have been planted.
+    """
+    if not SCHEMA_CACHE_DIR:
+        return False
+    try:
+        os.makedirs(SCHEMA_CACHE_DIR, mode=0o700, exist_ok=True)
+        st = os.stat(SCHEMA_CACHE_DIR)
+    except OSError as e:
+        print(f"[SchemaSnapshot] Cannot use {SCHEMA_CACHE_DIR}: {e}")
+        return False
+    if hasattr(os, "getuid") and (st.st_uid != os.getuid() or st.st_mode & 0o022):
+        print(f"[SchemaSnapshot] Ignoring {SCHEMA_CACHE_DIR}: not owned by this user or writable by others")
+        return False
+    return True
+
+
+def load_snapshot(connection_string: str) -> Optional[Dict[str, Any]]:
+    """
+    Last schema saved for ``connection_string``, or None. Unreadable files count as missing.
+    Tables come back without sample rows; ``SchemaDiscovery.refresh`` fills them in.
+    """
+    if not _cache_dir_usable():
+        return None
+    try:
+        with open(snapshot_path(connection_string), "r", encoding="utf-8") as f:
+            payload = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if payload.get("format") != _SNAPSHOT_FORMAT or not isinstance(payload.get("schema"), dict):
+        return None
+    return payload["schema"]
+
+
+def _without_row_data(meta: Dict[str, Any]) -> Dict[str, Any]:
+    meta = {k: v for k, v in meta.items() if k not in _DATA_KEYS}
+    if meta.get("stats"):
+        columns = {
+            name: {k: v for k, v in col.items() if k not in _COLUMN_DATA_KEYS}
+            for name, col in (meta["stats"].get("columns") or {}).items()
+        }
+        meta["stats"] = dict(meta["stats"], columns=columns)
+    return meta
+
+
+def save_snapshot(connection_string: str, schema: Dict[str, Any]):
+    """
+    Persist a discovered schema's structure (columns, FKs, fingerprint) and aggregate column
+    stats in a file only this user can read. Sample rows and most common values are left
+    out. Failed discoveries are not saved.
+    """
+    if not schema or schema.get("error") or not _cache_dir_usable():
+        return
+    tables = {name: _without_row_data(meta) for name, meta in schema.get("tables", {}).items()}
+    path = snapshot_path(connection_string)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with open(fd, "w", encoding="utf-8") as f:
+            json.dump({"format": _SNAPSHOT_FORMAT, "schema": {**schema, "tables": tables}}, f, default=str)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"[SchemaSnapshot] Could not save {path}: {e}")
+
+
+def discover(schema_discovery, connection_string: str) -> Dict[str, Any]:
+    """
+    Schema for ``connection_string``, starting from the saved snapshot when there is one:
+    only tables whose fingerprint changed since are re-analyzed. The result is saved back.
+    If the database can't be reached the snapshot is returned marked ``stale`` with the error.
+    """
+    cached = load_snapshot(connection_string)
+    if cached is None:
+        schema = schema_discovery.analyze_database(connection_string)
+        save_snapshot(connection_string, schema)
+        return schema
+    try:
+        schema, changed = schema_discovery.refresh(connection_string, cached)
+    except Exception as e:
+        print(f"[SchemaSnapshot] Could not revalidate snapshot: {e}")
+        return {**cached, "stale": True, "error": str(e)}
+    if changed:
+        save_snapshot(connection_string, schema)
+    return schema
@@ -0,0 +1,157 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from services.result_cache import CACHE_TTL_SECONDS
+
+# cosine similarity above which two questions are treated as the same (1.0 disables fuzzy hits)
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_TTL_SECONDS = float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", str(CACHE_TTL_SECONDS)))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "2048"))
+# nearest cached questions checked per lookup
+_CANDIDATES = 4
+
+def _normalize_text(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+class SemanticCache:
+    """
+    Answers for previously seen questions, found by embedding similarity. Query embeddings
+    live in a small flat inner-product index; a lookup returns the answer of the nearest
+    live entry whose similarity clears ``threshold``. Embeddings blur literals ("over 80k"
+    vs "over 90k", "in Sales" vs "in Marketing"), so every entry carries a ``key`` from the
+    caller (the query type, SQL and bound parameters) and a hit also requires that key
+    to match exactly.
+
+    Each entry records the data ``version`` it was computed against; a lookup with a
+    different version treats it as a miss, so ingests invalidate without a scan.
+    """
+
+    def __init__(self, threshold: float = SEMANTIC_CACHE_THRESHOLD, ttl: float = SEMANTIC_CACHE_TTL_SECONDS,
+                 max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._index = None
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._by_text: Dict[str, int] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_entries > 0
+
+    def lookup_exact(self, query: str, version: Hashable, key: Hashable) -> Optional[Dict[str, Any]]:
+        """Cheap pre-check for verbatim repeats, before paying for an embedding."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry_id = self._by_text.get(_normalize_text(query))
+            if entry_id is None or not self._live(entry_id, version) or self._entries[entry_id]["key"] != key:
+                return None
+            self.exact_hits += 1
+            return self._entries[entry_id]["answer"]
+
+    def lookup(self, query: str, embedding: np.ndarray, version: Hashable,
+               key: Hashable) -> Optional[Tuple[Dict[str, Any], float]]:
+        """Nearest cached answer with the same ``key`` as ``(answer, similarity)``, or None."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            if self._index is None or self._index.ntotal == 0 or self._index.d != embedding.shape[-1]:
+                self.misses += 1
+                return None
+            k = min(_CANDIDATES, self._index.ntotal)
+            D, I = self._index.search(embedding.reshape(1, -1).astype("float32"), k)
+            for score, entry_id in zip(D[0], I[0]):
+                if entry_id < 0 or score < self.threshold:
+                    break
+                if self._live(int(entry_id), version) and self._entries[int(entry_id)]["key"] == key:
+                    self.semantic_hits += 1
+                    return self._entries[int(entry_id)]["answer"], float(score)
+            self.misses += 1
+            return None
+
+    def store(self, query: str, embedding: Optional[np.ndarray], version: Hashable, answer: Dict[str, Any],
+              key: Hashable):
+        if not self.enabled:
+            return
+        with self._lock:
+            text = _normalize_text(query)
+            if text in self._by_text:
+                self._remove(self._by_text[text])
+            entry_id = self._next_id
+            self._next_id += 1
+            if embedding is not None:
+                vec = embedding.reshape(1, -1).astype("float32")
+                if self._index is None or self._index.d != vec.shape[1]:
+                    self._reset_index(vec.shape[1])
+                self._index.add_with_ids(vec, np.array([entry_id], dtype="int64"))
+            self._entries[entry_id] = {
+                "text": text,
+                "key": key,
+                "version": version,
+                "expires": time.monotonic() + self.ttl,
+                "answer": answer,
+                "indexed": embedding is not None,
+            }
+            self._by_text[text] = entry_id
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_text.clear()
+            self._index = None
+
+    def _reset_index(self, dim: int):
+        # embedding dimension changed (new model); older entries can't be compared
+        self._entries.clear()
+        self._by_text.clear()
+        self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+
+    def _live(self, entry_id: int, version: Hashable) -> bool:
+        entry = self._entries.get(entry_id)
+        if entry is None:
+            return False
+        if entry["version"] != version or entry["expires"] <= time.monotonic():
+            self._remove(entry_id)
+            self.stale += 1
+            return False
+        return True
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        if self._by_text.get(entry["text"]) == entry_id:
+            del self._by_text[entry["text"]]
+        if entry["indexed"] and self._index is not None:
+            self._index.remove_ids(np.array([entry_id], dtype="int64"))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "threshold": self.threshold,
+                "ttl_seconds": self.ttl,
+                "entries": len(self._entries),
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "stale_evictions": self.stale,
+                "hit_rate": round((self.exact_hits + self.semantic_hits) / lookups, 4) if lookups else 0.0,
+            }
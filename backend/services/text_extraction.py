@@ -0,0 +1,172 @@
+import os
+import csv
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional, Tuple
+
+import pdfplumber
+from docx import Document
+
+# Kept free of embedding/index imports so spawned extraction workers start quickly
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "16"))
+
+
+def extract_pdf_page_range(path: str, start: int = 0, end: Optional[int] = None) -> List[str]:
+    text = []
+    with pdfplumber.open(path) as pdf:
+        for p in pdf.pages[start:end]:
+            t = p.extract_text()
+            if t:
+                text.append(t)
+    return text
+
+
+def pdf_page_count(path: str) -> int:
+    with pdfplumber.open(path) as pdf:
+        return len(pdf.pages)
+
+
+def extract_text_from_pdf(path: str) -> str:
+    return "\n".join(extract_pdf_page_range(path))
+
+
+def extract_text_from_docx(path: str) -> str:
+    doc = Document(path)
+    paras = [p.text for p in doc.paragraphs if p.text.strip()]
+    return "\n".join(paras)
+
+
+def extract_text_from_csv(path: str) -> str:
+    lines = []
+    try:
+        with open(path, "r", encoding="utf-8", errors="ignore", newline="") as f:
+            reader = csv.reader(f)
+            for row in reader:
+                if not row:
+                    continue
+                lines.append(", ".join([c.strip() for c in row if str(c).strip()]))
+        return "\n".join(lines)
+    except Exception:
+        # fallback to raw read
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            return f.read()
+
+
+def read_file_text(path: str) -> str:
+    ext = path.lower().split(".")[-1]
+    if ext == "pdf":
+        return extract_text_from_pdf(path)
+    elif ext in ("docx", "doc"):
+        return extract_text_from_docx(path)
+    elif ext in ("csv",):
+        return extract_text_from_csv(path)
+    else:
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            return f.read()
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            # spawn: the API process is multi-threaded, forking it is unsafe
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _pool_workers = workers
+        return _pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor):
+    # a worker died (e.g. OOM on a huge PDF); the executor refuses all further work
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+
+def shutdown_extraction_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+            _pool = None
+
+
+def extract_texts_parallel(paths: List[str], max_workers: Optional[int] = None,
+                           pages_per_task: int = PDF_PAGES_PER_TASK) -> List[Tuple[Optional[str], Optional[str]]]:
+    """
+    Extract text from many files on a process pool. Large PDFs are split into page
+    ranges that run concurrently and are re-joined in page order.
+    Returns one ``(text, error)`` pair per input path, in input order.
+    """
+    workers = max_workers or EXTRACT_WORKERS
+    if workers <= 1 or not paths:
+        results = []
+        for path in paths:
+            try:
+                results.append((read_file_text(path), None))
+            except Exception as e:
+                results.append((None, str(e)))
+        return results
+
+    pool = _get_pool(workers)
+    try:
+        return _extract_on_pool(pool, paths, pages_per_task)
+    except BrokenProcessPool:
+        _discard_pool(pool)
+    # once more on a fresh pool; if that dies too the batch is reported failed and the
+    # next call starts on yet another pool
+    pool = _get_pool(workers)
+    try:
+        return _extract_on_pool(pool, paths, pages_per_task)
+    except BrokenProcessPool as e:
+        _discard_pool(pool)
+        return [(None, f"extraction worker crashed: {e}")] * len(paths)
+
+
+def _extract_on_pool(pool: ProcessPoolExecutor, paths: List[str],
+                     pages_per_task: int) -> List[Tuple[Optional[str], Optional[str]]]:
+    is_pdf = [p.lower().endswith(".pdf") for p in paths]
+    whole = {i: pool.submit(read_file_text, p) for i, p in enumerate(paths) if not is_pdf[i]}
+    counts = {i: pool.submit(pdf_page_count, p) for i, p in enumerate(paths) if is_pdf[i]}
+
+    ranges = {}
+    for i, fut in counts.items():
+        try:
+            n_pages = fut.result()
+        except BrokenProcessPool:
+            raise
+        except Exception as e:
+            ranges[i] = e
+            continue
+        step = max(1, pages_per_task)
+        ranges[i] = [pool.submit(extract_pdf_page_range, paths[i], start, start + step)
+                     for start in range(0, max(n_pages, 1), step)]
+
+    results: List[Tuple[Optional[str], Optional[str]]] = []
+    for i in range(len(paths)):
+        try:
+            if i in whole:
+                results.append((whole[i].result(), None))
+            elif isinstance(ranges[i], Exception):
+                raise ranges[i]
+            else:
+                pages = []
+                for fut in ranges[i]:
+                    pages.extend(fut.result())
+                results.append(("\n".join(pages), None))
+        except BrokenProcessPool:
+            raise
+        except Exception as e:
+            results.append((None, str(e)))
+    return results
@@ -0,0 +1,126 @@
+import os
+import math
+from typing import Optional
+
+import faiss
+import numpy as np
+
+# auto | flat | ivf | hnsw | ivfpq
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "auto").lower()
+# auto mode: corpus sizes at which flat -> IVF -> IVF-PQ
+IVF_MIN_VECTORS = int(os.getenv("IVF_MIN_VECTORS", "50000"))
+IVFPQ_MIN_VECTORS = int(os.getenv("IVFPQ_MIN_VECTORS", "1000000"))
+# trained indexes stay flat until there is enough data to train on
+TRAIN_MIN_VECTORS = int(os.getenv("TRAIN_MIN_VECTORS", "2048"))
+# IVF-PQ trains 2**PQ_NBITS centroids per sub-quantizer and faiss wants >= 39 points for
+# each, so auto mode keeps plain IVF below 39 * 2**PQ_NBITS vectors
+PQ_NBITS = int(os.getenv("PQ_NBITS", "8"))
+# retrain IVF once the corpus has grown this many times past its training size
+RETRAIN_GROWTH = float(os.getenv("RETRAIN_GROWTH", "4"))
+HNSW_M = int(os.getenv("HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "80"))
+DEFAULT_NPROBE = int(os.getenv("IVF_NPROBE", "16"))
+DEFAULT_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+# cap on vectors sampled for training
+MAX_TRAIN_SAMPLE = int(os.getenv("MAX_TRAIN_SAMPLE", "262144"))
+
+INDEX_TYPES = ("flat", "ivf", "hnsw", "ivfpq")
+
+
+def pq_min_training_vectors(nbits: int = PQ_NBITS) -> int:
+    return 39 * (1 << nbits)
+
+
+def choose_index_type(n_vectors: int, configured: str = VECTOR_INDEX_TYPE) -> str:
+    if configured in ("ivf", "ivfpq"):
+        if n_vectors < TRAIN_MIN_VECTORS:
+            return "flat"
+        if configured == "ivfpq" and n_vectors < pq_min_training_vectors():
+            return "ivf"
+        return configured
+    if configured in ("flat", "hnsw"):
+        return configured
+    if n_vectors >= max(IVFPQ_MIN_VECTORS, pq_min_training_vectors()):
+        return "ivfpq"
+    if n_vectors >= IVF_MIN_VECTORS:
+        return "ivf"
+    return "flat"
+
+
+def ivf_nlist(n_vectors: int) -> int:
+    # ~4*sqrt(n) lists, keeping >= 39 training points per centroid
+    return max(1, min(int(4 * math.sqrt(max(n_vectors, 1))), n_vectors // 39, 65536))
+
+
+def _pq_subquantizers(dim: int) -> int:
+    for m in (64, 48, 32, 24, 16, 12, 8, 4, 2, 1):
+        if dim % m == 0 and m <= dim:
+            return m
+    return 1
+
+
+def build_index(kind: str, dim: int, vectors: Optional[np.ndarray] = None):
+    """
+    Create an empty index of ``kind`` that accepts ``add_with_ids``. IVF variants are
+    trained on ``vectors`` (sampled) and keep a hashtable direct map so vectors can be
+    reconstructed by id when the index is rebuilt.
+    """
+    if kind == "flat":
+        return faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+    if kind == "hnsw":
+        base = faiss.IndexHNSWFlat(dim, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        base.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        base.hnsw.efSearch = DEFAULT_EF_SEARCH
+        return faiss.IndexIDMap2(base)
+    if kind not in ("ivf", "ivfpq"):
+        raise ValueError(f"Unknown vector index type: {kind}")
+    if vectors is None or len(vectors) == 0:
+        raise ValueError(f"{kind} index needs training vectors")
+    nlist = ivf_nlist(len(vectors))
+    quantizer = faiss.IndexFlatIP(dim)
+    if kind == "ivf":
+        index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+    else:
+        index = faiss.IndexIVFPQ(quantizer, dim, nlist, _pq_subquantizers(dim), PQ_NBITS,
+                                 faiss.METRIC_INNER_PRODUCT)
+    if len(vectors) > MAX_TRAIN_SAMPLE:
+        sample = vectors[np.random.default_rng(0).choice(len(vectors), MAX_TRAIN_SAMPLE, replace=False)]
+    else:
+        sample = vectors
+    index.train(np.ascontiguousarray(sample, dtype="float32"))
+    index.nprobe = min(DEFAULT_NPROBE, nlist)
+    index.set_direct_map_type(faiss.DirectMap.Hashtable)
+    return index
+
+
+def index_type_of(index) -> str:
+    if index is None:
+        return "none"
+    base = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else faiss.downcast_index(index)
+    if isinstance(base, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(base, faiss.IndexIVFPQ):
+        return "ivfpq"
+    if isinstance(base, faiss.IndexIVF):
+        return "ivf"
+    return "flat"
+
+
+def search_params(index, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+    """Per-query search parameters; ``None`` leaves the index defaults in place."""
+    kind = index_type_of(index)
+    if kind in ("ivf", "ivfpq") and nprobe:
+        return faiss.SearchParametersIVF(nprobe=int(nprobe))
+    if kind == "hnsw" and ef_search:
+        return faiss.SearchParametersHNSW(efSearch=int(ef_search))
+    return None
+
+
+def needs_rebuild(index, n_vectors: int, trained_on: int, tombstones: int = 0) -> bool:
+    kind = index_type_of(index)
+    if kind != choose_index_type(n_vectors):
+        return True
+    if kind in ("ivf", "ivfpq") and trained_on and n_vectors > RETRAIN_GROWTH * trained_on:
+        return True
+    # HNSW cannot delete in place; rebuild once dead entries pile up
+    return tombstones > max(1000, 0.2 * n_vectors)
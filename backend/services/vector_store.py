@@ -0,0 +1,510 @@
+import os
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers are only coordinated within one process
+    fcntl = None
+
+import faiss
+import numpy as np
+
+from services.vector_index import (
+    build_index,
+    choose_index_type,
+    index_type_of,
+    needs_rebuild,
+    search_params,
+)
+
+# Compact delta segments into the base once any of these is exceeded
+MERGE_MAX_SEGMENTS = int(os.getenv("MERGE_MAX_SEGMENTS", "8"))
+MERGE_MAX_DELTA_VECTORS = int(os.getenv("MERGE_MAX_DELTA_VECTORS", "20000"))
+MERGE_DEAD_FRACTION = float(os.getenv("MERGE_DEAD_FRACTION", "0.2"))
+
+# Upper bound on how stale a reader's view of other processes' writes can get
+INDEX_RELOAD_VERIFY_SECONDS = float(os.getenv("INDEX_RELOAD_VERIFY_SECONDS", "1"))
+
+MANIFEST_NAME = "manifest.json"
+WRITE_LOCK_NAME = "write.lock"
+MERGE_LOCK_NAME = "merge.lock"
+# Single-file index written before segmented persistence; adopted as the first base
+LEGACY_INDEX_NAME = "index.faiss"
+
+
+def _write_index_atomic(index, path: str):
+    tmp_path = path + ".tmp"
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _write_ids_atomic(ids: np.ndarray, path: str):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, ids.astype("int64"))
+    os.replace(tmp_path, path)
+
+
+def _read_index(path: str, mmap: bool = False):
+    if mmap:
+        try:
+            return faiss.read_index(path, faiss.IO_FLAG_MMAP)
+        except Exception:
+            pass
+    return faiss.read_index(path)
+
+
+class _FileLock:
+    """Advisory ``flock`` on a file, shared by every process using the index directory."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        if fcntl is None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+
+class SegmentedVectorStore:
+    """
+    Vector index persisted as one large base index plus small append-only delta
+    segments. Each ingest writes only a new flat segment holding its own vectors;
+    searches fan out over base + segments. A background merge periodically folds
+    the segments (and drops deleted vectors) into a new base.
+
+    Ids are allocated monotonically by the caller, so every segment covers a
+    contiguous id range above the base's ``max_id``. Deleted ids are not removed
+    in place: callers filter hits against their metadata and report deletions via
+    ``mark_deleted`` so merges know when compaction pays off.
+
+    Several processes may share the directory. Every manifest write bumps its
+    ``version``; ``refresh`` compares the manifest's stat signature and, when
+    another process changed it, swaps in the new base/segments. Searches hold
+    references to the indexes they started with, so a swap never disturbs them.
+    Writers serialize through ``write_lock``, which reloads the manifest first.
+    """
+
+    def __init__(self, directory: str, live_ids: Callable[[], List[int]]):
+        self.directory = directory
+        self.live_ids = live_ids
+        self._lock = threading.RLock()
+        self._write_lock = threading.RLock()
+        self._write_depth = 0
+        self._reload_lock = threading.Lock()
+        self._merge_lock = threading.Lock()
+        self._merge_thread: Optional[threading.Thread] = None
+        self.manifest: Dict[str, Any] = {
+            "generation": 0, "version": 0, "dim": None, "base": None, "segments": [],
+            "next_segment": 0, "deleted": 0,
+        }
+        self.base = None
+        self.segments: List[Tuple[Dict[str, Any], Any]] = []
+        self.reloads = 0
+        self._manifest_sig = None
+        self._loaded = False
+        self._verified_at = 0.0
+        os.makedirs(directory, exist_ok=True)
+        self._file_lock = _FileLock(self._path(WRITE_LOCK_NAME))
+        self._merge_file_lock = _FileLock(self._path(MERGE_LOCK_NAME))
+        with self.write_lock():
+            self._load()
+
+    # ---------- persistence ----------
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _manifest_signature(self):
+        try:
+            st = os.stat(self._path(MANIFEST_NAME))
+        except FileNotFoundError:
+            return None
+        # os.replace gives every new manifest a fresh inode
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def _write_manifest(self):
+        self.manifest["version"] = self.manifest.get("version", 0) + 1
+        tmp_path = self._path(MANIFEST_NAME + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp_path, self._path(MANIFEST_NAME))
+        self._manifest_sig = self._manifest_signature()
+        self._loaded = True
+
+    @contextmanager
+    def write_lock(self):
+        """
+        Exclusive writer section across threads and processes. The latest manifest is
+        loaded on entry so ids, segment names and counters build on other writers' work.
+        Re-entrant within a thread.
+        """
+        with self._write_lock:
+            outer = self._write_depth == 0
+            if outer:
+                self._file_lock.acquire()
+            self._write_depth += 1
+            try:
+                if outer:
+                    self.refresh(force=True)
+                yield
+            finally:
+                self._write_depth -= 1
+                if outer:
+                    self._file_lock.release()
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Cheap version check for the search path: one ``stat`` of the manifest, plus a read of
+        it at most every INDEX_RELOAD_VERIFY_SECONDS (file timestamps are coarse, so the stat
+        alone can miss a rewrite). When another process has written a newer version, load it
+        and swap it in; already-open segments and an unchanged base are reused. Returns True
+        if a new version was picked up.
+        """
+        sig = self._manifest_signature()
+        if sig is None:
+            return False
+        now = time.monotonic()
+        if not force and sig == self._manifest_sig and now - self._verified_at < INDEX_RELOAD_VERIFY_SECONDS:
+            return False
+        with self._reload_lock:
+            try:
+                with open(self._path(MANIFEST_NAME), "r", encoding="utf-8") as f:
+                    manifest = json.load(f)
+                with self._lock:
+                    current = self.manifest
+                    loaded = {info["file"]: seg for info, seg in self.segments}
+                    base = self.base
+                self._manifest_sig, self._verified_at = sig, now
+                if self._loaded and manifest.get("version", 0) <= current.get("version", 0):
+                    return False
+                segments = [
+                    (info, loaded.get(info["file"]) or _read_index(self._path(info["file"])))
+                    for info in manifest["segments"]
+                ]
+                base_info = manifest.get("base")
+                if base_info is None:
+                    base = None
+                elif not current.get("base") or current["base"]["file"] != base_info["file"]:
+                    base = _read_index(self._path(base_info["file"]), mmap=True)
+            except (OSError, RuntimeError, ValueError) as e:
+                if force:
+                    raise
+                # a concurrent merge removed files this manifest named; the next check retries
+                self._manifest_sig = None
+                print(f"[Index] Reload deferred: {e}")
+                return False
+            with self._lock:
+                if self._loaded and manifest.get("version", 0) <= self.manifest.get("version", 0):
+                    # a local write landed while loading; it is at least as new as this manifest
+                    return False
+                self.manifest, self.base, self.segments = manifest, base, segments
+                self._loaded = True
+                self.reloads += 1
+            return True
+
+    def _load(self):
+        # write_lock() has already loaded an existing manifest on entry
+        if self._loaded:
+            return
+        if self._manifest_signature() is not None:
+            raise RuntimeError(f"Could not load vector index manifest in {self.directory}")
+        if os.path.exists(self._path(LEGACY_INDEX_NAME)):
+            legacy = faiss.read_index(self._path(LEGACY_INDEX_NAME))
+            self.manifest.update({
+                "dim": legacy.d,
+                "base": {
+                    "file": LEGACY_INDEX_NAME,
+                    "count": int(legacy.ntotal),
+                    "max_id": int(legacy.ntotal) - 1,
+                    # a bare IndexFlatIP labels vectors by position and can't take add_with_ids
+                    "id_mapped": isinstance(legacy, (faiss.IndexIDMap, faiss.IndexIVF)),
+                    "trained_on": 0,
+                },
+            })
+            self._write_manifest()
+            self.base = _read_index(self._path(LEGACY_INDEX_NAME), mmap=True)
+
+    def reset(self, dim: int):
+        """Drop everything (e.g. the embedding dimension changed)."""
+        with self.write_lock(), self._lock:
+            old_files = self._files()
+            self.manifest = {
+                "generation": self.manifest.get("generation", 0) + 1, "version": self.manifest.get("version", 0),
+                "dim": dim, "base": None, "segments": [],
+                "next_segment": self.manifest.get("next_segment", 0), "deleted": 0,
+            }
+            self.base = None
+            self.segments = []
+            self._write_manifest()
+        self._remove_files(old_files)
+
+    def _files(self) -> List[str]:
+        files = [info["file"] for info in self.manifest["segments"]]
+        if self.manifest.get("base"):
+            files.append(self.manifest["base"]["file"])
+            if self.manifest["base"].get("ids_file"):
+                files.append(self.manifest["base"]["ids_file"])
+        return files
+
+    def _base_members(self, base_info: Optional[Dict[str, Any]]) -> np.ndarray:
+        """Sorted ids stored in the base, from the list written next to it at merge time."""
+        if not base_info:
+            return np.zeros(0, dtype="int64")
+        if base_info.get("ids_file"):
+            return np.load(self._path(base_info["ids_file"]))
+        # bases from before the id list (and the legacy index) hold every id up to max_id
+        return np.arange(base_info["max_id"] + 1, dtype="int64")
+
+    def _remove_files(self, names: List[str]):
+        for name in names:
+            try:
+                os.remove(self._path(name))
+            except OSError:
+                pass
+
+    # ---------- reads ----------
+    @property
+    def dim(self) -> Optional[int]:
+        return self.manifest.get("dim")
+
+    @property
+    def ntotal(self) -> int:
+        base = self.manifest["base"]["count"] if self.manifest.get("base") else 0
+        return base + sum(info["count"] for info in self.manifest["segments"])
+
+    def search(self, q: np.ndarray, k: int, nprobe: Optional[int] = None,
+               ef_search: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Search the current generation; callers ``refresh()`` first to see other writers."""
+        with self._lock:
+            base, segments, deleted = self.base, list(self.segments), self.manifest.get("deleted", 0)
+        # over-fetch so deleted-but-not-yet-compacted vectors don't crowd out live hits
+        k_fetch = k + min(deleted, 3 * k)
+        parts = []
+        if base is not None and base.ntotal:
+            params = search_params(base, nprobe=nprobe, ef_search=ef_search)
+            if params is not None:
+                parts.append(base.search(q, k_fetch, params=params))
+            else:
+                parts.append(base.search(q, k_fetch))
+        for _, seg in segments:
+            if seg.ntotal:
+                parts.append(seg.search(q, min(k_fetch, seg.ntotal)))
+        if not parts:
+            return np.zeros((len(q), 0), dtype="float32"), np.zeros((len(q), 0), dtype="int64")
+        D = np.hstack([d for d, _ in parts])
+        I = np.hstack([i for _, i in parts])
+        order = np.argsort(-D, axis=1)[:, :k_fetch]
+        return np.take_along_axis(D, order, axis=1), np.take_along_axis(I, order, axis=1)
+
+    def reconstruct(self, ids: List[int]) -> Dict[int, np.ndarray]:
+        """Stored vectors for ``ids``; ids that aren't in the index (e.g. deleted) are left out."""
+        with self._lock:
+            base, segments, base_info = self.base, list(self.segments), self.manifest.get("base")
+        found: Dict[int, np.ndarray] = {}
+        for vid in ids:
+            index = next((seg for info, seg in segments if info["min_id"] <= vid <= info["max_id"]), None)
+            if index is None and base_info and vid <= base_info["max_id"]:
+                index = base
+            if index is None:
+                continue
+            try:
+                found[vid] = index.reconstruct(int(vid))
+            except RuntimeError:
+                pass  # removed from the base by a merge
+        return found
+
+    # ---------- writes ----------
+    def add(self, ids: np.ndarray, vectors: np.ndarray):
+        """Persist ``vectors`` as a new delta segment; only the new data is written."""
+        if len(ids) == 0:
+            return
+        seg = faiss.IndexIDMap2(faiss.IndexFlatIP(vectors.shape[1]))
+        seg.add_with_ids(np.ascontiguousarray(vectors, dtype="float32"), ids.astype("int64"))
+        with self.write_lock(), self._lock:
+            if self.dim is None:
+                self.manifest["dim"] = int(vectors.shape[1])
+            name = f"segment_{self.manifest['next_segment']:08d}.faiss"
+            self.manifest["next_segment"] += 1
+            _write_index_atomic(seg, self._path(name))
+            info = {"file": name, "count": int(len(ids)), "min_id": int(ids.min()), "max_id": int(ids.max())}
+            self.manifest["segments"].append(info)
+            # copy-on-write so a search iterating the previous list is unaffected
+            self.segments = self.segments + [(info, seg)]
+            self._write_manifest()
+
+    def mark_deleted(self, count: int):
+        if count <= 0:
+            return
+        with self.write_lock(), self._lock:
+            self.manifest["deleted"] = self.manifest.get("deleted", 0) + count
+            self._write_manifest()
+
+    # ---------- compaction ----------
+    def should_merge(self) -> bool:
+        with self._lock:
+            segments = self.manifest["segments"]
+            delta = sum(info["count"] for info in segments)
+            total = self.ntotal
+            deleted = self.manifest.get("deleted", 0)
+            base_kind = index_type_of(self.base) if self.base is not None else "none"
+        if not segments and deleted <= MERGE_DEAD_FRACTION * max(total, 1):
+            return False
+        return (
+            len(segments) >= MERGE_MAX_SEGMENTS
+            or delta >= MERGE_MAX_DELTA_VECTORS
+            or deleted > max(1000, MERGE_DEAD_FRACTION * total)
+            or (segments and base_kind != choose_index_type(total - deleted))
+        )
+
+    def merge_in_background(self) -> bool:
+        """Start a merge thread unless one is already running."""
+        with self._lock:
+            if self._merge_thread is not None and self._merge_thread.is_alive():
+                return False
+            self._merge_thread = threading.Thread(target=self._merge_safely, name="vector-merge", daemon=True)
+            self._merge_thread.start()
+            return True
+
+    def _merge_safely(self):
+        try:
+            self.merge()
+        except Exception as e:
+            print(f"[Index] Segment merge failed: {e}")
+
+    def merge(self):
+        """
+        Fold the current segments into a new base, dropping deleted vectors. The new base
+        is built without holding the store lock; segments added meanwhile are kept. Only
+        one process merges a directory at a time; others skip.
+        """
+        with self._merge_lock:
+            if not self._merge_file_lock.acquire(blocking=False):
+                return
+            try:
+                self._merge()
+            finally:
+                self._merge_file_lock.release()
+
+    def _merge(self):
+        # writers add a segment and commit its chunk rows under the write lock, so reading
+        # live ids under it too keeps just-added vectors from looking deleted
+        with self.write_lock(), self._lock:
+            generation = self.manifest["generation"]
+            base_info = self.manifest.get("base")
+            merged = list(self.segments)
+            deleted_before = self.manifest.get("deleted", 0)
+            dim = self.dim
+            if dim is None or (not merged and not deleted_before):
+                return
+            live = np.array(self.live_ids(), dtype="int64")
+        base_max = base_info["max_id"] if base_info else -1
+        upto = max([info["max_id"] for info, _ in merged] + [base_max])
+        live = live[live <= upto]
+        snapshot_total = (base_info["count"] if base_info else 0) + sum(info["count"] for info, _ in merged)
+
+        base = _read_index(self._path(base_info["file"])) if base_info else None
+        trained_on = base_info.get("trained_on", 0) if base_info else 0
+        base_ids = live[live <= base_max]
+        # only ids still stored in the base: earlier merges already dropped older deletions
+        dead = np.setdiff1d(self._base_members(base_info), base_ids, assume_unique=True)
+        reuse = (
+            base is not None
+            and base_info.get("id_mapped", True)
+            # HNSW can only grow; deletions force a rebuild
+            and (index_type_of(base) != "hnsw" or len(dead) == 0)
+            and not needs_rebuild(base, len(live), trained_on)
+        )
+        seg_vectors, seg_ids = self._live_segment_vectors(merged, live)
+        if reuse:
+            if len(dead):
+                base.remove_ids(dead)
+            if len(seg_ids):
+                base.add_with_ids(seg_vectors, seg_ids)
+            new_base = base
+        else:
+            if base is not None and len(base_ids):
+                base_vectors = base.reconstruct_batch(base_ids)
+            else:
+                base_vectors = np.zeros((0, dim), dtype="float32")
+            all_ids = np.concatenate([base_ids, seg_ids])
+            all_vectors = np.vstack([base_vectors, seg_vectors]).astype("float32")
+            kind = choose_index_type(len(all_ids))
+            print(f"[Index] Rebuilding base as {kind} over {len(all_ids)} vectors")
+            new_base = build_index(kind, dim, all_vectors)
+            if len(all_ids):
+                new_base.add_with_ids(all_vectors, all_ids)
+            trained_on = len(all_ids) if kind in ("ivf", "ivfpq") else 0
+
+        # the expensive write happens before taking the lock searches need
+        name = f"base_{generation + 1:08d}.faiss"
+        ids_name = f"base_{generation + 1:08d}.ids.npy"
+        _write_index_atomic(new_base, self._path(name))
+        _write_ids_atomic(np.union1d(base_ids, seg_ids), self._path(ids_name))
+        mapped = _read_index(self._path(name), mmap=True)
+        dropped = snapshot_total - int(new_base.ntotal)
+
+        with self.write_lock(), self._lock:
+            if self.manifest["generation"] != generation:
+                # reset() ran meanwhile; this merge is stale
+                self._remove_files([name, ids_name])
+                return
+            merged_files = {info["file"] for info, _ in merged}
+            old_files = list(merged_files)
+            if base_info:
+                old_files += [base_info["file"]] + ([base_info["ids_file"]] if base_info.get("ids_file") else [])
+            self.segments = [(info, seg) for info, seg in self.segments if info["file"] not in merged_files]
+            self.base = mapped
+            self.manifest.update({
+                "generation": generation + 1,
+                "base": {"file": name, "ids_file": ids_name, "count": int(new_base.ntotal), "max_id": int(upto),
+                         "id_mapped": True, "trained_on": trained_on},
+                "segments": [info for info, _ in self.segments],
+                "deleted": max(0, self.manifest.get("deleted", 0) - dropped),
+            })
+            self._write_manifest()
+        self._remove_files(old_files)
+        print(f"[Index] Merged {len(merged)} segment(s) into generation {generation + 1}")
+
+    def _live_segment_vectors(self, segments, live: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        vectors, ids = [], []
+        for info, seg in segments:
+            seg_ids = live[(live >= info["min_id"]) & (live <= info["max_id"])]
+            if len(seg_ids):
+                vectors.append(seg.reconstruct_batch(seg_ids))
+                ids.append(seg_ids)
+        if not ids:
+            return np.zeros((0, self.dim), dtype="float32"), np.zeros(0, dtype="int64")
+        return np.vstack(vectors).astype("float32"), np.concatenate(ids)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "type": index_type_of(self.base) if self.base is not None else "none",
+                "generation": self.manifest["generation"],
+                "version": self.manifest.get("version", 0),
+                "reloads": self.reloads,
+                "vectors": self.ntotal,
+                "segments": len(self.manifest["segments"]),
+                "delta_vectors": sum(info["count"] for info in self.manifest["segments"]),
+                "deleted": self.manifest.get("deleted", 0),
+                "trained_on": self.manifest["base"].get("trained_on", 0) if self.manifest.get("base") else 0,
+                "merging": self._merge_thread is not None and self._merge_thread.is_alive(),
+            }
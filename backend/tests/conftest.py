@@ -0,0 +1,5 @@
+import os
+import sys
+
+# services are imported as top-level packages, the way main.py runs them
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,49 @@
+from services import chunk_store
+from services.chunk_store import ChunkStore
+
+
+def _rows(start, n, text):
+    return [(vid, f"c{vid}", text) for vid in range(start, start + n)]
+
+
+def _doc_freqs(store):
+    return dict(store._conn().execute("SELECT term, df FROM term_stats"))
+
+
+def test_large_id_lists_are_batched(tmp_path):
+    store = ChunkStore(str(tmp_path / "chunks.sqlite"))
+    store.replace_document("a.txt", "h1", _rows(0, 2500, "alpha beta"))
+    assert len(store.get_many(range(2500))) == 2500
+
+    old = store.replace_document("a.txt", "h2", _rows(2500, 10, "gamma"))
+    assert sorted(old) == list(range(2500))
+    assert store.count() == 10
+    assert store.get_state("lexical_docs") == 10
+    assert _doc_freqs(store) == {"gamma": 10}
+
+
+def test_doc_freqs_follow_replacements(tmp_path):
+    store = ChunkStore(str(tmp_path / "chunks.sqlite"))
+    store.replace_documents([
+        ("a.txt", "h1", _rows(0, 3, "apple banana")),
+        ("b.txt", "h2", _rows(3, 2, "banana cherry")),
+    ])
+    assert _doc_freqs(store) == {"apple": 3, "banana": 5, "cherry": 2}
+    store.replace_document("a.txt", "h3", _rows(5, 1, "cherry"))
+    assert _doc_freqs(store) == {"banana": 2, "cherry": 3}
+
+
+def test_capped_postings_keep_full_document_frequency(tmp_path, monkeypatch):
+    store = ChunkStore(str(tmp_path / "chunks.sqlite"))
+    # 10 chunks say "common" three times (one of them also "rare"), 40 say it once
+    rows = [(vid, f"c{vid}", "common " * (3 if vid < 10 else 1) + ("rare" if vid == 7 else ""))
+            for vid in range(50)]
+    store.replace_document("a.txt", "h1", rows)
+    full = dict(store.lexical_search("common rare", 50))
+
+    monkeypatch.setattr(chunk_store, "LEXICAL_MAX_POSTINGS_PER_TERM", 10)
+    capped = store.lexical_search("common rare", 50)
+    # only the ten highest-tf postings are read, but idf still counts all 50 documents
+    assert [vid for vid, _ in capped][0] == 7
+    assert {vid for vid, _ in capped} == set(range(10))
+    assert all(score == full[vid] for vid, score in capped)
@@ -0,0 +1,53 @@
+import sqlite3
+
+import pytest
+from sqlalchemy import create_engine, event
+
+from services import column_profiler
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    monkeypatch.setattr(column_profiler, "PROFILE_SAMPLE_ROWS", 100)
+    path = tmp_path / "big.sqlite"
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE big (id INTEGER PRIMARY KEY, v TEXT);
+        CREATE TABLE small (id INTEGER PRIMARY KEY, v TEXT);
+        CREATE TABLE keyed (k TEXT PRIMARY KEY, v TEXT) WITHOUT ROWID;
+    """)
+    conn.executemany("INSERT INTO big VALUES (?, ?)", [(i, f"v{i % 7}") for i in range(1, 5001)])
+    conn.executemany("INSERT INTO small VALUES (?, ?)", [(2 * i - 1, "x") for i in range(1, 51)])
+    conn.executemany("INSERT INTO keyed VALUES (?, ?)", [(f"k{i}", "y") for i in range(3000)])
+    conn.commit()
+    conn.close()
+    engine = create_engine(f"sqlite:///{path}", future=True)
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda conn, cur, stmt, *a: statements.append(stmt))
+    engine.statements = statements
+    yield engine
+    engine.dispose()
+
+
+def _full_counts(engine, table):
+    return [s for s in engine.statements if f'COUNT(*) FROM {table}' in s or f'COUNT(*) FROM "{table}"' in s]
+
+
+def test_large_rowid_table_is_not_counted(engine):
+    stats = column_profiler.profile_table(engine, "big", ["id", "v"])
+    assert stats["row_count"] == 5000
+    assert stats["sampled_rows"] <= 100
+    assert not _full_counts(engine, "big")
+
+
+def test_small_table_is_counted_exactly(engine):
+    # the rowid span (1..99) overstates it, but it is small enough to count
+    assert column_profiler.profile_table(engine, "small", ["id", "v"])["row_count"] == 50
+
+
+def test_without_rowid_table_uses_analyze_stats_or_a_bounded_count(engine):
+    assert column_profiler.profile_table(engine, "keyed", ["k", "v"])["row_count"] == 101
+    with engine.begin() as conn:
+        conn.exec_driver_sql("ANALYZE")
+    assert column_profiler.profile_table(engine, "keyed", ["k", "v"])["row_count"] == 3000
+    assert not _full_counts(engine, "keyed")
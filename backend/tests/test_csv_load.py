@@ -0,0 +1,63 @@
+import sqlite3
+
+import pytest
+
+from api.ingestion import _load_csv_into_sqlite
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    # the loader writes to ./demo_db.sqlite when the project path doesn't exist
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def _write(path, text):
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+def _query(workdir, sql):
+    conn = sqlite3.connect(workdir / "demo_db.sqlite")
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+
+def test_reload_keeps_dependent_views_working(workdir):
+    _load_csv_into_sqlite(_write(workdir / "a.csv", "name,salary\nAnn,100\n"), "staff")
+    conn = sqlite3.connect(workdir / "demo_db.sqlite")
+    conn.execute("CREATE VIEW rich AS SELECT name FROM upload_staff WHERE salary > 150")
+    conn.close()
+
+    assert _load_csv_into_sqlite(_write(workdir / "b.csv", "name,salary\nBo,200\nCy,50\n"), "staff") == "upload_staff"
+    assert _query(workdir, "SELECT name FROM rich") == [("Bo",)]
+
+
+def test_row_longer_than_header_rejects_the_load(workdir):
+    _load_csv_into_sqlite(_write(workdir / "a.csv", "name,salary\nAnn,100\n"), "staff")
+    bad = _write(workdir / "b.csv", "name,salary\nBo,200\nCy,50,extra\nDi\n")
+
+    with pytest.raises(ValueError, match="line 3"):
+        _load_csv_into_sqlite(bad, "staff")
+    # the live table is untouched and no staging table is left behind
+    assert _query(workdir, "SELECT name, salary FROM upload_staff") == [("Ann", 100)]
+    assert _query(workdir, "SELECT name FROM sqlite_master WHERE name LIKE '%staging%'") == []
+
+
+def test_short_rows_are_padded(workdir):
+    _load_csv_into_sqlite(_write(workdir / "a.csv", "name,salary\nAnn\n"), "staff")
+    assert _query(workdir, "SELECT name, salary FROM upload_staff") == [("Ann", None)]
+
+
+def test_upload_cannot_replace_an_existing_table(workdir):
+    conn = sqlite3.connect(workdir / "demo_db.sqlite")
+    conn.executescript("CREATE TABLE employees (id INTEGER PRIMARY KEY, name TEXT); INSERT INTO employees VALUES (1, 'Ann');")
+    conn.close()
+
+    table = _load_csv_into_sqlite(_write(workdir / "employees.csv", "id,name\n9,Mallory\n"), "employees")
+
+    assert table == "upload_employees"
+    assert _query(workdir, "SELECT id, name FROM employees") == [(1, "Ann")]
+    assert _query(workdir, "SELECT id, name FROM upload_employees") == [(9, "Mallory")]
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from services import document_processor
+from services.chunk_store import ChunkStore
+from services.embedding_cache import EmbeddingCache
+
+
+@pytest.fixture
+def processor(tmp_path, monkeypatch):
+    monkeypatch.setattr(document_processor, "INDEX_DIR", str(tmp_path / "index"))
+    monkeypatch.setattr(document_processor, "METADATA_PATH", str(tmp_path / "metadata.json"))
+    monkeypatch.setattr(document_processor, "ChunkStore", lambda: ChunkStore(str(tmp_path / "chunks.sqlite")))
+    monkeypatch.setattr(document_processor, "EmbeddingCache", lambda: EmbeddingCache(str(tmp_path / "emb.sqlite")))
+    dp = document_processor.DocumentProcessor()
+    dp.computed = []
+
+    def compute(texts):
+        dp.computed.extend(texts)
+        return np.array([[len(t), 1.0, 0.0] for t in texts], dtype="float32")
+
+    dp._compute_embeddings = compute
+    return dp
+
+
+def test_repeated_query_is_served_from_the_cache(processor):
+    first = processor.embed_query("engineers hired last year")
+    again = processor.embed_query("engineers hired last year")
+
+    assert processor.computed == ["engineers hired last year"]
+    np.testing.assert_array_equal(first, again)
+    assert processor.embedding_cache.stats()["hits"] == 1
+    assert processor.embedding_cache.stats()["query_bytes"] == first.nbytes
+
+
+def test_queries_are_evicted_within_their_own_budget(tmp_path):
+    vec = np.ones((1, 4), dtype="float32")  # 16 bytes each
+    cache = EmbeddingCache(str(tmp_path / "emb.sqlite"), max_bytes=1000, query_max_bytes=100)
+    cache.put_many("m", ["doc"], vec)
+    for i in range(20):
+        cache.put_many("m", [f"query {i}"], vec, kind="query")
+
+    assert cache.kind_bytes["query"] <= 100
+    assert cache.get_many("m", ["doc"])[0] is not None
+    # the most recent queries survive
+    assert cache.get_many("m", ["query 19"])[0] is not None
+    assert cache.get_many("m", ["query 0"])[0] is None
@@ -0,0 +1,41 @@
+import difflib
+import random
+
+import pytest
+
+from services.name_index import FuzzyNameIndex
+
+
+def _word(rng, alphabet="abcdeemp_"):
+    return "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 9)))
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_close_matches_agree_with_difflib(seed):
+    rng = random.Random(seed)
+    names = [_word(rng) for _ in range(rng.randint(0, 60))]
+    # repeated names take up slots in the top n, as they do in difflib
+    names += rng.sample(names, min(len(names), 10))
+    rng.shuffle(names)
+    index = FuzzyNameIndex(names)
+    for _ in range(50):
+        word = rng.choice(names) if names and rng.random() < 0.3 else _word(rng)
+        n = rng.randint(1, 8)
+        cutoff = rng.choice([0.0, 0.3, 0.5, 0.6, 0.75, 1.0, rng.random()])
+        assert index.close_matches(word, n, cutoff) == difflib.get_close_matches(word, names, n, cutoff)
+
+
+def test_schema_like_names():
+    names = ["employees", "emp", "departments", "dept", "salary", "salaries", "emp", "employee_id"]
+    index = FuzzyNameIndex(names)
+    for word in ["employee", "emps", "department", "salry", "id", ""]:
+        for n in (1, 3, 5):
+            assert index.close_matches(word, n, 0.6) == difflib.get_close_matches(word, names, n, 0.6)
+
+
+def test_rejects_invalid_arguments_like_difflib():
+    index = FuzzyNameIndex(["emp"])
+    with pytest.raises(ValueError):
+        index.close_matches("emp", n=0)
+    with pytest.raises(ValueError):
+        index.close_matches("emp", cutoff=1.5)
@@ -0,0 +1,66 @@
+import asyncio
+import sqlite3
+import threading
+
+import pytest
+
+from services.query_engine import QueryEngine
+
+
+@pytest.fixture
+def qe(tmp_path):
+    db = tmp_path / "staff.sqlite"
+    conn = sqlite3.connect(db)
+    conn.execute("CREATE TABLE staff (id INTEGER PRIMARY KEY, name TEXT, salary REAL)")
+    conn.executemany("INSERT INTO staff VALUES (?, ?, ?)", [(i, f"n{i}", 1000 + i) for i in range(1, 301)])
+    conn.commit()
+    conn.close()
+    engine = QueryEngine(f"sqlite:///{db}")
+    yield engine
+    engine.shutdown()
+
+
+def test_keyset_tokens_walk_every_row_once(qe):
+    query = "list staff id name salary over 1100"
+    sql, params = qe._build_sql(query)
+    seen, token, pages = [], None, 0
+    while True:
+        rows, _, token = qe._paged_sql(query, sql, params, 37, token)
+        seen += [row["id"] for row in rows]
+        pages += 1
+        if token is None:
+            break
+    assert seen == list(range(101, 301))
+    assert pages == 6
+
+
+def test_page_token_is_bound_to_its_query(qe):
+    query = "list staff id name salary over 1100"
+    sql, params = qe._build_sql(query)
+    _, _, token = qe._paged_sql(query, sql, params, 10, None)
+    other = "list staff id name salary over 1200"
+    other_sql, other_params = qe._build_sql(other)
+    with pytest.raises(ValueError, match="does not belong"):
+        qe._paged_sql(other, other_sql, other_params, 10, token)
+    with pytest.raises(ValueError, match="Invalid"):
+        qe._paged_sql(query, sql, params, 10, "not-a-token")
+
+
+def test_stream_batches_run_on_query_workers(qe, monkeypatch):
+    threads = []
+    stream_query = qe.stream_query
+
+    def recording_stream(*args, **kwargs):
+        for record in stream_query(*args, **kwargs):
+            threads.append(threading.current_thread().name)
+            yield record
+
+    monkeypatch.setattr(qe, "stream_query", recording_stream)
+
+    async def collect():
+        return [record async for record in qe.astream_query("list staff id name salary over 10")]
+
+    records = asyncio.run(collect())
+    assert [r["type"] for r in records][0] == "meta" and records[-1]["type"] == "end"
+    assert sum(len(r.get("rows", [])) for r in records) == 300
+    assert threads and all(name.startswith("query_") for name in threads)
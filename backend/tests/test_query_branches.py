@@ -0,0 +1,71 @@
+import sqlite3
+import time
+
+import pytest
+
+from services import query_engine
+from services.query_engine import QueryEngine
+
+SLOW_SQL = ("WITH RECURSIVE r(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM r WHERE i < 100000000) "
+            "SELECT count(*) AS n FROM r")
+
+
+class _Docs:
+    model_loaded = False
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+
+    def search(self, query, **kwargs):
+        time.sleep(self.delay)
+        return [{"text": "hit"}]
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = tmp_path / "hr.sqlite"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE employees (id INTEGER PRIMARY KEY, name TEXT, salary REAL)")
+    conn.commit()
+    conn.close()
+    return f"sqlite:///{path}"
+
+
+def test_hybrid_sql_deadline_interrupts_the_statement(db, monkeypatch):
+    qe = QueryEngine(db, doc_processor=_Docs())
+    try:
+        monkeypatch.setattr(query_engine, "SQL_BRANCH_TIMEOUT_SECONDS", 0.2)
+        monkeypatch.setattr(qe, "_build_sql", lambda q: (SLOW_SQL, {}))
+        started = time.perf_counter()
+        out = qe._answer("people python names", time.time())
+        assert time.perf_counter() - started < 2
+        assert out["partial"] and out["metrics"]["branches"]["sql"]["status"] == "timeout"
+        assert out["docs"] == [{"text": "hit"}]
+        # the statement was stopped, not abandoned: its connection is back in the pool
+        assert qe.engine.pool.checkedout() == 0
+    finally:
+        qe.shutdown()
+
+
+def test_single_branch_has_no_deadline(db, monkeypatch):
+    qe = QueryEngine(db, doc_processor=_Docs())
+    try:
+        monkeypatch.setattr(query_engine, "SQL_BRANCH_TIMEOUT_SECONDS", 0.01)
+        monkeypatch.setattr(qe, "classify_query", lambda q: "sql")
+        monkeypatch.setattr(qe, "_build_sql", lambda q: (SLOW_SQL.replace("100000000", "300000"), {}))
+        out = qe._answer("count employees", time.time())
+        assert "partial" not in out
+        assert out["results"] == [{"n": 300000}]
+    finally:
+        qe.shutdown()
+
+
+def test_hybrid_doc_deadline(db, monkeypatch):
+    qe = QueryEngine(db, doc_processor=_Docs(delay=0.5))
+    try:
+        monkeypatch.setattr(query_engine, "DOC_BRANCH_TIMEOUT_SECONDS", 0.1)
+        out = qe._answer("people python names", time.time())
+        assert out["partial"] and out["metrics"]["branches"]["docs"]["status"] == "timeout"
+        assert out["metrics"]["branches"]["sql"]["status"] == "ok"
+    finally:
+        qe.shutdown()
@@ -0,0 +1,54 @@
+import sqlite3
+
+from sqlalchemy import inspect
+
+from services import schema_catalog
+from services.schema_catalog import get_engine, reflect_tables
+
+
+def _db(path):
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE departments (id INT PRIMARY KEY, name varchar(20) NOT NULL, budget DECIMAL(10, 2));
+        CREATE TABLE employees (id INTEGER PRIMARY KEY, dept_id INTEGER REFERENCES departments, hired DATETIME,
+                                note, blob_col BLOB);
+    """)
+    conn.close()
+    return f"sqlite:///{path}"
+
+
+def test_sqlite_reflection_matches_inspector(tmp_path):
+    engine = get_engine(_db(tmp_path / "hr.sqlite"))
+    with engine.connect() as conn:
+        tables = reflect_tables(conn)
+        inspector = inspect(conn)
+        for table, meta in tables.items():
+            expected = [(c["name"], str(c["type"]), c["nullable"]) for c in inspector.get_columns(table)]
+            assert [(c["name"], c["type"], c["nullable"]) for c in meta["columns"]] == expected
+    assert tables["employees"]["foreign_keys"][0]["referred_columns"] == ["id"]
+
+
+def test_sqlite_types_fall_back_to_declared(tmp_path, monkeypatch):
+    engine = get_engine(_db(tmp_path / "hr.sqlite"))
+    with engine.connect() as conn:
+        def missing(_):
+            raise AttributeError("_resolve_type_affinity")
+        monkeypatch.setattr(conn.dialect, "_resolve_type_affinity", missing)
+        columns = reflect_tables(conn, ["departments"])["departments"]["columns"]
+    assert [c["type"] for c in columns] == ["INT", "varchar(20)", "DECIMAL(10, 2)"]
+
+
+def test_engine_cache_is_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(schema_catalog, "SCHEMA_ENGINE_CACHE_SIZE", 2)
+    monkeypatch.setattr(schema_catalog, "_engines", schema_catalog.OrderedDict())
+    disposed = []
+    urls = [_db(tmp_path / f"db{i}.sqlite") for i in range(3)]
+    first = get_engine(urls[0])
+    monkeypatch.setattr(first, "dispose", lambda: disposed.append(urls[0]))
+    get_engine(urls[1])
+    assert get_engine(urls[0]) is first  # a hit makes it the most recently used
+    get_engine(urls[2])
+    assert list(schema_catalog._engines) == [urls[0], urls[2]]
+    assert disposed == []
+    get_engine(urls[1])
+    assert disposed == [urls[0]]
@@ -0,0 +1,68 @@
+import sqlite3
+
+import pytest
+
+from services.schema_discovery import SchemaDiscovery
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = tmp_path / "hr.sqlite"
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE departments (id INTEGER PRIMARY KEY, name TEXT);
+        CREATE TABLE employees (id INTEGER PRIMARY KEY, name TEXT, dept_id INTEGER REFERENCES departments(id));
+        CREATE TABLE projects (id INTEGER PRIMARY KEY, title TEXT);
+        INSERT INTO departments VALUES (1, 'Engineering');
+        INSERT INTO employees VALUES (1, 'Ann', 1);
+    """)
+    conn.close()
+    return path
+
+
+def _ddl(path, sql):
+    conn = sqlite3.connect(path)
+    conn.executescript(sql)
+    conn.close()
+
+
+def test_refresh_without_changes_returns_previous(db):
+    sd = SchemaDiscovery()
+    schema = sd.analyze_database(f"sqlite:///{db}")
+    refreshed, changed = sd.refresh(f"sqlite:///{db}", schema)
+    assert refreshed is schema and changed == set()
+
+
+def test_refresh_after_alter_create_and_drop_matches_full_analyze(db):
+    url = f"sqlite:///{db}"
+    sd = SchemaDiscovery()
+    schema = sd.analyze_database(url)
+    _ddl(db, """
+        ALTER TABLE employees ADD COLUMN salary REAL;
+        UPDATE employees SET salary = 90000;
+        DROP TABLE projects;
+        CREATE TABLE skills (employee_id INTEGER REFERENCES employees(id), skill TEXT);
+    """)
+
+    refreshed, changed = sd.refresh(url, schema)
+
+    assert changed == {"employees", "projects", "skills"}
+    assert "projects" not in refreshed["tables"]
+    assert [c["name"] for c in refreshed["tables"]["employees"]["columns"]][-1] == "salary"
+    assert refreshed["tables"]["employees"]["sample"][0]["salary"] == 90000
+    # the untouched table is carried over from the previous snapshot as-is
+    assert refreshed["tables"]["departments"] is schema["tables"]["departments"]
+    assert refreshed == SchemaDiscovery().analyze_database(url)
+
+
+def test_refresh_resamples_tables_named_as_changed(db):
+    url = f"sqlite:///{db}"
+    sd = SchemaDiscovery()
+    schema = sd.analyze_database(url)
+    _ddl(db, "UPDATE employees SET name = 'Bo';")
+
+    # a data-only change leaves the fingerprint alone; the caller names the table
+    assert sd.refresh(url, schema) == (schema, set())
+    refreshed, changed = sd.refresh(url, schema, ["employees"])
+    assert changed == {"employees"}
+    assert refreshed["tables"]["employees"]["sample"][0]["name"] == "Bo"
@@ -0,0 +1,100 @@
+import json
+import os
+import sqlite3
+import stat
+
+import pytest
+
+from services import schema_snapshot
+from services.schema_discovery import SchemaDiscovery
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    path = tmp_path / "snapshots"
+    monkeypatch.setattr(schema_snapshot, "SCHEMA_CACHE_DIR", str(path))
+    return path
+
+
+@pytest.fixture
+def url(tmp_path):
+    path = tmp_path / "hr.sqlite"
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE employees (id INTEGER PRIMARY KEY, name TEXT);
+        INSERT INTO employees VALUES (1, 'Ann');
+    """)
+    conn.close()
+    return f"sqlite:///{path}"
+
+
+_STATS = {"row_count": 1, "columns": {"name": {"null_frac": 0.0, "distinct": 1, "min": "Ann", "max": "Ann",
+                                                "mcv": [["Ann", 1.0]]}}}
+
+
+def test_snapshot_is_private_and_keeps_no_row_data(cache_dir, url):
+    schema = SchemaDiscovery().analyze_database(url)
+    schema["tables"]["employees"]["stats"] = _STATS
+    schema_snapshot.save_snapshot(url, schema)
+
+    path = schema_snapshot.snapshot_path(url)
+    assert stat.S_IMODE(os.stat(cache_dir).st_mode) == 0o700
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    with open(path, encoding="utf-8") as f:
+        saved = json.load(f)["schema"]["tables"]["employees"]
+    assert "sample" not in saved
+    assert saved["columns"] == schema["tables"]["employees"]["columns"]
+    # aggregates are kept, most common values are not
+    assert saved["stats"]["columns"]["name"] == {"null_frac": 0.0, "distinct": 1, "min": "Ann", "max": "Ann"}
+    assert schema["tables"]["employees"]["stats"]["columns"]["name"]["mcv"] == [["Ann", 1.0]]
+
+
+def test_reload_keeps_saved_stats_and_only_resamples(cache_dir, url, monkeypatch):
+    schema = SchemaDiscovery().analyze_database(url)
+    schema["tables"]["employees"]["stats"] = _STATS
+    schema_snapshot.save_snapshot(url, schema)
+    sd = SchemaDiscovery()
+    analyze = sd._table_entries
+    monkeypatch.setattr(sd, "_table_entries",
+                        lambda reflected: pytest.fail("re-analyzed an unchanged table") if reflected else analyze({}))
+
+    refreshed, changed = sd.refresh(url, schema_snapshot.load_snapshot(url))
+    assert changed == set()
+    assert refreshed["tables"]["employees"]["sample"] == [{"id": 1, "name": "Ann"}]
+    assert refreshed["tables"]["employees"]["stats"]["row_count"] == 1
+
+
+def test_shared_cache_dir_is_refused(cache_dir, url):
+    schema = SchemaDiscovery().analyze_database(url)
+    schema_snapshot.save_snapshot(url, schema)
+    os.chmod(cache_dir, 0o777)
+
+    assert schema_snapshot.load_snapshot(url) is None
+    os.remove(schema_snapshot.snapshot_path(url))
+    schema_snapshot.save_snapshot(url, schema)
+    assert not os.path.exists(schema_snapshot.snapshot_path(url))
+
+
+def test_discover_from_snapshot_resamples_current_rows(cache_dir, url):
+    schema_snapshot.discover(SchemaDiscovery(), url)
+    conn = sqlite3.connect(url[len("sqlite:///"):])
+    conn.execute("UPDATE employees SET name = 'Bo'")
+    conn.commit()
+    conn.close()
+
+    schema = schema_snapshot.discover(SchemaDiscovery(), url)
+    assert schema["tables"]["employees"]["sample"] == [{"id": 1, "name": "Bo"}]
+    assert "stale" not in schema
+
+
+def test_discover_marks_snapshot_stale_when_database_is_unreachable(cache_dir, url):
+    schema_snapshot.discover(SchemaDiscovery(), url)
+
+    class Unreachable(SchemaDiscovery):
+        def refresh(self, connection_string, previous, changed_tables=()):
+            raise ConnectionError("connection refused")
+
+    schema = schema_snapshot.discover(Unreachable(), url)
+    assert schema["stale"] is True
+    assert schema["error"] == "connection refused"
+    assert list(schema["tables"]) == ["employees"]
@@ -0,0 +1,84 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+from services.query_engine import QueryEngine
+from services.semantic_cache import SemanticCache
+
+
+class _SameEmbeddingDocs:
+    """Every question embeds to the same vector, so only the cache key tells them apart."""
+
+    model_loaded = True
+    index_version = 0
+
+    def embed_query(self, query):
+        return np.ones(8, dtype="float32") / np.sqrt(8)
+
+    def search(self, query, **kwargs):
+        return []
+
+
+@pytest.fixture
+def qe(tmp_path):
+    db = tmp_path / "hr.sqlite"
+    conn = sqlite3.connect(db)
+    conn.executescript("""
+        CREATE TABLE employees (id INTEGER PRIMARY KEY, name TEXT, department TEXT, salary REAL);
+        INSERT INTO employees VALUES (1, 'Ann', 'Sales', 90000), (2, 'Bo', 'Marketing', 70000);
+    """)
+    conn.close()
+    engine = QueryEngine(f"sqlite:///{db}", doc_processor=_SameEmbeddingDocs())
+    yield engine
+    engine.shutdown()
+
+
+@pytest.mark.parametrize("asked, rephrased", [
+    ("list employees in department sales", "show employees in department sales"),
+    ("list employees in department sales", "list  employees in   department sales"),
+    ("average salary by department", "what is the average salary per department"),
+    ("employees with salary over 80k", "employees with salary over 80,000"),
+])
+def test_paraphrases_building_the_same_sql_share_a_key(qe, asked, rephrased):
+    assert qe._semantic_key(asked) == qe._semantic_key(rephrased)
+
+
+@pytest.mark.parametrize("asked, other", [
+    ("employees with salary over 80000", "employees with salary over 90000"),
+    ("list employees in department sales", "list employees in department marketing"),
+    ("list employees in department sales", "list employee names and salaries in department sales"),
+])
+def test_questions_with_different_sql_get_different_keys(qe, asked, other):
+    assert qe._semantic_key(asked) != qe._semantic_key(other)
+
+
+def test_rephrased_question_is_a_semantic_hit(qe):
+    first = qe.process_query("list employees in department sales")
+    assert not first["metrics"]["cache_hit"]
+
+    again = qe.process_query("show employees in department sales")
+    assert again["metrics"]["cache_hit"]
+    assert again["metrics"]["semantic_cache"]["matched_query"] == "list employees in department sales"
+    assert again["results"] == first["results"]
+
+    # as close in embedding space, but a different department binds a different parameter
+    other = qe.process_query("show employees in department marketing")
+    assert not other["metrics"]["cache_hit"]
+    assert other["results"] != first["results"]
+    assert qe.semantic_cache.stats()["semantic_hits"] == 1
+
+
+def test_hit_requires_same_key(qe):
+    cache = SemanticCache(threshold=0.9, ttl=60, max_entries=16)
+    emb = _SameEmbeddingDocs().embed_query("")
+    cache.store("list employees in department sales", emb, 1, {"query": "sales"},
+                key=qe._semantic_key("list employees in department sales"))
+
+    assert cache.lookup("list employees in department marketing", emb, 1,
+                        key=qe._semantic_key("list employees in department marketing")) is None
+    answer, similarity = cache.lookup("show employees in department sales", emb, 1,
+                                      key=qe._semantic_key("show employees in department sales"))
+    assert answer == {"query": "sales"} and similarity > 0.9
+    assert cache.lookup_exact("list employees in department sales", 1,
+                              key=qe._semantic_key("list employees in department marketing")) is None
@@ -0,0 +1,22 @@
+from fastapi.testclient import TestClient
+
+from api import ingestion
+from main import app
+
+
+def test_oversized_upload_gets_a_413_the_browser_can_read():
+    client = TestClient(app)
+    too_big = ingestion.MAX_UPLOAD_REQUEST_BYTES + ingestion.MULTIPART_OVERHEAD_BYTES + 1
+    response = client.post(
+        "/api/ingest/documents",
+        content=b"x",
+        headers={
+            "Origin": "http://localhost:3000",
+            "Content-Length": str(too_big),
+            "Content-Type": "multipart/form-data; boundary=b",
+        },
+    )
+    assert response.status_code == 413
+    # CORS wraps the size limit, so the frontend sees the message rather than a CORS failure
+    assert response.headers["access-control-allow-origin"] in ("*", "http://localhost:3000")
+    assert "exceeds" in response.text
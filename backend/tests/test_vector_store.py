@@ -0,0 +1,80 @@
+import threading
+import time
+
+import numpy as np
+
+from services import vector_index, vector_store
+from services.vector_store import SegmentedVectorStore
+
+DIM = 16
+
+
+def _vectors(n, seed=0):
+    x = np.random.default_rng(seed).standard_normal((n, DIM)).astype("float32")
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def _stored_ids(store):
+    ids = [store._base_members(store.manifest.get("base"))]
+    ids += [np.arange(info["min_id"], info["max_id"] + 1) for info in store.manifest["segments"]]
+    return set(np.concatenate(ids).tolist())
+
+
+def test_merge_keeps_segment_added_while_merging(tmp_path):
+    live = list(range(100))
+    store = SegmentedVectorStore(str(tmp_path), lambda: list(live))
+    store.add(np.arange(100, dtype="int64"), _vectors(100))
+    added = threading.Event()
+
+    def writer():
+        # the same order DocumentProcessor uses: segment first, chunk rows after
+        with store.write_lock():
+            store.add(np.arange(100, 110, dtype="int64"), _vectors(10, seed=1))
+            added.set()
+            time.sleep(0.2)
+            live.extend(range(100, 110))
+
+    t = threading.Thread(target=writer)
+    t.start()
+    added.wait()
+    store.merge()
+    t.join()
+
+    assert store.ntotal == 110
+    assert _stored_ids(store) == set(range(110))
+    assert store.manifest.get("deleted", 0) == 0
+
+
+def test_merge_counts_only_deletions_since_last_merge(tmp_path, monkeypatch):
+    for module in (vector_index, vector_store):
+        monkeypatch.setattr(module, "choose_index_type", lambda n: "hnsw")
+    builds = []
+    build_index = vector_store.build_index
+    monkeypatch.setattr(vector_store, "build_index", lambda *a, **kw: builds.append(a[0]) or build_index(*a, **kw))
+
+    live = list(range(200))
+    store = SegmentedVectorStore(str(tmp_path), lambda: list(live))
+    store.add(np.arange(200, dtype="int64"), _vectors(200))
+    store.merge()
+    assert builds == ["hnsw"]
+
+    # HNSW can't delete in place, so a merge with deletions rebuilds
+    del live[:50]
+    store.mark_deleted(50)
+    store.add(np.arange(200, 210, dtype="int64"), _vectors(10, seed=1))
+    live.extend(range(200, 210))
+    store.merge()
+    assert builds == ["hnsw", "hnsw"]
+    assert store.ntotal == 160
+
+    # the deletions are gone from the base now; a later merge just appends
+    store.add(np.arange(210, 220, dtype="int64"), _vectors(10, seed=2))
+    live.extend(range(210, 220))
+    store.merge()
+    assert builds == ["hnsw", "hnsw"]
+    assert store.ntotal == 170
+    assert _stored_ids(store) == set(live)
+
+    reopened = SegmentedVectorStore(str(tmp_path), lambda: list(live))
+    _, ids = reopened.search(_vectors(1, seed=3), 5)
+    assert set(ids[0].tolist()) <= set(live)